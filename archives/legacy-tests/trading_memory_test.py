@@ -4,13 +4,23 @@ AI 交易助手边界测试
 """
 
 import json
+import math
+import os
+import re
+import shutil
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
 from dataclasses import dataclass, asdict
 from datetime import datetime
-from typing import List, Optional, Dict
+from functools import lru_cache
+from heapq import merge
+from typing import List, Optional, Dict, Tuple
 
 # ==================== 数据模型 ====================
+# 记录不可变：修改一条记录要构造新对象并经 TradingMemory 的写入方法保存
+# （上下文缓存依赖这一点，见 ContextBuilder）
 
-@dataclass
+@dataclass(frozen=True)
 class Position:
     """持仓记录"""
     symbol: str
@@ -23,7 +33,7 @@ class Position:
     target_price: Optional[float] = None
     stop_loss: Optional[float] = None
 
-@dataclass
+@dataclass(frozen=True)
 class Trade:
     """交易记录"""
     symbol: str
@@ -37,7 +47,7 @@ class Trade:
     outcome: Optional[str] = None  # 'good' | 'bad' | 'neutral'
     lessons_learned: Optional[str] = None
 
-@dataclass
+@dataclass(frozen=True)
 class TradingLesson:
     """交易教训"""
     date: str
@@ -47,146 +57,592 @@ class TradingLesson:
     action_to_avoid: str  # 应该避免的行为
     recommended_action: str  # 推荐的行为
 
-@dataclass
+@dataclass(frozen=True)
 class UserProfile:
     """用户画像"""
     risk_tolerance: str   # 'low' | 'medium' | 'high'
     holding_period: str   # 'short' | 'medium' | 'long'
-    preferred_indicators: List[str]
-    avoid_patterns: List[str]
-    success_patterns: List[str]
+    preferred_indicators: Tuple[str, ...]
+    avoid_patterns: Tuple[str, ...]
+    success_patterns: Tuple[str, ...]
+    
+    def __post_init__(self):
+        # 从 JSON 读入的是列表，转成元组避免原地修改
+        for name in ('preferred_indicators', 'avoid_patterns', 'success_patterns'):
+            object.__setattr__(self, name, tuple(getattr(self, name)))
 
-# ==================== 记忆存储 ====================
+# ==================== 教训匹配 ====================
 
-class TradingMemory:
-    """交易记忆系统"""
+@dataclass(frozen=True)
+class Predicate:
+    """信号模式中的一个条件，如 RSI<30 → Predicate('rsi', '<', 30)"""
+    key: str
+    op: str               # '<' | '<=' | '>' | '>=' | '=='
+    value: object
+
+# 数值条件里的指标名 → signals 字段
+NUMERIC_KEYS = {
+    'RSI': 'rsi',
+    'J': 'kdj_j',
+    'K': 'kdj_k',
+    'D': 'kdj_d',
+    '量比': 'vol_ratio',
+    '换手率': 'turnover',
+    '涨跌幅': 'change_pct',
+    '得分': 'score',
+}
+
+# 文字条件 → 等价的结构化条件
+KEYWORD_PREDICATES = {
+    'MACD金叉': Predicate('macd_cross', '==', 'golden'),
+    'MACD死叉': Predicate('macd_cross', '==', 'dead'),
+    'KDJ金叉': Predicate('kdj_cross', '==', 'golden'),
+    'KDJ死叉': Predicate('kdj_cross', '==', 'dead'),
+    '超卖': Predicate('rsi', '<', 30),
+    '超买': Predicate('rsi', '>', 70),
+    '放量': Predicate('volume', '==', 'high'),
+    '缩量': Predicate('volume', '==', 'low'),
+    '高换手率': Predicate('turnover_level', '==', 'high'),
+    '主力净流入': Predicate('main_flow', '==', 'in'),
+    '主力净流出': Predicate('main_flow', '==', 'out'),
+}
+
+_NUMERIC_RE = re.compile(r'(?<![A-Za-z])(RSI|量比|换手率|涨跌幅|得分|J|K|D)\s*(<=|>=|<|>|=)\s*(-?\d+(?:\.\d+)?)')
+
+@lru_cache(maxsize=4096)
+def compile_pattern(pattern: str) -> Tuple[Predicate, ...]:
+    """
+    把信号模式解析为条件列表（同一模式只解析一次）
+    如 'RSI<30 + 放量阴线' → (rsi<30, volume=='high')，识别不了的部分（'阴线'）忽略；
+    匹配时要求全部条件同时满足
+    """
+    predicates = []
+    for token in re.split(r'[+＋,，;；&]', pattern or ''):
+        token = token.strip()
+        if not token:
+            continue
+        for name, op, value in _NUMERIC_RE.findall(token):
+            predicates.append(Predicate(NUMERIC_KEYS[name], '==' if op == '=' else op, float(value)))
+        for keyword, predicate in KEYWORD_PREDICATES.items():
+            if keyword in token:
+                predicates.append(predicate)
+    return tuple(dict.fromkeys(predicates))
+
+class LessonIndex:
+    """
+    教训索引
+    按股票（含通配 '*'）和条件建索引：等值条件用字典，数值条件按阈值排序后二分查找，
+    统计每条教训被满足的条件数，与它的条件总数相等才算匹配；
+    匹配一组当前信号的耗时与教训总数基本无关
+    """
     
     def __init__(self):
-        self.positions: List[Position] = []
-        self.trades: List[Trade] = []
-        self.lessons: List[TradingLesson] = []
-        self.profile: Optional[UserProfile] = None
+        self.symbols: List[str] = []
+        self.by_symbol: Dict[str, List[int]] = {}
+        self.by_value: Dict[Tuple[str, object], List[int]] = {}
+        self.thresholds: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+        self.unconditional: List[int] = []   # 没有信号模式的教训（总是相关）
+        self.required: List[int] = []        # 每条教训的条件数
+    
+    def __len__(self):
+        return len(self.symbols)
+    
+    def add(self, lesson: 'TradingLesson'):
+        i = len(self.symbols)
+        self.symbols.append(lesson.symbol)
+        self.by_symbol.setdefault(lesson.symbol, []).append(i)
+        predicates = compile_pattern(lesson.signal_pattern) if lesson.signal_pattern else ()
+        self.required.append(len(predicates))
+        if not lesson.signal_pattern:
+            self.unconditional.append(i)
+            return
+        for p in predicates:
+            if p.op == '==':
+                self.by_value.setdefault((p.key, p.value), []).append(i)
+            else:
+                insort(self.thresholds.setdefault((p.key, p.op), []), (p.value, i))
+    
+    def match(self, symbol: Optional[str] = None, signals: Optional[Dict] = None) -> List[int]:
+        """返回相关教训的下标（按添加顺序）"""
+        if not signals:
+            if not symbol:
+                return list(range(len(self)))
+            if symbol == '*':
+                return list(self.by_symbol.get('*', []))
+            return list(merge(self.by_symbol.get(symbol, []), self.by_symbol.get('*', [])))
         
+        satisfied = Counter()   # 教训下标 → 已满足的条件数
+        for key, value in signals.items():
+            try:
+                satisfied.update(self.by_value.get((key, value), ()))
+            except TypeError:
+                continue   # 不可哈希的信号值（如形态列表）不会等于任何条件值
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            # 满足 value < T 的是阈值大于 value 的一段，其余三种同理
+            for op in ('<', '<=', '>', '>='):
+                entries = self.thresholds.get((key, op))
+                if not entries:
+                    continue
+                if op == '<':
+                    matched = entries[bisect_right(entries, (value, len(self))):]
+                elif op == '<=':
+                    matched = entries[bisect_left(entries, (value, -1)):]
+                elif op == '>':
+                    matched = entries[:bisect_left(entries, (value, -1))]
+                else:
+                    matched = entries[:bisect_right(entries, (value, len(self)))]
+                satisfied.update(i for _, i in matched)
+        required = self.required
+        hits = set(self.unconditional)
+        hits.update(i for i, n in satisfied.items() if n == required[i])
+        if symbol:
+            symbols = self.symbols
+            return sorted(i for i in hits if symbols[i] == symbol or symbols[i] == '*')
+        return sorted(hits)
+
+# ==================== 记忆存储 ====================
+
+class TradingMemory:
+    """
+    交易记忆系统
+    传入 journal 时为日志式存储：各部分（持仓/交易/教训/画像）在首次访问时才加载，
+    每次变更只向日志追加一行
+    positions / trades / lessons 返回只读的元组，变更只能通过 add_* 或整体赋值，
+    这样每次变更都会记入日志并使上下文缓存失效
+    """
+    
+    def __init__(self, journal: Optional['MemoryJournal'] = None):
+        self._journal = journal
+        self._sections: Dict[str, object] = {} if journal else {
+            'positions': [], 'trades': [], 'lessons': [], 'profile': None}
+        self._lesson_index = LessonIndex()
+        self.version = 0    # 每次变更加 1，上下文缓存据此失效
+        self._context = ContextBuilder(self)
+    
+    @classmethod
+    def open(cls, filepath: Optional[str] = None) -> 'TradingMemory':
+        """
+        打开日志式存储（目录为 filepath 去掉扩展名后加 .journal，默认 MEMORY_PATH）
+        目录不存在而旧版 JSON 文件存在时自动迁移（旧文件保留不动）
+        """
+        filepath = filepath or MEMORY_PATH
+        directory = os.path.splitext(filepath)[0] + '.journal'
+        if not os.path.isdir(directory) and os.path.exists(filepath):
+            legacy = cls()
+            legacy.load(filepath)
+            # 先在临时目录写好快照再整体改名，迁移中途失败不会留下半个目录
+            tmp = directory + '.tmp'
+            shutil.rmtree(tmp, ignore_errors=True)
+            MemoryJournal(tmp).compact({name: legacy._raw(name) for name in SECTIONS})
+            os.replace(tmp, directory)
+            print(f"✅ 已迁移 {filepath} → {directory}")
+        return cls(MemoryJournal(directory))
+    
+    # ---------- 分区加载 ----------
+    
+    def _section(self, name: str):
+        if name not in self._sections:
+            raw = self._journal.load_section(name)
+            model = SECTION_MODELS[name]
+            if name == 'profile':
+                self._sections[name] = model(**raw) if raw else None
+            else:
+                self._sections[name] = [model(**item) for item in raw or []]
+        return self._sections[name]
+    
+    def _raw(self, name: str):
+        value = self._section(name)
+        if name == 'profile':
+            return asdict(value) if value else None
+        return [asdict(item) for item in value]
+    
+    def _replace(self, name: str, value):
+        self._sections[name] = value
+        if name == 'lessons':
+            self._lesson_index = LessonIndex()   # 下次匹配时重建
+        self._record(name, 'set', self._raw(name))
+    
+    def _record(self, section: str, op: str, data):
+        self.version += 1
+        if self._journal is None:
+            return
+        self._journal.append(section, op, data)
+        if self._journal.pending >= COMPACT_EVERY:
+            self.compact()
+    
+    positions = property(lambda self: tuple(self._section('positions')), lambda self, v: self._replace('positions', list(v)))
+    trades = property(lambda self: tuple(self._section('trades')), lambda self, v: self._replace('trades', list(v)))
+    lessons = property(lambda self: tuple(self._section('lessons')), lambda self, v: self._replace('lessons', list(v)))
+    profile = property(lambda self: self._section('profile'), lambda self, v: self._replace('profile', v))
+    
+    # ---------- 写入 ----------
+    
     def add_position(self, position: Position):
-        # 检查是否已存在
-        for i, p in enumerate(self.positions):
-            if p.symbol == position.symbol:
-                self.positions[i] = position
-                return
-        self.positions.append(position)
+        if 'positions' in self._sections:
+            # 检查是否已存在
+            positions = self._sections['positions']
+            for i, p in enumerate(positions):
+                if p.symbol == position.symbol:
+                    positions[i] = position
+                    break
+            else:
+                positions.append(position)
+        self._record('positions', 'upsert', asdict(position))
         
     def add_trade(self, trade: Trade):
-        self.trades.append(trade)
+        if 'trades' in self._sections:
+            self._sections['trades'].append(trade)
+        self._record('trades', 'append', asdict(trade))
         
     def add_lesson(self, lesson: TradingLesson):
-        self.lessons.append(lesson)
+        if 'lessons' in self._sections:
+            self._sections['lessons'].append(lesson)
+            self._lesson_index.add(lesson)
+        self._record('lessons', 'append', asdict(lesson))
+    
+    def _reindex_lessons(self):
+        self._lesson_index = LessonIndex()
+        for lesson in self._section('lessons'):
+            self._lesson_index.add(lesson)
+    
+    def compact(self):
+        """把日志合并进快照（日志累计 COMPACT_EVERY 条时自动进行）"""
+        if self._journal is not None:
+            self._journal.compact({name: self._raw(name) for name in SECTIONS})
+    
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
         
     def get_position(self, symbol: str) -> Optional[Position]:
-        for p in self.positions:
+        for p in self._section('positions'):
             if p.symbol == symbol:
                 return p
         return None
     
     def get_trades_for_symbol(self, symbol: str) -> List[Trade]:
-        return [t for t in self.trades if t.symbol == symbol]
+        return [t for t in self._section('trades') if t.symbol == symbol]
     
     def get_relevant_lessons(self, symbol: str = None, signals: Dict = None) -> List[TradingLesson]:
-        """获取相关的交易教训"""
-        relevant = []
-        for lesson in self.lessons:
-            # 按股票筛选
-            if symbol and lesson.symbol != symbol and lesson.symbol != '*':
-                continue
-            # 按信号模式匹配
-            if signals and lesson.signal_pattern:
-                # 简单的模式匹配
-                if 'RSI<30' in lesson.signal_pattern and signals.get('rsi', 50) < 30:
-                    relevant.append(lesson)
-                elif 'MACD金叉' in lesson.signal_pattern and signals.get('macd_cross') == 'golden':
-                    relevant.append(lesson)
-            else:
-                relevant.append(lesson)
-        return relevant
+        """
+        获取相关的交易教训
+        按股票（含通用教训 '*'）筛选；给出 signals 时，信号模式中的条件全部满足才视为相关
+        （'RSI<30 + 放量阴线' 需要 rsi<30 且 volume=='high'）
+        """
+        lessons = self._section('lessons')
+        if len(self._lesson_index) != len(lessons):
+            self._reindex_lessons()   # lessons 被直接替换过
+        return [lessons[i] for i in self._lesson_index.match(symbol, signals)]
     
-    def to_context(self, symbol: str = None, signals: Dict = None) -> str:
-        """生成 System Prompt 上下文"""
-        context = []
-        
-        # 当前持仓
-        if self.positions:
-            context.append("## 当前持仓")
-            for p in self.positions:
-                if symbol is None or p.symbol == symbol:
-                    context.append(f"- {p.name}({p.symbol}): 成本{p.cost}元, {p.shares}股")
-                    if p.buy_reason:
-                        context.append(f"  买入理由: {p.buy_reason}")
-                    if p.target_price:
-                        context.append(f"  目标价: {p.target_price}元")
-                    if p.stop_loss:
-                        context.append(f"  止损价: {p.stop_loss}元")
-                    context.append(f"  类型: {p.stock_type}")
-        
-        # 历史交易
-        relevant_trades = self.get_trades_for_symbol(symbol) if symbol else self.trades[-10:]
-        if relevant_trades:
-            context.append("\n## 该股票历史交易")
-            for t in relevant_trades[-5:]:  # 最近5笔
-                outcome_emoji = "✅" if t.outcome == 'good' else "❌" if t.outcome == 'bad' else "➖"
-                context.append(f"- {t.date}: {t.action.upper()} {t.price}元 {t.shares}股 {outcome_emoji}")
-                if t.lessons_learned:
-                    context.append(f"  教训: {t.lessons_learned}")
-        
-        # 相关教训
-        relevant_lessons = self.get_relevant_lessons(symbol, signals)
-        if relevant_lessons:
-            context.append("\n## 历史经验教训 ⚠️")
-            for lesson in relevant_lessons[-5:]:
-                context.append(f"- [{lesson.date}] {lesson.lesson}")
-                context.append(f"  触发信号: {lesson.signal_pattern}")
-                context.append(f"  避免: {lesson.action_to_avoid}")
-                context.append(f"  推荐: {lesson.recommended_action}")
-        
-        # 用户偏好
-        if self.profile:
-            context.append("\n## 用户偏好")
-            context.append(f"- 风险偏好: {self.profile.risk_tolerance}")
-            context.append(f"- 持仓周期: {self.profile.holding_period}")
-            if self.profile.avoid_patterns:
-                context.append(f"- 避免模式: {', '.join(self.profile.avoid_patterns)}")
-            if self.profile.success_patterns:
-                context.append(f"- 成功模式: {', '.join(self.profile.success_patterns)}")
-        
-        return '\n'.join(context)
+    def to_context(self, symbol: str = None, signals: Dict = None,
+                   max_tokens: int = None) -> str:
+        """生成 System Prompt 上下文（按 token 预算取舍，结果缓存到记忆变更为止）"""
+        return self._context.build(symbol, signals, max_tokens or CONTEXT_TOKEN_BUDGET)
     
     def save(self, filepath: str):
-        """保存记忆到文件"""
+        """导出为单个 JSON 文件（日志式存储不需要调用，用 compact 合并日志）"""
         data = {
             'positions': [asdict(p) for p in self.positions],
             'trades': [asdict(t) for t in self.trades],
             'lessons': [asdict(l) for l in self.lessons],
             'profile': asdict(self.profile) if self.profile else None
         }
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _atomic_write_json(filepath, data, indent=2)
     
     def load(self, filepath: str):
-        """从文件加载记忆"""
+        """
+        从单个 JSON 文件加载记忆（整体替换现有内容）
+        日志式存储直接合并成新快照，不向日志逐部分追加完整内容
+        """
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-            self.positions = [Position(**p) for p in data.get('positions', [])]
-            self.trades = [Trade(**t) for t in data.get('trades', [])]
-            self.lessons = [TradingLesson(**l) for l in data.get('lessons', [])]
-            if data.get('profile'):
-                self.profile = UserProfile(**data['profile'])
         except FileNotFoundError:
-            pass
+            return
+        self._sections = {
+            'positions': [Position(**p) for p in data.get('positions', [])],
+            'trades': [Trade(**t) for t in data.get('trades', [])],
+            'lessons': [TradingLesson(**l) for l in data.get('lessons', [])],
+            'profile': UserProfile(**data['profile']) if data.get('profile') else None,
+        }
+        self._lesson_index = LessonIndex()
+        self.version += 1
+        self.compact()
+
+# ==================== 上下文构建 ====================
+
+CONTEXT_TOKEN_BUDGET = 1500   # 用户上下文的默认 token 上限
+CONTEXT_MAX_ITEMS = 5         # 每类（交易、教训）最多展示几条
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文字符和全角标点约 1 个 token，其余约 4 个字符 1 个 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def _position_text(p: 'Position') -> str:
+    lines = [f"- {p.name}({p.symbol}): 成本{p.cost}元, {p.shares}股"]
+    if p.buy_reason:
+        lines.append(f"  买入理由: {p.buy_reason}")
+    if p.target_price:
+        lines.append(f"  目标价: {p.target_price}元")
+    if p.stop_loss:
+        lines.append(f"  止损价: {p.stop_loss}元")
+    lines.append(f"  类型: {p.stock_type}")
+    return '\n'.join(lines)
+
+def _trade_text(t: 'Trade') -> str:
+    outcome_emoji = "✅" if t.outcome == 'good' else "❌" if t.outcome == 'bad' else "➖"
+    text = f"- {t.date}: {t.action.upper()} {t.price}元 {t.shares}股 {outcome_emoji}"
+    if t.lessons_learned:
+        text += f"\n  教训: {t.lessons_learned}"
+    return text
+
+def _lesson_text(lesson: 'TradingLesson') -> str:
+    return '\n'.join([
+        f"- [{lesson.date}] {lesson.lesson}",
+        f"  触发信号: {lesson.signal_pattern}",
+        f"  避免: {lesson.action_to_avoid}",
+        f"  推荐: {lesson.recommended_action}",
+    ])
+
+def _profile_text(profile: 'UserProfile') -> str:
+    lines = [f"- 风险偏好: {profile.risk_tolerance}", f"- 持仓周期: {profile.holding_period}"]
+    if profile.avoid_patterns:
+        lines.append(f"- 避免模式: {', '.join(profile.avoid_patterns)}")
+    if profile.success_patterns:
+        lines.append(f"- 成功模式: {', '.join(profile.success_patterns)}")
+    return '\n'.join(lines)
+
+# 各部分：标题、片段渲染函数、基础优先级（持仓 > 用户偏好 > 教训 > 交易）
+_CONTEXT_SECTIONS = {
+    'positions': ("## 当前持仓", _position_text, 100.0),
+    'trades': ("## 该股票历史交易", _trade_text, 10.0),
+    'lessons': ("## 历史经验教训 ⚠️", _lesson_text, 20.0),
+    'profile': ("## 用户偏好", _profile_text, 50.0),
+}
+
+class ContextBuilder:
+    """
+    用户上下文构建器
+    每条持仓/交易/教训渲染成的文字片段按对象缓存（记录是不可变的 dataclass、对外只给只读元组，
+    所以新对象自然得到新片段）；按相关性和新近程度打分，在 token 预算内从高到低挑选，
+    再按原有顺序拼装。拼装结果按 (股票, 信号, 预算) 缓存，记忆变更后失效
+    """
+    
+    MAX_CACHED_CONTEXTS = 256
+    
+    def __init__(self, memory: 'TradingMemory'):
+        self.memory = memory
+        self._fragments: Dict[int, Tuple[object, str, int]] = {}   # id(对象) → (对象, 文字, token 数)
+        self._contexts: Dict[tuple, str] = {}
+        self._version = -1
+    
+    def _fragment(self, obj) -> Tuple[str, int]:
+        entry = self._fragments.get(id(obj))
+        if entry is None or entry[0] is not obj:
+            text = _CONTEXT_SECTIONS[SECTION_OF[type(obj)]][1](obj)
+            entry = self._fragments[id(obj)] = (obj, text, estimate_tokens(text))
+        return entry[1], entry[2]
+    
+    def _invalidate(self):
+        """记忆变更：清掉拼装结果，片段只丢弃已不在记忆中的对象"""
+        self._contexts.clear()
+        self._version = self.memory.version
+        live = len(self.memory.positions) + len(self.memory.trades) + len(self.memory.lessons) + 1
+        if len(self._fragments) > 2 * live:
+            alive = {id(o) for o in self.memory.positions + self.memory.trades + self.memory.lessons}
+            alive.add(id(self.memory.profile))
+            self._fragments = {k: v for k, v in self._fragments.items() if k in alive}
+    
+    def _candidates(self, symbol: Optional[str], signals: Optional[Dict]) -> List[Tuple[float, str, int, object]]:
+        """(得分, 部分, 原始顺序, 对象)；同类中越新得分越高，针对该股票的比通用的高"""
+        memory = self.memory
+        candidates = []
+        for i, p in enumerate(memory.positions):
+            if symbol is None or p.symbol == symbol:
+                candidates.append((_CONTEXT_SECTIONS['positions'][2], 'positions', i, p))
+        
+        trades = memory.get_trades_for_symbol(symbol) if symbol else memory.trades[-10:]
+        trades = trades[-CONTEXT_MAX_ITEMS:]
+        for age, t in enumerate(reversed(trades)):
+            score = _CONTEXT_SECTIONS['trades'][2] + (2 if t.lessons_learned else 0) + 1 / (1 + age)
+            candidates.append((score, 'trades', len(trades) - 1 - age, t))
+        
+        lessons = memory.get_relevant_lessons(symbol, signals)[-CONTEXT_MAX_ITEMS:]
+        for age, lesson in enumerate(reversed(lessons)):
+            score = _CONTEXT_SECTIONS['lessons'][2] + (2 if symbol and lesson.symbol == symbol else 0) + 1 / (1 + age)
+            candidates.append((score, 'lessons', len(lessons) - 1 - age, lesson))
+        
+        if memory.profile:
+            candidates.append((_CONTEXT_SECTIONS['profile'][2], 'profile', 0, memory.profile))
+        return candidates
+    
+    def build(self, symbol: str = None, signals: Dict = None, max_tokens: int = CONTEXT_TOKEN_BUDGET) -> str:
+        if self._version != self.memory.version:
+            self._invalidate()
+        try:
+            key = (symbol, tuple(sorted((signals or {}).items())), max_tokens)
+            hash(key)
+        except TypeError:
+            key = None   # 信号里有不可哈希的值，不缓存
+        if key is not None and key in self._contexts:
+            return self._contexts[key]
+        
+        # 按得分从高到低放入预算（某部分的第一条要连同标题一起算）
+        chosen: Dict[str, List[Tuple[int, str]]] = {}
+        used = 0
+        for score, section, order, obj in sorted(self._candidates(symbol, signals), key=lambda c: -c[0]):
+            text, tokens = self._fragment(obj)
+            if section not in chosen:
+                tokens += estimate_tokens(_CONTEXT_SECTIONS[section][0]) + 1
+            if used + tokens > max_tokens:
+                continue
+            used += tokens
+            chosen.setdefault(section, []).append((order, text))
+        
+        parts = []
+        for section, (title, _, _) in _CONTEXT_SECTIONS.items():
+            if section in chosen:
+                parts.append('\n'.join([title] + [text for _, text in sorted(chosen[section])]))
+        context = '\n\n'.join(parts)
+        
+        if key is not None:
+            if len(self._contexts) >= self.MAX_CACHED_CONTEXTS:
+                self._contexts.clear()
+            self._contexts[key] = context
+        return context
+
+# ==================== 持久化 ====================
+
+SECTIONS = ('positions', 'trades', 'lessons', 'profile')
+SECTION_MODELS = {'positions': Position, 'trades': Trade, 'lessons': TradingLesson, 'profile': UserProfile}
+SECTION_OF = {model: name for name, model in SECTION_MODELS.items()}
+COMPACT_EVERY = 500   # 日志累计多少条后合并进快照
+# 默认记忆文件（按本文件位置定位，不受当前工作目录影响）
+MEMORY_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'server', 'ai', 'trading_memory.json'))
+
+def _atomic_write_json(path: str, data, indent: Optional[int] = None):
+    """先写临时文件再原子替换，写到一半崩溃也不会损坏原文件"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class MemoryJournal:
+    """
+    追加写日志 + 分区快照
+    目录下每个部分一个快照文件（positions.json 等），变更追加到 journal.jsonl；
+    快照记录它已包含的最后一条日志序号，合并途中崩溃、重放时不会重复
+    """
+    
+    def __init__(self, directory: str, fsync: bool = True):
+        self.directory = directory
+        self.journal_path = os.path.join(directory, 'journal.jsonl')
+        self.fsync = fsync
+        self.pending = 0      # 上次合并以来的日志条数
+        self._seq: Optional[int] = None
+        self._file = None
+    
+    def _snapshot_path(self, section: str) -> str:
+        return os.path.join(self.directory, f'{section}.json')
+    
+    def _lines(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                yield from f
+        except FileNotFoundError:
+            return
+    
+    def load_section(self, section: str):
+        """读快照并重放日志中属于该部分、序号更大的记录"""
+        try:
+            with open(self._snapshot_path(section), 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            seq, data = snapshot['seq'], snapshot['data']
+        except FileNotFoundError:
+            seq, data = 0, None
+        if data is None and section != 'profile':
+            data = []
+        
+        tag = f'"section": "{section}"'
+        for line in self._lines():
+            if tag not in line:
+                continue   # 其他部分的记录不解析
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break      # 崩溃时最后一行可能只写了一半
+            if record['seq'] <= seq:
+                continue
+            if record['op'] == 'set':
+                data = record['data']
+            elif record['op'] == 'append':
+                data.append(record['data'])
+            elif record['op'] == 'upsert':
+                data = [d for d in data if d['symbol'] != record['data']['symbol']] + [record['data']]
+        return data
+    
+    def _open(self):
+        """打开日志准备追加：截掉末尾不完整的行，恢复序号"""
+        os.makedirs(self.directory, exist_ok=True)
+        seq, pending = 0, 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb+') as f:
+                content = f.read()
+                if content and not content.endswith(b'\n'):
+                    f.truncate(content.rfind(b'\n') + 1)
+            for line in content.splitlines(keepends=True):
+                if line.endswith(b'\n'):
+                    record = json.loads(line)
+                    seq = record['seq']
+                    pending += record.get('op') != 'compact'
+        self._seq, self.pending = seq, pending
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+    
+    def append(self, section: str, op: str, data):
+        """追加一条记录（op: append / upsert / set）"""
+        if self._file is None:
+            self._open()
+        self._seq += 1
+        record = {'seq': self._seq, 'section': section, 'op': op, 'data': data}
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.pending += 1
+    
+    def compact(self, sections: Dict[str, object]):
+        """把各部分的完整状态写成快照，日志替换为一行合并标记"""
+        if self._file is None:
+            self._open()
+        for name, data in sections.items():
+            _atomic_write_json(self._snapshot_path(name), {'seq': self._seq, 'data': data})
+        self._file.close()
+        tmp = self.journal_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'seq': self._seq, 'op': 'compact'}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_path)
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        self.pending = 0
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
 # ==================== 测试用例 ====================
 
-def create_test_memory() -> TradingMemory:
-    """创建测试数据"""
-    memory = TradingMemory()
+def create_test_memory(memory: Optional[TradingMemory] = None) -> TradingMemory:
+    """创建测试数据（传入 memory 时写入其中，否则用一个不落盘的内存记忆）"""
+    memory = memory if memory is not None else TradingMemory()
     
     # 用户画像
     memory.profile = UserProfile(
@@ -258,9 +714,7 @@ def create_test_memory() -> TradingMemory:
     
     return memory
 
-def generate_system_prompt(memory: TradingMemory, current_symbol: str = None, current_signals: Dict = None) -> str:
-    """生成完整的系统提示词"""
-    base_prompt = """你是一个专业的A股交易助手。你的任务是帮助用户分析股票和做出交易决策。
+BASE_PROMPT = """你是一个专业的A股交易助手。你的任务是帮助用户分析股票和做出交易决策。
 
 ## 你的工作流程
 
@@ -299,9 +753,14 @@ def generate_system_prompt(memory: TradingMemory, current_symbol: str = None, cu
 - 风险提示
 
 """
+
+def generate_system_prompt(memory: TradingMemory, current_symbol: str = None, current_signals: Dict = None,
+                           max_tokens: int = None) -> str:
+    """生成完整的系统提示词（max_tokens 为用户上下文部分的 token 预算）"""
+    base_prompt = BASE_PROMPT
     
     # 添加用户特定的上下文
-    user_context = memory.to_context(current_symbol, current_signals)
+    user_context = memory.to_context(current_symbol, current_signals, max_tokens)
     if user_context:
         base_prompt += f"\n## 用户上下文\n\n{user_context}\n"
     
@@ -310,15 +769,18 @@ def generate_system_prompt(memory: TradingMemory, current_symbol: str = None, cu
 # ==================== 主程序 ====================
 
 if __name__ == '__main__':
-    # 创建测试记忆
-    memory = create_test_memory()
+    # 打开记忆（首次运行从 trading_memory.json 迁移；什么都没有时写入测试数据）
+    memory = TradingMemory.open()
+    if not memory.lessons and not memory.trades:
+        create_test_memory(memory)
     
     # 模拟当前信号（假设当前RSI=28，接近超卖区）
     current_signals = {
         'rsi': 28,
         'macd': 'bearish',
         'macd_cross': None,
-        'volume': 'high'
+        'volume': 'high',
+        'patterns': ['放量阴线']   # 列表值的信号（不参与条件匹配，也不能让匹配出错）
     }
     
     # 生成系统提示词
@@ -334,12 +796,13 @@ if __name__ == '__main__':
     print(system_prompt)
     print("=" * 80)
     
-    # 保存记忆到文件
-    memory.save('trading_memory.json')
-    print("\n记忆已保存到 trading_memory.json")
+    # 变更已逐条写入日志，这里合并成快照
+    memory.compact()
+    print(f"\n记忆已保存到 {os.path.splitext(MEMORY_PATH)[0]}.journal")
     
     # 打印上下文（这是会注入到每次对话的内容）
     print("\n" + "=" * 80)
     print("用户上下文（每次对话都会注入）:")
     print("=" * 80)
     print(memory.to_context('300433', current_signals))
+    memory.close()
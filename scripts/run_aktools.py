@@ -1,15 +1,303 @@
 #!/usr/bin/env python3
 """
 直接启动 AKTools HTTP 服务（绕过 CLI 中的浏览器打开问题）
+
+用法:
+    python run_aktools.py 8098                  # 开发模式：单进程，行为与 aktools 默认一致
+    python run_aktools.py 8098 --prod           # 生产模式：多进程 + uvloop/httptools + 响应缓存 + gzip
+    python run_aktools.py 8098 --prod --workers 4 --cache-mb 512
+
+生产模式的响应缓存按接口名和参数做键，TTL 随交易时段变化：
+已收盘日期的不复权/后复权历史K线视为不可变，实时行情只缓存几秒，其余接口收盘后缓存到下一个交易时段（最多 1 小时）；
+同一请求并发到达时只向上游抓取一次。缓存在每个 worker 进程内各自维护
 """
-import sys
+import argparse
+import asyncio
+import gzip
+import importlib.util
+import json
 import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from datetime import time as dtime
+from urllib.parse import parse_qsl, urlencode
+from zoneinfo import ZoneInfo
 
 import uvicorn
-from aktools.main import app
+
+MARKET_TZ = ZoneInfo("Asia/Shanghai")
+# 交易时段（含 9:15 开始的集合竞价）
+TRADING_SESSIONS = ((dtime(9, 15), dtime(11, 30)), (dtime(13, 0), dtime(15, 0)))
+
+SPOT_TTL = 3                  # 实时行情（秒）
+INTRADAY_TTL = 30             # 盘中仍在变化的历史/资金流接口
+DEFAULT_TTL = 600             # 盘中其他接口（个股信息等）
+CLOSED_MAX_TTL = 3600         # 非交易时段的上限（盘后公布的龙虎榜、资金流需要能及时刷新）
+IMMUTABLE_TTL = 7 * 86400     # 已收盘日期的历史K线
+
+# 接口名包含这些片段的视为实时数据
+SPOT_MARKERS = ("spot", "bid_ask", "rank", "zt_pool", "changes_em")
+# 接口名包含这些片段的视为按日期区间查询的历史数据
+HISTORY_MARKERS = ("hist", "daily", "fund_flow", "lhb")
+# 前复权数据会在除权除息后整体改写，不能视为不可变
+MUTABLE_ADJUST = ("qfq", "qfq-factor", "hfq-factor")
+
+CACHE_PREFIX = "/api/public/"
+DEFAULT_CACHE_MB = 256
+
+
+# ==================== 缓存策略 ====================
+
+def is_trading_time(now: datetime) -> bool:
+    if now.weekday() >= 5:
+        return False
+    t = now.time()
+    return any(start <= t < end for start, end in TRADING_SESSIONS)
+
+
+def seconds_to_next_session(now: datetime) -> float:
+    """到下一个交易时段开始的秒数（只按工作日估算，节假日由 CLOSED_MAX_TTL 兜底）"""
+    day = now.date()
+    for _ in range(8):
+        if day.weekday() < 5:
+            for start, _end in TRADING_SESSIONS:
+                at = datetime.combine(day, start, tzinfo=MARKET_TZ)
+                if at > now:
+                    return (at - now).total_seconds()
+        day += timedelta(days=1)
+    return CLOSED_MAX_TTL
+
+
+def ttl_for(endpoint: str, params: dict, now: datetime = None) -> float:
+    """某个接口 + 参数的缓存秒数（0 表示不缓存）"""
+    now = now or datetime.now(MARKET_TZ)
+    trading = is_trading_time(now)
+
+    if any(m in endpoint for m in SPOT_MARKERS):
+        return SPOT_TTL if trading else min(seconds_to_next_session(now), CLOSED_MAX_TTL)
+
+    if any(m in endpoint for m in HISTORY_MARKERS):
+        end = str(params.get("end_date", "")).replace("-", "")[:8]
+        today = now.strftime("%Y%m%d")
+        if end.isdigit() and len(end) == 8 and end < today and params.get("adjust", "") not in MUTABLE_ADJUST:
+            return IMMUTABLE_TTL
+        if trading:
+            return INTRADAY_TTL
+
+    if trading:
+        return DEFAULT_TTL
+    return min(seconds_to_next_session(now), CLOSED_MAX_TTL)
+
+
+# ==================== 响应缓存中间件 ====================
+
+class _Entry:
+    __slots__ = ("expires", "body", "gzipped", "content_type", "size")
+
+    def __init__(self, expires: float, body: bytes, gzipped: bytes, content_type: bytes):
+        self.expires = expires
+        self.body = body
+        self.gzipped = gzipped
+        self.content_type = content_type
+        self.size = len(body) + len(gzipped)
+
+
+class ResponseCache:
+    """
+    ASGI 响应缓存（只缓存 /api/public/* 的 GET 200 响应）
+    同时保存原文和 gzip 压缩后的字节，命中时既不用重新抓取、序列化，也不用重新压缩；
+    相同的请求并发未命中时只有第一个转发给上游，其余等待它的结果
+    """
+
+    def __init__(self, app, max_bytes: int = DEFAULT_CACHE_MB * 1024 * 1024, policy=ttl_for):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        if path == "/cache/stats":
+            return await self._send(send, 200, json.dumps(self.stats()).encode(), b"application/json", "BYPASS", 0)
+        if scope["method"] != "GET" or not path.startswith(CACHE_PREFIX):
+            return await self.app(scope, receive, send)
+
+        params = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+        key = f"{path}?{urlencode(sorted(params.items()))}"
+        accepts_gzip = any(name == b"accept-encoding" and b"gzip" in value for name, value in scope["headers"])
+
+        entry = self._lookup(key)
+        if entry is None and key in self._inflight:
+            await asyncio.shield(self._inflight[key])
+            entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return await self._send_entry(send, entry, accepts_gzip, "HIT")
+
+        self.misses += 1
+        done = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            status, headers, body = await self._forward(scope, receive)
+            ttl = self.policy(path[len(CACHE_PREFIX):], params) if status == 200 else 0
+            if ttl <= 0 or not body:
+                return await self._send_raw(send, status, headers, body)
+            gzipped = await asyncio.to_thread(gzip.compress, body, 6)
+            content_type = dict(headers).get(b"content-type", b"application/json")
+            entry = _Entry(time.monotonic() + ttl, body, gzipped, content_type)
+            self._store(key, entry)
+            await self._send_entry(send, entry, accepts_gzip, "MISS")
+        finally:
+            self._inflight.pop(key, None)
+            done.set_result(None)
+
+    # ---------- 存取 ----------
+
+    def _lookup(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, entry: _Entry):
+        if entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        self._bytes -= self._entries.pop(key).size
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "pid": os.getpid(),
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+    # ---------- 收发 ----------
+
+    async def _forward(self, scope, receive):
+        """调用下游应用并收集完整响应"""
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        return response["status"], response["headers"], b"".join(response["body"])
+
+    async def _send_raw(self, send, status: int, headers: list, body: bytes):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_entry(self, send, entry: _Entry, accepts_gzip: bool, state: str):
+        ttl = max(0, int(entry.expires - time.monotonic()))
+        if accepts_gzip:
+            await self._send(send, 200, entry.gzipped, entry.content_type, state, ttl, b"gzip")
+        else:
+            await self._send(send, 200, entry.body, entry.content_type, state, ttl)
+
+    async def _send(self, send, status: int, body: bytes, content_type: bytes, state: str, ttl: int,
+                    encoding: bytes = None):
+        headers = [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode()),
+            (b"cache-control", f"max-age={ttl}".encode()),
+            (b"vary", b"Accept-Encoding"),
+            (b"x-cache", state.encode()),
+        ]
+        if encoding:
+            headers.append((b"content-encoding", encoding))
+        await self._send_raw(send, status, headers, body)
+
+
+# ==================== 应用 ====================
+
+def _use_fast_json():
+    """aktools 的接口用 JSONResponse 返回；装了 orjson 时换成 orjson 序列化"""
+    if importlib.util.find_spec("orjson") is None:
+        return
+    import orjson
+    from fastapi.responses import JSONResponse
+    from aktools.core import api
+
+    class FastJSONResponse(JSONResponse):
+        def render(self, content) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    api.JSONResponse = FastJSONResponse
+
+
+def create_app():
+    """生产模式的应用（每个 worker 进程各调用一次）"""
+    from aktools.main import app
+    from starlette.middleware.gzip import GZipMiddleware
+
+    _use_fast_json()
+    wrapped = app
+    if os.environ.get("AKTOOLS_CACHE", "1") != "0":
+        wrapped = ResponseCache(wrapped, int(os.environ.get("AKTOOLS_CACHE_MB", DEFAULT_CACHE_MB)) * 1024 * 1024)
+    # 缓存命中的响应已带 content-encoding，GZip 中间件会直接放行，只压缩未缓存的响应
+    return GZipMiddleware(wrapped, minimum_size=1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动 AKTools HTTP API")
+    parser.add_argument("port", nargs="?", type=int, default=8098)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--prod", action="store_true", help="生产模式：多进程、uvloop/httptools、响应缓存、gzip")
+    parser.add_argument("--workers", type=int, default=None, help="worker 进程数（生产模式默认 CPU 核数）")
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_MB, help="每个 worker 的缓存上限（MB）")
+    parser.add_argument("--no-cache", action="store_true", help="生产模式下关闭响应缓存")
+    args = parser.parse_args()
+
+    print(f"启动 AKTools HTTP API 在端口 {args.port}")
+    print(f"访问: http://{args.host}:{args.port}/docs")
+
+    if not args.prod:
+        from aktools.main import app
+        uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+        return
+
+    workers = args.workers or os.cpu_count() or 1
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    if loop != "uvloop" or http != "httptools":
+        print("   提示: pip install uvloop httptools 可进一步提升吞吐")
+    os.environ["AKTOOLS_CACHE"] = "0" if args.no_cache else "1"
+    os.environ["AKTOOLS_CACHE_MB"] = str(args.cache_mb)
+    print(f"   生产模式: {workers} 个 worker, loop={loop}, http={http}, "
+          f"缓存={'关闭' if args.no_cache else f'{args.cache_mb}MB/worker'}（统计: /cache/stats）")
+
+    # 多进程需要以导入字符串的方式加载应用
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    uvicorn.run("run_aktools:create_app", factory=True, host=args.host, port=args.port,
+                workers=workers, loop=loop, http=http, log_level="warning", access_log=False)
+
 
 if __name__ == "__main__":
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8098
-    print(f"启动 AKTools HTTP API 在端口 {port}")
-    print(f"访问: http://127.0.0.1:{port}/docs")
-    uvicorn.run(app, host="127.0.0.1", port=port, log_level="info")
+    main()
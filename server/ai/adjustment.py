@@ -0,0 +1,111 @@
+"""
+复权因子
+本地只存不复权K线 + 每只股票一张很小的后复权因子表，前/后复权视图按需用 numpy 向量化相乘得到；
+除权除息只需刷新因子表，不用重新下载整段复权历史，也可以按任意历史日期做“当时视角”的前复权
+"""
+
+from bisect import bisect_right
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from kline_clean import to_number
+
+ADJUST_MODES = ("qfq", "hfq", "none")
+_PRICE_FIELDS = ("open", "high", "low", "close")
+
+
+def sina_symbol(symbol: str) -> str:
+    """6 位代码转新浪格式（sh600519 / sz000001 / bj430047）"""
+    if symbol[:2] in ("sh", "sz", "bj"):
+        return symbol
+    if symbol.startswith(("6", "9")):
+        return f"sh{symbol}"
+    if symbol.startswith(("4", "8")):
+        return f"bj{symbol}"
+    return f"sz{symbol}"
+
+
+class AdjustmentTable:
+    """
+    后复权因子表（按除权日升序的阶梯函数：因子从除权日起生效）
+    hfq = 原始价 × factor(日期)；qfq = hfq / factor(基准日)
+    """
+
+    def __init__(self, entries: List[Tuple[str, float]]):
+        entries = sorted(entries)
+        self.dates = [d for d, _ in entries]
+        self.factors = np.array([f for _, f in entries], dtype=float)
+        self._dates64 = np.array(self.dates, dtype="datetime64[D]")
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __eq__(self, other):
+        return (isinstance(other, AdjustmentTable) and self.dates == other.dates
+                and np.array_equal(self.factors, other.factors))
+
+    def factor_at(self, date_str: str) -> float:
+        """某一天生效的因子（早于第一条记录时取第一条）"""
+        if not self.dates:
+            return 1.0
+        return float(self.factors[max(0, bisect_right(self.dates, date_str) - 1)])
+
+    def factors_for(self, dates) -> np.ndarray:
+        """一组日期各自生效的因子（向量化）"""
+        if not self.dates:
+            return np.ones(len(dates))
+        pos = np.searchsorted(self._dates64, np.asarray(dates, dtype="datetime64[D]"), side="right") - 1
+        return self.factors[np.maximum(pos, 0)]
+
+    def ex_dates(self) -> List[str]:
+        """除权除息日（因子发生变化的日期）"""
+        changed = np.nonzero(np.diff(self.factors) != 0)[0] + 1
+        return [self.dates[i] for i in changed]
+
+    def to_list(self) -> List[Tuple[str, float]]:
+        return list(zip(self.dates, self.factors.tolist()))
+
+
+def parse_factor_rows(rows: List[Dict]) -> Optional[AdjustmentTable]:
+    """解析 stock_zh_a_daily(adjust='hfq-factor') 的返回"""
+    entries = []
+    for row in rows or []:
+        date_str = str(row.get("date", "")).split("T")[0].split(" ")[0]
+        factor = to_number(row.get("hfq_factor"))
+        if date_str and factor > 0:
+            entries.append((date_str, factor))
+    return AdjustmentTable(entries) if entries else None
+
+
+def adjust_klines(klines: List[Dict], table: Optional[AdjustmentTable], mode: str = "qfq",
+                  as_of: Optional[str] = None) -> List[Dict]:
+    """
+    由不复权K线得到复权视图（成交量、成交额不变，涨跌幅按复权收盘价重算）
+    mode='qfq' 时以 as_of（默认最新一条因子）为基准，用于按历史日期回测的“当时视角”
+    """
+    if mode not in ADJUST_MODES:
+        raise ValueError(f"不支持的复权方式: {mode}")
+    if mode == "none" or table is None or not len(table) or not klines:
+        return klines
+
+    factors = table.factors_for([k["date"] for k in klines])
+    if mode == "qfq":
+        base = table.factor_at(as_of) if as_of else float(table.factors[-1])
+        factors = factors / base
+    if np.all(factors == 1.0):
+        return klines
+
+    prices = np.array([[k[f] for f in _PRICE_FIELDS] for k in klines], dtype=float) * factors[:, None]
+    closes = prices[:, 3]
+    change_pct = np.empty(len(klines))
+    change_pct[0] = klines[0].get("change_pct", 0.0)
+    change_pct[1:] = (closes[1:] / closes[:-1] - 1) * 100
+
+    adjusted = []
+    for k, (o, h, l, c), pct in zip(klines, prices.tolist(), change_pct.tolist()):
+        bar = dict(k)
+        bar["open"], bar["high"], bar["low"], bar["close"] = o, h, l, c
+        bar["change_pct"] = round(pct, 2)
+        adjusted.append(bar)
+    return adjusted
@@ -0,0 +1,333 @@
+"""
+常驻分析服务
+进程常驻，K线缓存（KLINE_STORE）、复权因子、交易日历、分析结果和实时行情快照都留在内存里，
+前端的交互请求不再付出解释器启动、import 和冷启动取数的代价
+
+接口（GET 参数或 POST JSON 均可）:
+    GET  /health
+    GET  /analyze?symbol=300433[&date=2026-01-08][&timeframe=weekly][&format=json|text|markdown|html]
+                    （json 附带当天的资金面信号 flow_signals，如 {"main_flow": "in", "main_net": ...}；
+                     只读本地 FLOW_STORE，由后台每 FLOW_REFRESH_INTERVAL 秒为分析过的股票批量更新一次）
+    POST /batch     {"symbols": [...], "date": null, "timeframe": "daily"}
+    POST /screen    {"symbols": [...], "min_score": 3, "hold_only": false, "limit": 50}
+                    （不给 symbols 时取行情快照中成交额最大的 universe 只）
+    GET  /quote?symbol=300433
+    GET  /metrics   （Prometheus 文本）
+
+用法:
+    python analysis_service.py                       # 监听 127.0.0.1:8765
+    python analysis_service.py --port 8765 --concurrency 4
+    python analysis_service.py --unix /tmp/stock-analysis.sock
+"""
+
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from flow_store import FLOW_STORE, refresh_fund_flow
+from full_analysis import KLINE_STORE, analyze_stock, generate_report
+from metrics import METRICS
+from quote_feed import QuoteFeed, is_trading_time, next_session_start
+from report_renderer import FORMATS
+
+DEFAULT_PORT = 8765
+DEFAULT_CONCURRENCY = 4
+QUEUE_TIMEOUT = 10.0        # 等待空闲名额的最长时间（秒），超时返回 503
+LATEST_TTL = 30.0           # 盘中最新交易日的分析结果缓存秒数（历史日期的结果不过期）
+CLOSED_LATEST_TTL = 3600.0  # 非交易时段最新交易日结果的最长缓存秒数（且不跨过下一个交易时段开始）
+MEMO_SIZE = 20000
+SCREEN_UNIVERSE = 300
+MAX_BATCH = 500
+FLOW_REFRESH_INTERVAL = 600.0   # 后台批量更新资金流向的间隔（秒）
+
+
+class Busy(Exception):
+    """并发名额已满"""
+
+
+class AnalysisService:
+    """
+    分析服务（与传输层无关，HTTP / Unix socket 共用）
+    同一股票的分析串行执行（KLINE_STORE 按股票更新），不同股票最多 concurrency 个并行
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, feed: Optional[QuoteFeed] = None):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.feed = feed
+        self.started = time.time()
+        self._memo: Dict[tuple, tuple] = {}       # (symbol, date, timeframe) → (过期时间, AnalysisResult)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._flow_symbols = set()                # 分析过的股票（后台更新它们的资金流向）
+        self._stop = threading.Event()
+        self._flow_thread: Optional[threading.Thread] = None
+
+    def _symbol_lock(self, symbol: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(symbol)
+            if lock is None:
+                lock = self._locks[symbol] = threading.Lock()
+            return lock
+
+    # ---------- 分析 ----------
+
+    def analyze(self, symbol: str, date: Optional[str] = None, timeframe: str = "daily"):
+        self._flow_symbols.add(symbol)
+        key = (symbol, date, timeframe)
+        hit = self._memo.get(key)
+        if hit and hit[0] > time.monotonic():
+            METRICS.inc("cache_hits_total", "analysis")
+            return hit[1]
+        if not self.slots.acquire(timeout=QUEUE_TIMEOUT):
+            raise Busy()
+        try:
+            with self._symbol_lock(symbol):
+                hit = self._memo.get(key)
+                if hit and hit[0] > time.monotonic():
+                    METRICS.inc("cache_hits_total", "analysis")
+                    return hit[1]
+                METRICS.inc("cache_misses_total", "analysis")
+                with METRICS.span("service_analyze"):
+                    result = analyze_stock(symbol, date, timeframe)
+        finally:
+            self.slots.release()
+        if result is not None:
+            self._remember(key, result)
+        return result
+
+    def _remember(self, key: tuple, result):
+        now = datetime.now()
+        latest = key[1] is None or key[1] >= now.strftime("%Y-%m-%d")
+        if not latest:
+            ttl = float("inf")
+        elif is_trading_time(now):
+            ttl = LATEST_TTL
+        else:
+            # 收盘后/休市时最新K线不变，但到下一个交易时段就会有新K线
+            ttl = min(CLOSED_LATEST_TTL, max(LATEST_TTL, (next_session_start(now) - now).total_seconds()))
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+        self._memo[key] = (time.monotonic() + ttl, result)
+
+    def batch(self, symbols: List[str], date: Optional[str] = None, timeframe: str = "daily") -> List:
+        return [self.analyze(symbol, date, timeframe) for symbol in symbols[:MAX_BATCH]]
+
+    def screen(self, symbols: Optional[List[str]] = None, min_score: int = 3, hold_only: bool = False,
+               limit: int = 50, universe: int = SCREEN_UNIVERSE) -> List:
+        """按"没走弱"得分筛选（得分降序，同分按量比降序）"""
+        if not symbols:
+            quotes = self.feed.latest.values() if self.feed else ()
+            ranked = sorted((q for q in quotes if q.amount == q.amount), key=lambda q: q.amount, reverse=True)
+            symbols = [q.symbol for q in ranked[:universe]]
+        picked = []
+        for result in self.batch(symbols):
+            if result is None or result.not_weakened_score < min_score:
+                continue
+            if hold_only and (not result.should_hold or result.should_sell):
+                continue
+            picked.append(result)
+        picked.sort(key=lambda r: (-r.not_weakened_score, -r.vol_ratio))
+        return picked[:limit]
+
+    def flow_signals(self, symbol: str, date: str) -> Dict:
+        """资金面信号（main_flow 等，与交易记忆中教训条件的字段一致）；只读本地，不访问网络"""
+        return FLOW_STORE.signals(symbol, date)
+
+    # ---------- 后台任务 ----------
+
+    def refresh_flows(self) -> Dict[str, int]:
+        """为分析过的股票批量更新资金流向（一次 refresh_fund_flow 调用）"""
+        symbols = sorted(self._flow_symbols)
+        with METRICS.span("service_refresh_flows"):
+            return refresh_fund_flow(symbols)
+
+    def _run_flow_refresh(self):
+        while not self._stop.wait(FLOW_REFRESH_INTERVAL):
+            try:
+                self.refresh_flows()
+            except Exception as e:
+                print(f"⚠️ 资金流向更新失败: {e}")
+
+    def start(self) -> "AnalysisService":
+        if self._flow_thread is None or not self._flow_thread.is_alive():
+            self._stop.clear()
+            self._flow_thread = threading.Thread(target=self._run_flow_refresh, name="flow-refresh", daemon=True)
+            self._flow_thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._flow_thread is not None:
+            self._flow_thread.join()
+            self._flow_thread = None
+
+    def quote(self, symbol: str) -> Optional[Dict]:
+        q = self.feed.quote(symbol) if self.feed else None
+        if q is None:
+            return None
+        return {k: None if isinstance(v, float) and v != v else v for k, v in vars(q).items()}
+
+    def health(self) -> Dict:
+        return {
+            "status": "ok",
+            "uptime": round(time.time() - self.started, 1),
+            "symbols_cached": len(KLINE_STORE.symbols()),
+            "results_cached": len(self._memo),
+            "quotes": len(self.feed.latest) if self.feed else 0,
+        }
+
+
+# ==================== HTTP ====================
+
+def _result_json(result) -> Optional[Dict]:
+    return json.loads(generate_report(result, "json")) if result is not None else None
+
+
+class Handler(BaseHTTPRequestHandler):
+    service: AnalysisService = None
+    protocol_version = "HTTP/1.1"   # keep-alive，前端复用连接
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _params(self) -> Dict:
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            params.update(json.loads(self.rfile.read(length) or b"{}"))
+        return params
+
+    def _dispatch(self):
+        route = urlsplit(self.path).path.rstrip("/") or "/"
+        try:
+            params = self._params()
+            with METRICS.span(route, "service_request_seconds"):
+                self._route(route, params)
+        except Busy:
+            self._send(503, {"error": "busy"})
+        except KeyError as e:
+            self._send(400, {"error": f"缺少参数 {e}"})
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _route(self, route: str, p: Dict):
+        service = self.service
+        if route == "/health":
+            return self._send(200, service.health())
+        if route == "/metrics":
+            return self._send(200, METRICS.to_prometheus(), "text/plain; version=0.0.4")
+        if route == "/quote":
+            quote = service.quote(p["symbol"])
+            return self._send(200 if quote else 404, quote or {"error": "no quote"})
+        if route == "/analyze":
+            fmt = p.get("format", "json")
+            if fmt not in FORMATS:
+                raise ValueError(f"format 可选: {', '.join(FORMATS)}")
+            result = service.analyze(p["symbol"], p.get("date") or None, p.get("timeframe", "daily"))
+            if result is None:
+                return self._send(404, {"error": f"无法分析 {p['symbol']}"})
+            if fmt == "json":
+                body = _result_json(result)
+                body["flow_signals"] = service.flow_signals(result.symbol, result.date)
+                return self._send(200, body)
+            return self._send(200, generate_report(result, fmt), "text/html" if fmt == "html" else "text/plain")
+        if route == "/batch":
+            results = service.batch(_symbols(p), p.get("date") or None, p.get("timeframe", "daily"))
+            return self._send(200, [_result_json(r) for r in results])
+        if route == "/screen":
+            results = service.screen(_symbols(p) if p.get("symbols") else None, int(p.get("min_score", 3)),
+                                     str(p.get("hold_only", "")).lower() in ("1", "true"), int(p.get("limit", 50)))
+            return self._send(200, [_result_json(r) for r in results])
+        self._send(404, {"error": f"未知接口 {route}"})
+
+    def _send(self, status: int, body, content_type: str = "application/json"):
+        if not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix socket 没有客户端地址
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def _symbols(p: Dict) -> List[str]:
+    symbols = p["symbols"]
+    return symbols.split(",") if isinstance(symbols, str) else [str(s) for s in symbols]
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+        self.server_name, self.server_port = "localhost", 0
+
+
+def serve(service: AnalysisService, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+          unix: Optional[str] = None, verbose: bool = False):
+    """启动服务（阻塞）；verbose 为 False 时丢弃分析过程中的逐步打印"""
+    handler = type("ServiceHandler", (Handler,), {"service": service})
+    server = UnixHTTPServer(unix, handler) if unix else ThreadingHTTPServer((host, port), handler)
+    if not unix:
+        server.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    print(f"🚀 分析服务已启动: {unix or f'http://{host}:{port}'}（Ctrl+C 退出）")
+    try:
+        with open(os.devnull, "w", encoding="utf-8") as sink, \
+                contextlib.redirect_stdout(sys.stdout if verbose else sink):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix and os.path.exists(unix):
+            os.unlink(unix)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="常驻分析服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="监听 Unix socket 路径（代替 TCP 端口）")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同时进行的分析数")
+    parser.add_argument("--no-quotes", action="store_true", help="不启动实时行情轮询")
+    parser.add_argument("--verbose", action="store_true", help="保留分析过程的打印输出")
+    args = parser.parse_args()
+
+    METRICS.enable()
+    feed = None if args.no_quotes else QuoteFeed().start()
+    service = AnalysisService(args.concurrency, feed).start()
+    serve(service, args.host, args.port, args.unix, args.verbose)
+    service.stop()
+    if feed:
+        feed.stop()
+
+
+if __name__ == "__main__":
+    main()
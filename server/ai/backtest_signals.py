@@ -3,51 +3,15 @@
 """
 
 import json
-import requests
-from datetime import datetime, timedelta
-from typing import List, Dict
+from datetime import datetime
+from typing import List, Dict, Optional
 
-AKTOOLS_URL = "http://127.0.0.1:8081/api/public"
-
-def call_aktools(endpoint: str, params: dict = None) -> dict:
-    """调用 AKTools API"""
-    try:
-        url = f"{AKTOOLS_URL}/{endpoint}"
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"[AKTools Error] {endpoint}: {e}")
-        return None
+from full_analysis import get_kline_data as _fetch_klines
+from kline_store import DateIndex
 
 def get_kline_data(symbol: str, count: int = 100) -> list:
-    """获取K线数据"""
-    end_date = datetime.now().strftime("%Y%m%d")
-    start_date = (datetime.now() - timedelta(days=count * 2)).strftime("%Y%m%d")
-    
-    data = call_aktools("stock_zh_a_hist", {
-        "symbol": symbol,
-        "period": "daily",
-        "start_date": start_date,
-        "end_date": end_date,
-        "adjust": "qfq"
-    })
-    
-    if data:
-        klines = []
-        for item in data:
-            klines.append({
-                "date": item.get("日期", ""),
-                "open": float(item.get("开盘", 0)),
-                "close": float(item.get("收盘", 0)),
-                "high": float(item.get("最高", 0)),
-                "low": float(item.get("最低", 0)),
-                "volume": float(item.get("成交量", 0)),
-                "amount": float(item.get("成交额", 0)),
-                "change_pct": float(item.get("涨跌幅", 0)),
-            })
-        return klines
-    return []
+    """获取最近 count 个交易日的前复权K线（经由 full_analysis：交易日历定起始日、本地缓存、DATA_BACKEND）"""
+    return _fetch_klines(symbol, count=count)
 
 def calculate_rsi(closes: list, period: int = 14) -> float:
     """计算 RSI"""
@@ -76,6 +40,28 @@ def calculate_rsi(closes: list, period: int = 14) -> float:
     rsi = 100 - (100 / (1 + rs))
     return round(rsi, 2)
 
+def calculate_rsi_series(closes: list, period: int = 14) -> list:
+    """计算 RSI 序列（第 i 项等于 calculate_rsi(closes[:i+1])）"""
+    gains = []
+    losses = []
+    for i in range(1, len(closes)):
+        change = closes[i] - closes[i-1]
+        gains.append(change if change > 0 else 0)
+        losses.append(0 if change > 0 else abs(change))
+    
+    result = []
+    for i in range(len(closes)):
+        if i < period:
+            result.append(50.0)
+            continue
+        avg_gain = sum(gains[i-period:i]) / period
+        avg_loss = sum(losses[i-period:i]) / period
+        if avg_loss == 0:
+            result.append(100.0)
+        else:
+            result.append(round(100 - (100 / (1 + avg_gain / avg_loss)), 2))
+    return result
+
 def calculate_macd(closes: list, fast=12, slow=26, signal=9) -> dict:
     """计算 MACD"""
     if len(closes) < slow:
@@ -132,41 +118,47 @@ def calculate_kdj(highs: list, lows: list, closes: list, n=9, m1=3, m2=3) -> tup
     
     return k_list, d_list, j_list
 
-def analyze_date(klines: list, target_date: str) -> dict:
-    """分析特定日期的技术信号"""
-    
-    # 找到目标日期的索引（处理不同日期格式）
-    target_idx = None
-    for i, k in enumerate(klines):
-        date_str = k['date']
-        # 处理 2026-01-08T00:00:00.000 格式
-        if 'T' in str(date_str):
-            date_str = str(date_str).split('T')[0]
-        if date_str == target_date:
-            target_idx = i
-            break
-    
-    if target_idx is None:
-        return None
-    
-    # 使用到目标日期为止的数据计算指标
-    data_until_date = klines[:target_idx + 1]
-    closes = [k['close'] for k in data_until_date]
-    highs = [k['high'] for k in data_until_date]
-    lows = [k['low'] for k in data_until_date]
-    volumes = [k['volume'] for k in data_until_date]
-    
-    # 计算指标
-    rsi = calculate_rsi(closes)
-    dif_list, dea_list = calculate_macd(closes)
+def _signal_series(klines: list) -> dict:
+    """整段K线的指标序列，只计算一次，供多个日期共享"""
+    closes = [k['close'] for k in klines]
+    highs = [k['high'] for k in klines]
+    lows = [k['low'] for k in klines]
+    dif_list, dea_list = calculate_macd(closes) if len(closes) >= 26 else ([0], [0])
     k_list, d_list, j_list = calculate_kdj(highs, lows, closes)
+    return {
+        "volumes": [k['volume'] for k in klines],
+        "rsi": calculate_rsi_series(closes),
+        "dif": dif_list,
+        "dea": dea_list,
+        "k": k_list,
+        "d": d_list,
+        "j": j_list,
+    }
+
+def _tail(values: list, idx: int, warmup: int, default, offset: int = 0) -> list:
+    """
+    截至 idx 的末尾两项（数据不足 warmup 根时与单日计算一样只返回默认值）
+    offset: 序列第一项对应的K线下标（KDJ 从第 n 根开始）
+    """
+    if idx + 1 < warmup:
+        return [default]
+    i = idx - offset
+    return values[max(0, i - 1):i + 1]
+
+def _analyze_at(klines: list, series: dict, target_idx: int) -> dict:
+    """分析 target_idx 当天的技术信号"""
+    # 截至目标日期的指标（与只用到目标日期为止的数据计算的结果一致）
+    rsi = series['rsi'][target_idx]
+    dif_list = _tail(series['dif'], target_idx, 26, 0)
+    dea_list = _tail(series['dea'], target_idx, 26, 0)
+    k_list = _tail(series['k'], target_idx, 9, 50, offset=8)
+    d_list = _tail(series['d'], target_idx, 9, 50, offset=8)
+    j_list = _tail(series['j'], target_idx, 9, 50, offset=8)
+    volumes = series['volumes'][max(0, target_idx - 4):target_idx + 1]
     
     # 当日数据
     today = klines[target_idx]
     
-    # 前一天数据
-    prev = klines[target_idx - 1] if target_idx > 0 else None
-    
     # MACD 金叉/死叉检测
     macd_cross = "none"
     if len(dif_list) >= 2 and len(dea_list) >= 2:
@@ -194,11 +186,11 @@ def analyze_date(klines: list, target_date: str) -> dict:
             kdj_cross = "dead"    # 死叉
     
     # 成交量变化
-    vol_avg_5 = sum(volumes[-5:]) / 5 if len(volumes) >= 5 else volumes[-1]
+    vol_avg_5 = sum(volumes) / 5 if len(volumes) >= 5 else volumes[-1]
     vol_ratio = today['volume'] / vol_avg_5 if vol_avg_5 > 0 else 1
     
     return {
-        "date": target_date,
+        "date": today['date'],
         "open": today['open'],
         "close": today['close'],
         "high": today['high'],
@@ -217,6 +209,31 @@ def analyze_date(klines: list, target_date: str) -> dict:
         "vol_ratio": round(vol_ratio, 2),
     }
 
+def _analyze_klines(klines: list, dates: List[str]) -> List[Optional[dict]]:
+    """按日期索引定位，共享同一份指标序列逐日分析"""
+    index = DateIndex(klines)
+    series = _signal_series(klines)
+    results = []
+    for target_date in dates:
+        target_idx = index.get(target_date)
+        results.append(None if target_idx is None else _analyze_at(klines, series, target_idx))
+    return results
+
+def analyze_date(klines: list, target_date: str) -> dict:
+    """分析特定日期的技术信号"""
+    return _analyze_klines(klines, [target_date])[0]
+
+def analyze_dates(symbol: str, dates: List[str], klines: list = None) -> List[Optional[dict]]:
+    """
+    多日期信号分析：K线只获取一次（也可直接传入已获取的 klines），指标只计算一次
+    找不到的日期对应位置返回 None
+    """
+    if klines is None:
+        klines = get_kline_data(symbol, count=100)
+    if not klines:
+        return [None] * len(dates)
+    return _analyze_klines(klines, dates)
+
 def print_analysis(analysis: dict, title: str):
     """打印分析结果"""
     print(f"\n{'='*60}")
@@ -301,8 +318,10 @@ def main():
     for k in klines[-5:]:
         print(f"   {k['date']} 收盘:{k['close']:.2f} 涨跌:{k['change_pct']:+.2f}%")
     
+    # 周三 (2026-01-08) / 周四 (2026-01-09) 共用同一份K线和指标序列
+    wed_analysis, thu_analysis = analyze_dates(symbol, ["2026-01-08", "2026-01-09"], klines)
+    
     # 分析周三 (2026-01-08)
-    wed_analysis = analyze_date(klines, "2026-01-08")
     if wed_analysis:
         print_analysis(wed_analysis, "周三 2026-01-08 收盘时信号（你清仓的那天）")
         
@@ -318,7 +337,6 @@ def main():
         print("\n❌ 未找到 2026-01-08 的数据")
     
     # 分析周四 (2026-01-09)
-    thu_analysis = analyze_date(klines, "2026-01-09")
     if thu_analysis:
         print_analysis(thu_analysis, "周四 2026-01-09 收盘时信号（反弹的那天）")
         
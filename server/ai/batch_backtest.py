@@ -2,11 +2,27 @@
 多股票回测测试
 """
 
+import argparse
 import sys
 sys.path.append('.')
-from full_analysis import analyze_stock, generate_report
+from full_analysis import analyze_stock
+from metrics import METRICS
+from report_renderer import FORMATS, SECTIONS, ReportWriter
 
 def main():
+    parser = argparse.ArgumentParser(description="多股票技术分析回测")
+    parser.add_argument("--format", choices=FORMATS, default="text", help="报告格式")
+    parser.add_argument("--out", help="报告输出文件（默认打印到终端）")
+    parser.add_argument("--sections", help=f"只渲染指定章节，逗号分隔（{','.join(SECTIONS)}）")
+    parser.add_argument("--metrics", help="导出阶段耗时指标到文件（.json 为 JSON，其余为 Prometheus 文本）")
+    args = parser.parse_args()
+    if args.metrics:
+        METRICS.enable()
+    sections = args.sections.split(",") if args.sections else None
+
+    report_file = open(args.out, "w", encoding="utf-8") if args.out else None
+    writer = ReportWriter(report_file or sys.stdout, args.format, sections)
+
     print("\n" + "📊 多股票技术分析回测".center(60, "="))
     
     # 测试股票列表（可以修改）
@@ -29,7 +45,14 @@ def main():
         result = analyze_stock(symbol, date)
         if result:
             results.append(result)
-            print(generate_report(result))
+            writer.write(result)
+            if report_file is None:
+                writer.flush()
+
+    writer.close()
+    if report_file is not None:
+        report_file.close()
+        print(f"\n📝 {writer.count} 份报告已写入 {args.out}")
     
     # 汇总
     print("\n" + "="*60)
@@ -53,6 +76,10 @@ def main():
         print(f"{r.name:<10} {r.date:<12} {r.price:<8.2f} {r.not_weakened_score}/5   {advice:<12}")
     
     print("\n" + "="*60)
+    
+    if args.metrics:
+        METRICS.write(args.metrics)
+        print(f"📈 指标已导出到 {args.metrics}（K线缓存命中率 {METRICS.cache_hit_ratio('kline'):.0%}）")
 
 if __name__ == "__main__":
     main()
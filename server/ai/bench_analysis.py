@@ -0,0 +1,317 @@
+"""
+分析链路基准测试
+对 calculate_* / analyze_stock / generate_report / 批量分析计时，并做黄金输出比对
+
+用法:
+    python bench_analysis.py                       # 全部用例，结果按提交保存并与上一次提交比较
+    python bench_analysis.py --sizes 120,1000 -k macd
+    python bench_analysis.py --update-golden       # 指标口径有意变更后重新生成黄金输出
+    python bench_analysis.py --compare a261926     # 指定基线提交
+
+黄金输出不一致或任一用例比基线慢超过阈值时以非零状态退出
+"""
+
+import argparse
+import contextlib
+import dataclasses
+import hashlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from typing import List, Dict, Optional, Callable
+
+sys.path.append('.')
+import full_analysis as fa
+from full_analysis import (
+    IndicatorSeries, calculate_ma, calculate_ema, calculate_rsi,
+    calculate_macd, calculate_kdj, generate_report,
+)
+from report_renderer import FORMATS, stream_reports
+from sector import SectorIndex
+from synthetic import SyntheticAktools, synthetic_klines, trading_days
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_PATH = os.path.join(HERE, "bench_golden.json")
+RESULTS_DIR = os.path.join(HERE, "bench_results")
+
+SIZES = (120, 1_000, 10_000, 100_000)
+BATCH_SYMBOLS = 50
+DEFAULT_THRESHOLD = 1.25   # 比基线慢 25% 以上视为回退
+MIN_TIME = 0.05            # 每轮计时至少持续的秒数
+REPEAT = 5
+
+BENCH_STOCK = {"symbol": "SYN000", "name": "合成样本", "price": 0.0, "sector": "合成"}
+
+
+# ==================== 计时 ====================
+
+def _time(fn: Callable, repeat: int = REPEAT) -> Dict:
+    """先确定每轮调用次数（每轮至少 MIN_TIME 秒），再取 repeat 轮的单次耗时"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_TIME or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < MIN_TIME / 10 else 2
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(samples), "min": min(samples),
+            "number": number, "repeat": repeat}
+
+
+def _quiet(fn: Callable) -> Callable:
+    """屏蔽被测函数的 print 输出"""
+    def wrapper():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return wrapper
+
+
+# ==================== 黄金输出 ====================
+
+def _digest(value) -> str:
+    """把输出规整为文本后取 sha256（浮点保留 10 位有效数字）"""
+    def norm(v):
+        if isinstance(v, float):
+            return format(v, ".10g")
+        if isinstance(v, (list, tuple)):
+            return "[" + ",".join(norm(x) for x in v) + "]"
+        return repr(v)
+    return hashlib.sha256(norm(value).encode("utf-8")).hexdigest()[:16]
+
+
+def _evaluate_last(klines: List[Dict]):
+    """对整段K线的最后一根做完整评估（analyze_stock 取数之后执行的同一段逻辑）"""
+    series = IndicatorSeries(klines)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fa._evaluate(BENCH_STOCK, klines, series, len(klines) - 1, klines[-1]["date"])
+
+
+# ==================== 用例 ====================
+
+class Case:
+    """一个基准用例：run 为被计时的调用，golden 为需要比对的输出（可选）"""
+
+    def __init__(self, name: str, run: Callable, golden: Optional[Callable] = None):
+        self.name = name
+        self.run = run
+        self.golden = golden
+
+
+def build_cases(sizes=SIZES) -> List[Case]:
+    cases = []
+    for n in sizes:
+        klines = synthetic_klines(n, seed=n)
+        closes = [k["close"] for k in klines]
+        highs = [k["high"] for k in klines]
+        lows = [k["low"] for k in klines]
+        indicators = {
+            "calculate_ma": lambda c=closes: calculate_ma(c, 20),
+            "calculate_ema": lambda c=closes: calculate_ema(c, 12),
+            "calculate_rsi": lambda c=closes: calculate_rsi(c),
+            "calculate_macd": lambda c=closes: calculate_macd(c),
+            "calculate_kdj": lambda h=highs, l=lows, c=closes: calculate_kdj(h, l, c),
+        }
+        cases += [Case(f"{name}[{n}]", fn, golden=fn) for name, fn in indicators.items()]
+        cases.append(Case(f"evaluate[{n}]", lambda k=klines: _evaluate_last(k),
+                          golden=lambda k=klines: dataclasses.astuple(_evaluate_last(k))))
+
+    # 报告渲染（与K线长度无关）
+    result = _evaluate_last(synthetic_klines(SIZES[0], seed=SIZES[0]))
+    for fmt in FORMATS:
+        cases.append(Case(f"generate_report[{fmt}]", lambda f=fmt: generate_report(result, f),
+                          golden=lambda f=fmt: generate_report(result, f)))
+
+    # analyze_stock / 批量：经由离线 AKTools 替身，覆盖取数、解析、缓存、评估、报告
+    today = date.today()
+    fa.TRADING_CALENDAR.load(trading_days(10 * 250, today))   # 合成数据按工作日生成，日历保持一致
+    universe = {f"SYN{i:03d}": synthetic_klines(400, seed=i, end_date=today) for i in range(BATCH_SYMBOLS)}
+    aktools = SyntheticAktools(universe)
+
+    def analyze_cold():
+        fa.KLINE_STORE.clear()
+        return fa.analyze_stock("SYN000")
+
+    def analyze_warm():
+        return fa.analyze_stock("SYN000")
+
+    def batch():
+        fa.KLINE_STORE.clear()
+        results = [fa.analyze_stock(symbol) for symbol in universe]
+        stream_reports(results, io.StringIO())
+
+    cases += [
+        Case("analyze_stock[cold]", _with_aktools(aktools, _quiet(analyze_cold))),
+        Case("analyze_stock[warm]", _with_aktools(aktools, _quiet(analyze_warm))),
+        Case(f"batch[{BATCH_SYMBOLS}]", _with_aktools(aktools, _quiet(batch))),
+    ]
+    return cases
+
+
+def _with_aktools(aktools: SyntheticAktools, fn: Callable) -> Callable:
+    def wrapper():
+        original = fa.DATA_BACKEND, fa.SECTOR_INDEX
+        # 合成数据的"行业"不能写进真实的行业缓存
+        fa.DATA_BACKEND, fa.SECTOR_INDEX = aktools, SectorIndex(cache_path=os.devnull)
+        try:
+            return fn()
+        finally:
+            fa.DATA_BACKEND, fa.SECTOR_INDEX = original
+    return wrapper
+
+
+# ==================== 结果保存与比较 ====================
+
+def _git(*args) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *args], cwd=HERE, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def current_commit() -> str:
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    if _git("status", "--porcelain", "--untracked-files=no"):
+        commit += "-dirty"
+    return commit
+
+
+def _results_path(commit: str) -> str:
+    return os.path.join(RESULTS_DIR, f"{commit}.json")
+
+
+def find_baseline(commit: str) -> Optional[str]:
+    """沿提交历史向前找最近一次保存过结果的提交"""
+    history = (_git("rev-list", "--abbrev-commit", "--max-count=200", "HEAD") or "").split()
+    for sha in history:
+        if sha != commit and os.path.exists(_results_path(sha)):
+            return sha
+    return None
+
+
+def save_results(commit: str, timings: Dict[str, Dict]):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(_results_path(commit), "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "cases": timings,
+        }, f, ensure_ascii=False, indent=2)
+
+
+def compare(timings: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """返回回退的用例（中位数比基线慢超过 threshold 倍）"""
+    regressions = []
+    print(f"\n{'用例':<28} {'基线':>12} {'本次':>12} {'比值':>8}")
+    print("-" * 64)
+    for name, t in timings.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = t["median"] / base["median"] if base["median"] else 1.0
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = " ❌"
+        elif ratio < 1 / threshold:
+            flag = " ⚡"
+        print(f"{name:<28} {_fmt(base['median']):>12} {_fmt(t['median']):>12} {ratio:>7.2f}x{flag}")
+    return regressions
+
+
+def _fmt(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds * 1e6:.1f}µs"
+
+
+# ==================== 主程序 ====================
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="分析链路基准测试")
+    parser.add_argument("--sizes", help="K线长度，逗号分隔（默认 120,1000,10000,100000）")
+    parser.add_argument("-k", dest="keyword", help="只运行名称包含该关键字的用例")
+    parser.add_argument("--update-golden", action="store_true", help="重新生成黄金输出")
+    parser.add_argument("--compare", help="基线提交（默认自动查找最近一次有结果的提交）")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="回退阈值（倍数）")
+    parser.add_argument("--no-save", action="store_true", help="不保存本次结果")
+    args = parser.parse_args()
+
+    sizes = tuple(int(s) for s in args.sizes.split(",")) if args.sizes else SIZES
+    cases = [c for c in build_cases(sizes) if not args.keyword or args.keyword in c.name]
+
+    print("\n" + "⏱️ 分析链路基准测试".center(60, "="))
+
+    # 黄金输出
+    golden = {}
+    if os.path.exists(GOLDEN_PATH):
+        with open(GOLDEN_PATH, encoding="utf-8") as f:
+            golden = json.load(f)
+    mismatches = []
+    for case in cases:
+        if case.golden is None:
+            continue
+        digest = _digest(case.golden())
+        if args.update_golden:
+            golden[case.name] = digest
+        elif case.name in golden and golden[case.name] != digest:
+            mismatches.append(case.name)
+    if args.update_golden:
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(golden.items())), f, indent=2)
+            f.write("\n")
+        print(f"📝 黄金输出已更新: {GOLDEN_PATH}")
+
+    # 计时
+    timings = {}
+    for case in cases:
+        timings[case.name] = _time(case.run)
+        print(f"   {case.name:<28} {_fmt(timings[case.name]['median']):>12}")
+
+    commit = current_commit()
+    if not args.no_save:
+        save_results(commit, timings)
+
+    failed = False
+    if mismatches:
+        failed = True
+        print("\n❌ 黄金输出不一致：")
+        for name in mismatches:
+            print(f"   - {name}")
+
+    baseline_commit = args.compare or find_baseline(commit)
+    if baseline_commit and os.path.exists(_results_path(baseline_commit)):
+        with open(_results_path(baseline_commit), encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+        print(f"\n📊 与 {baseline_commit} 比较")
+        regressions = compare(timings, baseline, args.threshold)
+        if regressions:
+            failed = True
+            print(f"\n❌ 性能回退（>{args.threshold:.2f}x）：{', '.join(regressions)}")
+    elif args.compare:
+        print(f"\n⚠️ 没有找到 {args.compare} 的基准结果")
+
+    print("\n" + ("❌ 基准测试失败" if failed else "✅ 基准测试通过"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
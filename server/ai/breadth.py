@@ -0,0 +1,277 @@
+"""
+市场宽度
+在 股票×日期 矩阵（MarketMatrix）上一次向量化算出全部历史的横截面统计：
+涨跌家数、站上 MA5/MA10/MA20 的比例、均线多头排列比例、创 N 日新高/新低家数、"没走弱"得分分布；
+之后每个交易日只用各股票最近 HIGH_WINDOW 根K线的缓冲和 MACD 状态增量追加一行，与全量计算逐位一致
+
+口径:
+- 当天没有成交（未上市、停牌）的股票不计入当天统计
+- 均线、RSI、量比、MACD 和新高/新低都按各股票自己的K线滑动（跳过停牌日），与对该股票单独
+  调用 analyze_stock 的结果相同；K线不足时也与 analyze_stock 一致（均线取收盘价、RSI 取 50、MACD 不算红柱）
+- 涨跌按与上一根K线的收盘价比较；新高/新低按收盘价，上市不足 HIGH_WINDOW 根的不计
+- 各股票的"没走弱"得分规则与 full_analysis._evaluate 相同，个股分析结果可直接对照当天的得分分布（backdrop）
+
+用法:
+    python breadth.py                          # 合成股票池计时，打印最近几天的宽度
+    python breadth.py --symbols 5000 --years 10
+"""
+
+import argparse
+import sys
+import time
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from market_matrix import MarketMatrix, compact, window_sum, rolling_max, rolling_min
+
+MA_PERIODS = (5, 10, 20)
+HIGH_WINDOW = 250           # 新高/新低的回看行数（约一年）
+RSI_PERIOD = 14
+VOL_WINDOW = 5
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+MAX_SCORE = 5
+
+
+@dataclass
+class BreadthRow:
+    """一天的市场宽度"""
+    date: str
+    stocks: int             # 当天有成交的股票数
+    advances: int
+    declines: int
+    unchanged: int
+    above_ma5: float        # 收盘价在均线之上的比例（%）
+    above_ma10: float
+    above_ma20: float
+    ma_bullish: float       # MA5>MA10>MA20 的比例（%）
+    new_highs: int
+    new_lows: int
+    score_dist: List[int]   # "没走弱"得分 0..5 的家数
+
+    @property
+    def advance_ratio(self) -> float:
+        return self.advances / (self.advances + self.declines) if self.advances + self.declines else 0.5
+
+    @property
+    def mean_score(self) -> float:
+        return sum(s * n for s, n in enumerate(self.score_dist)) / self.stocks if self.stocks else 0.0
+
+
+class MarketBreadth:
+    """
+    市场宽度（全量 run + 逐日 update）
+    股票列固定为构建时的 symbols；新股上市后用 run 重新全量计算
+    """
+
+    def __init__(self, symbols: List[str], high_window: int = HIGH_WINDOW):
+        self.symbols = list(symbols)
+        self.high_window = high_window
+        self._tail_rows = max(high_window, max(MA_PERIODS), RSI_PERIOD + 1, VOL_WINDOW) - 1
+        self.dates: List[str] = []
+        self.rows: Dict[str, BreadthRow] = {}
+        self.scores: Optional[np.ndarray] = None     # 最新一天各股票的得分（无成交为 -1）
+        self._reset()
+
+    def _reset(self):
+        n = len(self.symbols)
+        self.dates, self.rows = [], {}
+        self._bars = np.zeros(n, dtype=np.int64)    # 上市以来的K线数
+        self._ema_fast = np.full(n, np.nan)
+        self._ema_slow = np.full(n, np.nan)
+        self._dea = np.full(n, np.nan)
+        empty = np.empty((0, n))
+        self._tail = {"close": empty, "volume": empty}
+
+    # ---------- 计算 ----------
+
+    def run(self, matrix: MarketMatrix) -> "MarketBreadth":
+        """对整个矩阵全量计算（覆盖已有结果）"""
+        if matrix.symbols != self.symbols:
+            raise ValueError("矩阵的股票列与 MarketBreadth 不一致")
+        self._reset()
+        self._process(matrix.dates, matrix.close, matrix.volume)
+        return self
+
+    def update(self, date_str: str, bars: Dict[str, Dict]) -> BreadthRow:
+        """追加一个交易日 {symbol: bar}（bar 至少含 close / volume），返回当天的宽度"""
+        if self.dates and date_str <= self.dates[-1]:
+            raise ValueError(f"日期 {date_str} 不晚于已有的最后一天 {self.dates[-1]}")
+        pos = {s: j for j, s in enumerate(self.symbols)}
+        close, volume = np.full((1, len(self.symbols)), np.nan), np.full((1, len(self.symbols)), np.nan)
+        for symbol, bar in bars.items():
+            j = pos.get(symbol)
+            if j is not None:
+                close[0, j], volume[0, j] = bar["close"], bar["volume"]
+        self._process([date_str], close, volume)
+        return self.rows[date_str]
+
+    def _process(self, dates: List[str], close: np.ndarray, volume: np.ndarray):
+        n, width = close.shape
+        if n == 0:
+            return
+        traded = ~np.isnan(close)
+        cnt = traded.sum(axis=0)
+        # 每列只保留有成交的行并靠底对齐，接在缓冲（同样靠底对齐）之后：窗口按各股票自己的K线滑动
+        valid = np.vstack([~np.isnan(self._tail["close"]), traded])
+        ext_close = compact(np.vstack([self._tail["close"], close]), valid)
+        ext_volume = compact(np.vstack([self._tail["volume"], volume]), valid)
+        diff_ext = ext_close - np.vstack([np.full((1, width), np.nan), ext_close[:-1]])
+        gain_ext = np.where(diff_ext > 0, diff_ext, 0.0)
+        loss_ext = np.where(diff_ext > 0, 0.0, np.abs(diff_ext))
+        gain_ext[np.isnan(diff_ext)] = loss_ext[np.isnan(diff_ext)] = np.nan
+
+        def windowed(a, p):
+            return window_sum(a[-(n + p - 1):], p)[-n:]
+
+        # 以下都是 (n, N) 的靠底对齐块：第 j 列的新K线在最后 cnt[j] 行，其上是缓冲里的旧K线或 NaN
+        c, v, diff = ext_close[-n:], ext_volume[-n:], diff_ext[-n:]
+        fresh = np.arange(n)[:, None] >= n - cnt
+        bars = (self._bars + cnt) - np.arange(n - 1, -1, -1)[:, None]
+
+        ma = {p: np.where(bars >= p, windowed(ext_close, p) / p, c) for p in MA_PERIODS}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_gain = windowed(gain_ext, RSI_PERIOD) / RSI_PERIOD
+            avg_loss = windowed(loss_ext, RSI_PERIOD) / RSI_PERIOD
+            rsi = np.round(100 - 100 / (1 + avg_gain / avg_loss), 2)
+            rsi = np.where(avg_loss == 0, 100.0, rsi)
+            rsi = np.where(bars > RSI_PERIOD, rsi, 50.0)
+            vol_avg = np.where(bars >= VOL_WINDOW, windowed(ext_volume, VOL_WINDOW) / VOL_WINDOW, v)
+            vol_ratio = np.where(vol_avg > 0, v / vol_avg, 1.0)
+
+        w = self.high_window
+        high = rolling_max(ext_close[-(n + w - 1):], w)[-n:]
+        low = rolling_min(ext_close[-(n + w - 1):], w)[-n:]
+        macd_red = self._macd_red(np.where(fresh, c, np.nan), bars)
+
+        with np.errstate(invalid="ignore"):
+            flags = {
+                "above_ma5": c > ma[5],
+                "above_ma10": c > ma[10],
+                "above_ma20": c > ma[20],
+                "ma_bullish": (ma[5] > ma[10]) & (ma[10] > ma[20]),
+                "new_highs": (bars >= w) & (c >= high),
+                "new_lows": (bars >= w) & (c <= low),
+                "advances": diff > 0,
+                "declines": diff < 0,
+            }
+            score = (flags["above_ma5"].astype(np.int8) + flags["above_ma10"] + macd_red + (rsi > 30)
+                     + ((vol_ratio <= 1.5) | (diff >= 0)))
+
+        # 靠底对齐块 → 原始的 日期×股票 位置（无成交的格子为 False / -1）
+        src_rows = n - cnt + np.cumsum(traded, axis=0) - 1
+        t_idx, j_idx = np.nonzero(traded)
+        pick = (src_rows[t_idx, j_idx], j_idx)
+
+        def scatter(a, fill):
+            out = np.full((n, width), fill, dtype=a.dtype)
+            out[t_idx, j_idx] = a[pick]
+            return out
+
+        stocks = traded.sum(axis=1)
+        denom = np.maximum(stocks, 1) / 100
+        columns = {"stocks": stocks}
+        for key, mask in flags.items():
+            count = scatter(mask, False).sum(axis=1)
+            columns[key] = np.round(count / denom, 2) if key.startswith(("above", "ma_")) else count
+        score = scatter(score, -1)
+        dist = np.stack([(score == s).sum(axis=1) for s in range(MAX_SCORE + 1)], axis=1).tolist()
+        columns = {k: col.tolist() for k, col in columns.items()}
+        for i, d in enumerate(dates):
+            row = {k: col[i] for k, col in columns.items()}
+            row["unchanged"] = row["stocks"] - row["advances"] - row["declines"]
+            self.rows[d] = BreadthRow(d, score_dist=dist[i], **row)
+        self.dates += dates
+
+        # 状态：最新得分（当天无成交为 -1）、上市以来的K线数、最近的靠底对齐缓冲
+        self.scores = score[-1]
+        self._bars = self._bars + cnt
+        start = max(0, len(ext_close) - self._tail_rows)
+        self._tail = {"close": ext_close[start:], "volume": ext_volume[start:]}
+
+    def _macd_red(self, c: np.ndarray, bars: np.ndarray) -> np.ndarray:
+        """
+        逐行推进 EMA 状态（与 calculate_ema 的递推和初值相同），返回各行是否红柱
+        c 中为 NaN 的格子（不是新K线）保持原状态
+        """
+        m_fast, m_slow, m_signal = 2 / (MACD_FAST + 1), 2 / (MACD_SLOW + 1), 2 / (MACD_SIGNAL + 1)
+        ema_fast, ema_slow, dea = self._ema_fast, self._ema_slow, self._dea
+        red = np.zeros(c.shape, dtype=bool)
+        for i, x in enumerate(c):
+            has = ~np.isnan(x)
+            fresh = np.isnan(ema_fast)
+            ema_fast = np.where(has, np.where(fresh, x, (x - ema_fast) * m_fast + ema_fast), ema_fast)
+            ema_slow = np.where(has, np.where(fresh, x, (x - ema_slow) * m_slow + ema_slow), ema_slow)
+            dif = ema_fast - ema_slow
+            dea = np.where(has, np.where(fresh, dif, (dif - dea) * m_signal + dea), dea)
+            with np.errstate(invalid="ignore"):
+                red[i] = has & (bars[i] >= MACD_SLOW) & (dif - dea > 0)
+        self._ema_fast, self._ema_slow, self._dea = ema_fast, ema_slow, dea
+        return red
+
+    # ---------- 查询 ----------
+
+    def row(self, date_str: str) -> Optional[BreadthRow]:
+        return self.rows.get(date_str)
+
+    def latest(self) -> Optional[BreadthRow]:
+        return self.rows[self.dates[-1]] if self.dates else None
+
+    def series(self, field: str) -> List:
+        """某一项的时间序列（与 self.dates 对齐），如 series("above_ma20")、series("advance_ratio")"""
+        return [getattr(self.rows[d], field) for d in self.dates]
+
+    def backdrop(self, result) -> Optional[Dict]:
+        """个股分析结果（AnalysisResult）在当天市场中的位置：得分百分位（同分算一半）和当天宽度"""
+        row = self.rows.get(result.date)
+        if row is None or not row.stocks:
+            return None
+        score = result.not_weakened_score
+        below = sum(row.score_dist[:score])
+        percentile = (below + row.score_dist[score] / 2) / row.stocks * 100
+        return {
+            "date": row.date,
+            "score": score,
+            "score_percentile": round(percentile, 1),
+            "market_mean_score": round(row.mean_score, 2),
+            "advance_ratio": round(row.advance_ratio * 100, 1),
+            "above_ma20": row.above_ma20,
+            "ma_bullish": row.ma_bullish,
+            "stock_above_ma20": result.price_above_ma20,
+            "stock_ma_bullish": result.is_ma_bullish,
+        }
+
+
+def format_row(row: BreadthRow) -> str:
+    dist = " ".join(f"{s}分:{n}" for s, n in enumerate(row.score_dist))
+    return (f"{row.date} 涨{row.advances}/跌{row.declines}/平{row.unchanged}  "
+            f">MA5 {row.above_ma5:.1f}% >MA10 {row.above_ma10:.1f}% >MA20 {row.above_ma20:.1f}%  "
+            f"多头 {row.ma_bullish:.1f}%  新高{row.new_highs}/新低{row.new_lows}  [{dist}]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="市场宽度（合成股票池计时）")
+    parser.add_argument("--symbols", type=int, default=5000, help="股票数量")
+    parser.add_argument("--years", type=float, default=10, help="每只股票的历史年数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=int, default=5, help="打印最近几天")
+    args = parser.parse_args()
+
+    sys.path.append('.')
+    from datetime import date
+    from synthetic import generate_universe
+
+    t0 = time.perf_counter()
+    matrix = MarketMatrix.from_klines(dict(generate_universe(args.symbols, args.years, args.seed, date.today())))
+    t1 = time.perf_counter()
+    breadth = MarketBreadth(matrix.symbols).run(matrix)
+    t2 = time.perf_counter()
+    print(f"📊 {len(matrix.symbols)} 只 × {len(matrix)} 天: 构建矩阵 {t1 - t0:.2f}s, 全量宽度 {t2 - t1:.2f}s")
+    for d in breadth.dates[-args.days:]:
+        print("   " + format_row(breadth.rows[d]))
+    print(f"   {asdict(breadth.latest())}")
+
+
+if __name__ == "__main__":
+    main()
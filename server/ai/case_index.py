@@ -0,0 +1,233 @@
+"""
+交易案例相似度检索
+把历史交易时的技术信号（Trade.technical_signals）或 AnalysisResult 转成定长特征向量，
+数值特征按列标准化、类别特征 one-hot，查询时用 numpy 暴力算距离取 Top-K；
+10 万条案例单次查询约几毫秒，不需要树索引
+"""
+
+import math
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Iterable
+
+import numpy as np
+
+# 数值特征（与价格量纲无关）
+NUMERIC_FEATURES = (
+    "rsi",
+    "kdj_j",
+    "vol_ratio",
+    "change_pct",
+    "ma5_bias",        # 收盘价相对 MA5 的偏离（%）
+    "ma20_bias",       # 收盘价相对 MA20 的偏离（%）
+    "macd_hist_pct",   # MACD 柱相对价格（%）
+)
+
+# 类别特征（取值与 trading-memory 设计文档一致）
+CATEGORY_FEATURES = {
+    "macd_status": ("golden_cross", "dead_cross", "above_zero", "below_zero"),
+    "volume_pattern": ("surge", "shrink", "normal", "divergence"),
+}
+CATEGORY_WEIGHT = 1.0   # 类别不同时的距离（相当于数值特征差 1 个标准差）
+
+# 旧版交易记录里的写法 → 标准取值
+_VOLUME_ALIASES = {"high": "surge", "expand": "surge", "low": "shrink"}
+_MACD_ALIASES = {"golden": "golden_cross", "dead": "dead_cross", "bullish": "above_zero", "bearish": "below_zero"}
+
+# 每个特征在向量中的起始列（数值特征各占 1 列，类别特征占 one-hot 的若干列）
+_FEATURE_STARTS = np.cumsum([0] + [1] * len(NUMERIC_FEATURES) + [len(v) for v in CATEGORY_FEATURES.values()])[:-1]
+
+OUTCOMES = ("good", "bad", "neutral")
+REFIT_GROWTH = 1.1      # 案例数增长超过 10% 时重新计算标准化参数
+
+
+@dataclass
+class CaseMatch:
+    """相似案例"""
+    distance: float
+    outcome: Optional[str]
+    payload: object
+
+
+# ==================== 特征提取 ====================
+
+def signals_features(signals: Dict) -> Dict:
+    """交易记录中的技术信号（兼容 entryRsi / macdStatus / volumePattern 写法）"""
+    features = {name: signals.get(name) for name in NUMERIC_FEATURES}
+    if features["rsi"] is None:
+        features["rsi"] = signals.get("entryRsi")
+    macd = signals.get("macdStatus") or signals.get("macd_status")
+    if not macd:
+        cross = signals.get("macd_cross")
+        macd = cross if cross in ("golden", "dead") else signals.get("macd")
+    volume = signals.get("volumePattern") or signals.get("volume_pattern") or signals.get("volume")
+    features["macd_status"] = _MACD_ALIASES.get(macd, macd)
+    features["volume_pattern"] = _VOLUME_ALIASES.get(volume, volume)
+    return features
+
+
+def result_features(result) -> Dict:
+    """AnalysisResult 的特征"""
+    if result.macd_cross in ("golden", "dead"):
+        macd = f"{result.macd_cross}_cross"
+    else:
+        macd = "above_zero" if result.macd_dif > 0 else "below_zero"
+    price = result.price
+    return {
+        "rsi": result.rsi,
+        "kdj_j": result.kdj_j,
+        "vol_ratio": result.vol_ratio,
+        "change_pct": result.change_pct,
+        "ma5_bias": (price / result.ma5 - 1) * 100 if result.ma5 else None,
+        "ma20_bias": (price / result.ma20 - 1) * 100 if result.ma20 else None,
+        "macd_hist_pct": result.macd_histogram / price * 100 if price else None,
+        "macd_status": macd,
+        "volume_pattern": _VOLUME_ALIASES.get(result.vol_status, result.vol_status),
+    }
+
+
+def _encode(features: Dict) -> np.ndarray:
+    """特征字典 → 原始向量（缺失为 NaN；类别特征 one-hot，缺失时整组为 NaN）"""
+    row = []
+    for name in NUMERIC_FEATURES:
+        value = features.get(name)
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = math.nan
+        row.append(value)
+    # one-hot 乘以 w/√2，两个不同类别的平方距离恰好为 w²
+    scale = CATEGORY_WEIGHT / math.sqrt(2)
+    for name, values in CATEGORY_FEATURES.items():
+        value = features.get(name)
+        if value in values:
+            row += [scale if v == value else 0.0 for v in values]
+        else:
+            row += [math.nan] * len(values)
+    return np.array(row, dtype=float)
+
+
+# ==================== 索引 ====================
+
+class CaseIndex:
+    """
+    案例索引（暴力 k-NN）
+    距离只在查询与案例都有的特征上计算并按特征数归一，缺失特征不会被当成 0；
+    平方距离展开为 Σm·x² - 2Σm·x·q + Σm·q²（m 为案例的特征掩码），
+    把 [x², x, m] 拼成一个矩阵，查询时平方距离和重叠特征数由一次矩阵乘法同时得到；
+    m 按特征而不是按列（一个类别特征只算一个，不按 one-hot 的列数重复计数）
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._dims = len(NUMERIC_FEATURES) + sum(len(v) for v in CATEGORY_FEATURES.values())
+        self._width = 2 * self._dims + len(_FEATURE_STARTS)
+        self._raw = np.empty((capacity, self._dims))
+        self._expanded = np.empty((capacity, self._width))   # [x², x, m]，x 为标准化后的特征（缺失处为 0），m 每个特征一列
+        self._outcomes = np.empty(capacity, dtype=np.int8)
+        self.payloads: List[object] = []
+        self._mean = np.zeros(len(NUMERIC_FEATURES))
+        self._std = np.ones(len(NUMERIC_FEATURES))
+        self._fitted = 0     # 标准化参数基于多少条案例
+        self._scaled = 0     # 已标准化的行数
+
+    def __len__(self):
+        return len(self.payloads)
+
+    # ---------- 写入 ----------
+
+    def add(self, features: Dict, outcome: Optional[str] = None, payload: object = None) -> int:
+        n = len(self.payloads)
+        if n == len(self._raw):
+            grow = len(self._raw) * 2
+            self._raw = np.resize(self._raw, (grow, self._dims))
+            self._expanded = np.resize(self._expanded, (grow, self._width))
+            self._outcomes = np.resize(self._outcomes, grow)
+        self._raw[n] = _encode(features)
+        self._outcomes[n] = OUTCOMES.index(outcome) if outcome in OUTCOMES else -1
+        self.payloads.append(payload)
+        return n
+
+    def add_trade(self, trade) -> int:
+        """交易记录（Trade），payload 为交易本身"""
+        return self.add(signals_features(trade.technical_signals or {}), trade.outcome, trade)
+
+    def add_result(self, result, outcome: Optional[str] = None, payload: object = None) -> int:
+        return self.add(result_features(result), outcome, result if payload is None else payload)
+
+    @classmethod
+    def from_trades(cls, trades: Iterable) -> "CaseIndex":
+        index = cls()
+        for trade in trades:
+            index.add_trade(trade)
+        return index
+
+    # ---------- 标准化 ----------
+
+    def _refresh(self):
+        n = len(self.payloads)
+        k = len(NUMERIC_FEATURES)
+        if n > self._fitted * REFIT_GROWTH or not self._fitted:
+            numeric = self._raw[:n, :k]
+            with np.errstate(invalid="ignore"):
+                valid = ~np.isnan(numeric)
+                counts = valid.sum(axis=0)
+                mean = np.where(counts > 0, np.nansum(numeric, axis=0) / np.maximum(counts, 1), 0.0)
+                var = np.nansum((numeric - mean) ** 2, axis=0) / np.maximum(counts, 1)
+            std = np.sqrt(var)
+            self._mean, self._std = mean, np.where(std > 0, std, 1.0)
+            self._fitted, self._scaled = n, 0
+        if self._scaled < n:
+            rows = slice(self._scaled, n)
+            x = self._raw[rows].copy()
+            x[:, :k] = (x[:, :k] - self._mean) / self._std
+            missing = np.isnan(x)
+            x[missing] = 0.0
+            # 类别特征的 one-hot 列同时缺失，取每个特征的第一列作掩码
+            self._expanded[rows] = np.hstack([x * x, x, ~missing[:, _FEATURE_STARTS]])
+            self._scaled = n
+
+    # ---------- 查询 ----------
+
+    def query(self, features: Dict, k: int = 3, outcome: Optional[str] = None,
+              min_overlap: float = 0.5) -> List[CaseMatch]:
+        """
+        最相似的 k 个案例（按距离升序）
+        outcome: 只在该结果（good / bad / neutral）的案例中找
+        min_overlap: 案例至少要有查询特征中的这么大比例（按特征计，类别特征算一个），否则不参与排序
+        """
+        n = len(self.payloads)
+        if n == 0:
+            return []
+        self._refresh()
+        q = _encode(features)
+        q[:len(NUMERIC_FEATURES)] = (q[:len(NUMERIC_FEATURES)] - self._mean) / self._std
+        present = ~np.isnan(q)
+        if not present.any():
+            return []
+
+        p = present.astype(float)
+        q = np.where(present, q, 0.0)
+        weights = np.zeros((self._width, 2))
+        # Σm·q² 按特征汇总：每个特征的 m 乘以该特征各列 q² 之和
+        weights[:, 0] = np.concatenate([p, -2 * q, np.add.reduceat(q * q, _FEATURE_STARTS)])
+        weights[2 * self._dims:, 1] = p[_FEATURE_STARTS]
+        d2, counts = (self._expanded[:n] @ weights).T
+        dist = np.sqrt(np.maximum(d2, 0.0) / np.maximum(counts, 1))
+        dist[counts < max(1, min_overlap * p[_FEATURE_STARTS].sum())] = np.inf
+        if outcome is not None:
+            dist[self._outcomes[:n] != (OUTCOMES.index(outcome) if outcome in OUTCOMES else -1)] = np.inf
+
+        k = min(k, n)
+        top = np.argpartition(dist, k - 1)[:k]
+        top = top[np.argsort(dist[top], kind="stable")]
+        return [CaseMatch(float(dist[i]), self._outcome(i), self.payloads[i])
+                for i in top.tolist() if np.isfinite(dist[i])]
+
+    def query_trade_signals(self, signals: Dict, k: int = 3, outcome: Optional[str] = None) -> List[CaseMatch]:
+        return self.query(signals_features(signals), k, outcome)
+
+    def query_result(self, result, k: int = 3, outcome: Optional[str] = None) -> List[CaseMatch]:
+        return self.query(result_features(result), k, outcome)
+
+    def _outcome(self, i: int) -> Optional[str]:
+        code = int(self._outcomes[i])
+        return OUTCOMES[code] if code >= 0 else None
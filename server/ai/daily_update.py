@@ -0,0 +1,323 @@
+"""
+收盘后增量更新
+每只股票在 SQLite 中保存一份 IndicatorState 检查点（EMA、K/D、各滚动窗口），收盘后只需：
+取到当天的新K线 → 从检查点恢复状态 → 推进一步 → 生成 AnalysisResult 写入结果表 → 保存检查点
+每晚的开销与股票数成正比，与历史长度无关
+
+新K线的来源：
+- 检查点恰好落后一个交易日、且快照中的昨收与检查点收盘价一致（没有除权除息）的股票，
+  直接用收盘后的全市场快照（stock_zh_a_spot_em，一次请求）作为当天K线
+- 其余股票（停牌后复牌、漏跑了几天）逐只补拉缺失区间
+- 没有检查点、或检查点之后出现了新的除权除息日（前复权价整体改写）的股票，按回看窗口全量重建
+
+用法:
+    python daily_update.py 300433 600519
+    python daily_update.py --file watchlist.txt --db daily_update.db
+    python daily_update.py --file watchlist.txt --daemon --at 15:40    # 每个交易日收盘后自动运行
+"""
+
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Iterable
+
+import full_analysis as fa
+from full_analysis import (
+    AnalysisResult, KLINE_STORE, TRADING_CALENDAR,
+    CHECK_ABOVE_MA5, CHECK_ABOVE_MA10, CHECK_MACD_RED, CHECK_MACD_EXPANDING,
+    CHECK_RSI_ABOVE_30, CHECK_VOLUME_CALM, CHECK_VOLUME_UP, checklist_score,
+)
+from incremental import IndicatorState
+from lookback import ANALYSIS_LOOKBACK
+from metrics import METRICS
+from quote_feed import parse_spot_rows
+from result_store import ResultTable
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "daily_update.db")
+CLOSE_TIME = "15:00"
+PRICE_TOLERANCE = 0.005   # 快照昨收与检查点收盘价的容差（元），超过视为除权除息
+
+
+# ==================== 检查点 ====================
+
+class CheckpointStore:
+    """指标状态检查点（SQLite，与结果表可以放在同一个文件）"""
+
+    def __init__(self, path: str = DEFAULT_DB, table: str = "indicator_state"):
+        self.path = path
+        self.table = table
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ("
+                             "symbol TEXT PRIMARY KEY, name TEXT, last_date TEXT, ex_date TEXT, state TEXT)")
+        finally:
+            conn.close()
+
+    def load(self, symbols: Iterable[str]) -> Dict[str, Dict]:
+        """{symbol: {"name", "last_date", "ex_date", "state": IndicatorState}}"""
+        symbols = list(symbols)
+        checkpoints = {}
+        conn = sqlite3.connect(self.path)
+        try:
+            for i in range(0, len(symbols), 500):
+                chunk = symbols[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT symbol, name, last_date, ex_date, state FROM {self.table} "
+                    f"WHERE symbol IN ({', '.join('?' * len(chunk))})", chunk)
+                for symbol, name, last_date, ex_date, state in rows:
+                    checkpoints[symbol] = {
+                        "name": name,
+                        "last_date": last_date,
+                        "ex_date": ex_date,
+                        "state": IndicatorState.from_dict(json.loads(state)),
+                    }
+        finally:
+            conn.close()
+        return checkpoints
+
+    def save(self, checkpoints: Dict[str, Dict]):
+        """批量写入（一个事务）"""
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?)",
+                    [(symbol, cp["name"], cp["last_date"], cp["ex_date"], json.dumps(cp["state"].to_dict()))
+                     for symbol, cp in checkpoints.items()])
+        finally:
+            conn.close()
+
+
+# ==================== 由指标状态生成结果 ====================
+
+def result_from_state(symbol: str, name: str, bar: Dict, state: IndicatorState) -> AnalysisResult:
+    """按 full_analysis._evaluate 的规则，由推进到 bar 之后的指标状态生成 AnalysisResult"""
+    snap = state.snapshot()
+    close = bar["close"]
+    ma5, ma10, ma20 = snap["ma5"], snap["ma10"], snap["ma20"]
+    macd_histogram = snap["macd_histogram"]
+    macd_is_red = macd_histogram > 0
+    prev_histogram = snap["macd_prev_histogram"]
+    macd_expanding = prev_histogram is not None and macd_histogram > prev_histogram
+    rsi = snap["rsi"]
+    vol_ratio = snap["vol_ratio"]
+    vol_status = "shrink" if vol_ratio < 0.7 else "expand" if vol_ratio > 1.5 else "normal"
+
+    flags = 0
+    if close > ma5:
+        flags |= CHECK_ABOVE_MA5
+    if close > ma10:
+        flags |= CHECK_ABOVE_MA10
+    if macd_is_red:
+        flags |= CHECK_MACD_RED
+        if macd_expanding:
+            flags |= CHECK_MACD_EXPANDING
+    if rsi > 30:
+        flags |= CHECK_RSI_ABOVE_30
+    if vol_status in ("shrink", "normal"):
+        flags |= CHECK_VOLUME_CALM
+    elif bar["change_pct"] >= 0:
+        flags |= CHECK_VOLUME_UP
+    score = checklist_score(flags)
+    should_sell = snap["macd_cross"] == "dead" or (not close > ma10 and vol_status == "expand")
+
+    return AnalysisResult(
+        symbol=symbol,
+        name=name,
+        date=bar["date"],
+        price=close,
+        change_pct=bar["change_pct"],
+        volume=bar["volume"],
+        ma5=ma5,
+        ma10=ma10,
+        ma20=ma20,
+        is_ma_bullish=ma5 > ma10 > ma20,
+        price_above_ma5=close > ma5,
+        price_above_ma10=close > ma10,
+        price_above_ma20=close > ma20,
+        macd_dif=snap["macd_dif"],
+        macd_dea=snap["macd_dea"],
+        macd_histogram=macd_histogram,
+        macd_is_red=macd_is_red,
+        macd_expanding=macd_expanding,
+        macd_cross=snap["macd_cross"],
+        rsi=rsi,
+        rsi_zone="oversold" if rsi < 30 else "overbought" if rsi > 70 else "normal",
+        kdj_k=snap["kdj_k"],
+        kdj_d=snap["kdj_d"],
+        kdj_j=snap["kdj_j"],
+        kdj_cross=snap["kdj_cross"],
+        vol_ratio=vol_ratio,
+        vol_status=vol_status,
+        not_weakened_score=score,
+        checklist_flags=flags,
+        should_hold=score >= 3,
+        should_sell=should_sell,
+        stop_loss_aggressive=ma5,
+        stop_loss_moderate=ma10,
+        stop_loss_conservative=ma20,
+        recent_high=snap["recent_high"],
+    )
+
+
+# ==================== 更新任务 ====================
+
+def _last_ex_date(symbol: str) -> Optional[str]:
+    fa._refresh_factors(symbol)
+    table = KLINE_STORE.factors(symbol)
+    ex_dates = table.ex_dates() if table else []
+    return ex_dates[-1] if ex_dates else None
+
+
+class DailyUpdater:
+    """收盘后增量更新（检查点与结果写入同一个 SQLite 文件）"""
+
+    def __init__(self, db_path: str = DEFAULT_DB, use_spot: bool = True):
+        self.db_path = db_path
+        self.use_spot = use_spot
+        self.checkpoints = CheckpointStore(db_path)
+
+    def run(self, symbols: List[str], today: Optional[str] = None) -> Dict[str, int]:
+        """更新一批股票，返回各路径的股票数"""
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        stats = {"spot": 0, "fetched": 0, "rebuilt": 0, "unchanged": 0, "failed": 0}
+        checkpoints = self.checkpoints.load(symbols)
+        spot = self._spot_bars(today) if self.use_spot else {}
+        table = ResultTable()
+        updated = {}
+
+        for symbol in symbols:
+            with METRICS.span("daily_update_symbol"):
+                path, cp = self._update_symbol(symbol, checkpoints.get(symbol), spot.get(symbol), today, table)
+            stats[path] += 1
+            if cp is not None:
+                updated[symbol] = cp
+
+        if updated:
+            self.checkpoints.save(updated)
+        if len(table):
+            table.to_sqlite(self.db_path)
+        return stats
+
+    def _spot_bars(self, today: str) -> Dict[str, tuple]:
+        """收盘后的全市场快照：{symbol: (当天K线, 昨收)}；只用于当天，非交易日或未收盘时为空"""
+        now = datetime.now()
+        if today != now.strftime("%Y-%m-%d") or now.strftime("%H:%M") < CLOSE_TIME:
+            return {}
+        if not TRADING_CALENDAR.is_trading_day(today):
+            return {}
+        rows = fa.call_aktools("stock_zh_a_spot_em")
+        bars = {}
+        for symbol, q in parse_spot_rows(rows).items():
+            if q.price == q.price and q.volume > 0:   # 停牌股票没有当天K线
+                bars[symbol] = ({
+                    "date": today, "open": q.open, "close": q.price, "high": q.high, "low": q.low,
+                    "volume": q.volume, "amount": q.amount, "change_pct": q.change_pct,
+                }, q.prev_close)
+        return bars
+
+    def _update_symbol(self, symbol: str, cp: Optional[Dict], spot: Optional[tuple],
+                       today: str, table: ResultTable) -> tuple:
+        """返回 (走的路径, 需要保存的检查点)"""
+        if cp is not None:
+            if cp["last_date"] >= today:
+                return "unchanged", None
+            # 快路径：快照中的当天K线正好接在检查点之后，且昨收一致（没有除权除息）
+            if (spot is not None and cp["last_date"] == TRADING_CALENDAR.previous(today, inclusive=False)
+                    and abs(spot[1] - cp["state"].last_close) <= PRICE_TOLERANCE):
+                bar = spot[0]
+                KLINE_STORE.ingest(symbol, [bar])
+                self._advance(symbol, cp, [bar], table)
+                return "spot", cp
+            ex_date = _last_ex_date(symbol)
+            if ex_date == cp["ex_date"]:
+                bars = self._fetch_after(symbol, cp["last_date"], today)
+                if bars is None:
+                    return "failed", None
+                if not bars:
+                    return "unchanged", None
+                self._advance(symbol, cp, bars, table)
+                return "fetched", cp
+        return self._rebuild(symbol, cp, table)
+
+    def _fetch_after(self, symbol: str, last_date: str, today: str) -> Optional[List[Dict]]:
+        """检查点之后的新K线（前复权；没有新除权时与不复权价相同）"""
+        start = (datetime.strptime(last_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y%m%d")
+        klines = fa._fetch_kline_range(symbol, start, today.replace("-", ""))
+        if klines is None:
+            return None
+        KLINE_STORE.ingest(symbol, klines)
+        return [bar for bar in KLINE_STORE.get_daily(symbol, adjust="qfq") if bar["date"] > last_date]
+
+    def _advance(self, symbol: str, cp: Dict, bars: List[Dict], table: ResultTable):
+        state = cp["state"]
+        for bar in bars:
+            state.update(bar)
+            table.append(result_from_state(symbol, cp["name"], bar, state))
+        cp["last_date"] = state.last_date
+
+    def _rebuild(self, symbol: str, cp: Optional[Dict], table: ResultTable) -> tuple:
+        """没有检查点或出现新的除权除息：按回看窗口全量重建状态（写入检查点之后各根的结果，没有检查点时只写最后一根）"""
+        name = cp["name"] if cp else None
+        if not name:
+            info = fa.get_stock_info(symbol)
+            name = info["name"] if info else ""
+        bars = fa.get_kline_data(symbol, count=ANALYSIS_LOOKBACK.bars)
+        if not bars:
+            return "failed", None
+        since = cp["last_date"] if cp else bars[-2]["date"] if len(bars) > 1 else ""
+        state = IndicatorState()
+        for bar in bars:
+            state.update(bar)
+            if bar["date"] > since:
+                table.append(result_from_state(symbol, name, bar, state))
+        return "rebuilt", {"name": name, "last_date": state.last_date,
+                           "ex_date": _last_ex_date(symbol), "state": state}
+
+
+def run_daily(symbols: List[str], at: str, db_path: str = DEFAULT_DB):
+    """常驻：每个交易日 at（HH:MM）之后运行一次"""
+    done_on = None
+    while True:
+        now = datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        if done_on != today and TRADING_CALENDAR.is_trading_day(today) and now.strftime("%H:%M") >= at:
+            start = time.perf_counter()
+            stats = DailyUpdater(db_path).run(symbols, today)
+            print(f"✅ [{today}] 增量更新 {len(symbols)} 只股票，用时 {time.perf_counter() - start:.1f}s: {stats}")
+            done_on = today
+        time.sleep(60)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="收盘后增量更新")
+    parser.add_argument("symbols", nargs="*")
+    parser.add_argument("--file", help="股票列表文件（每行一个代码）")
+    parser.add_argument("--db", default=DEFAULT_DB, help="检查点与结果的 SQLite 文件")
+    parser.add_argument("--no-spot", action="store_true", help="不使用全市场快照，逐只补拉")
+    parser.add_argument("--daemon", action="store_true", help="常驻，每个交易日收盘后运行")
+    parser.add_argument("--at", default="15:40", help="常驻模式的运行时间")
+    args = parser.parse_args()
+
+    symbols = list(args.symbols)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            symbols += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not symbols:
+        parser.error("请给出股票代码或 --file")
+
+    if args.daemon:
+        run_daily(symbols, args.at, args.db)
+        return
+    start = time.perf_counter()
+    stats = DailyUpdater(args.db, use_spot=not args.no_spot).run(symbols)
+    print(f"✅ 增量更新 {len(symbols)} 只股票，用时 {time.perf_counter() - start:.1f}s: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+数据后端
+所有行情/资料接口都按 AKShare 的函数名 + 参数调用，有两种实现：
+- http: 通过本地 AKTools 服务（默认；DataFrame → JSON → HTTP → dict）
+- akshare: 在本进程内直接调用 akshare 函数，K线 DataFrame 直接按列转成数组，省掉 JSON 序列化和解析
+单机部署时设置环境变量 STOCK_DATA_BACKEND=akshare 即可切换（需要 pip install akshare）
+
+用法:
+    STOCK_DATA_BACKEND=akshare python full_analysis.py 300433
+"""
+
+import os
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+import numpy as np
+import requests
+
+from kline_clean import to_number
+from kline_store import normalize_date
+from metrics import METRICS
+
+BACKEND_ENV = "STOCK_DATA_BACKEND"
+AKTOOLS_URL = os.environ.get("AKTOOLS_URL", "http://127.0.0.1:8081/api/public")
+REQUEST_TIMEOUT = 30
+
+# 日K线字段 → stock_zh_a_hist 的列名
+KLINE_FIELDS = {
+    "date": "日期",
+    "open": "开盘",
+    "close": "收盘",
+    "high": "最高",
+    "low": "最低",
+    "volume": "成交量",
+    "amount": "成交额",
+    "change_pct": "涨跌幅",
+}
+
+
+@dataclass
+class KlineColumns:
+    """按列存放的一段日K线（数值列缺失为 NaN）"""
+    date: List[str]
+    open: np.ndarray
+    close: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    volume: np.ndarray
+    amount: np.ndarray
+    change_pct: np.ndarray
+
+    def __len__(self):
+        return len(self.date)
+
+    def to_klines(self) -> List[Dict]:
+        """转换为 KlineStore 使用的逐根K线"""
+        names = list(KLINE_FIELDS)
+        columns = [self.date] + [getattr(self, f).tolist() for f in names[1:]]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def columns_from_rows(rows: List[Dict]) -> KlineColumns:
+    """AKTools 返回的逐行记录 → 列"""
+    values = {f: [] for f in KLINE_FIELDS}
+    for row in rows:
+        values["date"].append(normalize_date(row.get(KLINE_FIELDS["date"], "")))
+        for f, col in list(KLINE_FIELDS.items())[1:]:
+            values[f].append(to_number(row.get(col)))
+    return KlineColumns(values["date"], *(np.array(values[f], dtype=float) for f in list(KLINE_FIELDS)[1:]))
+
+
+def _frame_column(frame, col: str) -> np.ndarray:
+    if col not in frame.columns:
+        return np.full(len(frame), np.nan)
+    try:
+        return np.asarray(frame[col], dtype=float)
+    except (TypeError, ValueError):
+        return np.array([to_number(v) for v in frame[col].tolist()], dtype=float)
+
+
+def columns_from_frame(frame) -> KlineColumns:
+    """akshare 返回的 DataFrame → 列（不经过逐行 dict）"""
+    date_col = KLINE_FIELDS["date"]
+    dates = [normalize_date(v) for v in frame[date_col].tolist()] if date_col in frame.columns else [""] * len(frame)
+    return KlineColumns(dates, *(_frame_column(frame, col) for col in list(KLINE_FIELDS.values())[1:]))
+
+
+# ==================== 后端 ====================
+
+class DataBackend:
+    """数据后端接口：call 返回逐行记录（失败返回 None），kline_columns 返回按列的K线"""
+
+    name = "base"
+
+    def call(self, endpoint: str, params: Optional[Dict] = None) -> Optional[List[Dict]]:
+        raise NotImplementedError
+
+    def kline_columns(self, endpoint: str, params: Optional[Dict] = None) -> Optional[KlineColumns]:
+        rows = self.call(endpoint, params)
+        return None if rows is None else columns_from_rows(rows)
+
+
+class HttpBackend(DataBackend):
+    """通过 AKTools HTTP 服务取数（复用连接）"""
+
+    name = "http"
+
+    def __init__(self, base_url: str = AKTOOLS_URL, timeout: float = REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def call(self, endpoint: str, params: Optional[Dict] = None) -> Optional[List[Dict]]:
+        try:
+            url = f"{self.base_url}/{endpoint}"
+            with METRICS.span(endpoint, "aktools_request_seconds"):
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+            with METRICS.span("json_parse"):
+                return response.json()
+        except Exception as e:
+            METRICS.inc("aktools_errors_total", endpoint)
+            print(f"   [AKTools Error] {endpoint}: {e}")
+            return None
+
+
+class AkshareBackend(DataBackend):
+    """在进程内直接调用 akshare 函数（接口名、参数与 AKTools 相同）"""
+
+    name = "akshare"
+
+    def __init__(self):
+        try:
+            import akshare
+        except ImportError as e:
+            raise RuntimeError(f"{BACKEND_ENV}=akshare 需要先安装 akshare: pip install akshare") from e
+        self._ak = akshare
+
+    def _frame(self, endpoint: str, params: Optional[Dict]):
+        fn = getattr(self._ak, endpoint, None)
+        if fn is None:
+            METRICS.inc("aktools_errors_total", endpoint)
+            print(f"   [AKShare Error] {endpoint}: 没有这个接口")
+            return None
+        try:
+            with METRICS.span(endpoint, "aktools_request_seconds"):
+                return fn(**(params or {}))
+        except Exception as e:
+            METRICS.inc("aktools_errors_total", endpoint)
+            print(f"   [AKShare Error] {endpoint}: {e}")
+            return None
+
+    def call(self, endpoint: str, params: Optional[Dict] = None) -> Optional[List[Dict]]:
+        frame = self._frame(endpoint, params)
+        if frame is None:
+            return None
+        # 与 AKTools 的 JSON 一致：缺失值为 None
+        return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+    def kline_columns(self, endpoint: str, params: Optional[Dict] = None) -> Optional[KlineColumns]:
+        frame = self._frame(endpoint, params)
+        return None if frame is None else columns_from_frame(frame)
+
+
+BACKENDS = {
+    "http": HttpBackend,
+    "aktools": HttpBackend,
+    "akshare": AkshareBackend,
+}
+
+
+def create_backend(name: Optional[str] = None) -> DataBackend:
+    """按名称（默认读环境变量 STOCK_DATA_BACKEND，未设置时为 http）创建后端"""
+    name = (name or os.environ.get(BACKEND_ENV) or "http").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"未知的数据后端 {name!r}，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
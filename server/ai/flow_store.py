@@ -0,0 +1,279 @@
+"""
+资金流向与龙虎榜本地存储
+个股资金流向：首次按股票回填历史（stock_individual_fund_flow，约 100 个交易日），
+之后每天收盘后用 stock_individual_fund_flow_rank 一次请求更新全市场（落后不止一天的股票重新回填）；
+龙虎榜：按日期区间增量拉取（stock_lhb_detail_em）
+数据按 (股票, 日期) 存储，可按K线日期对齐成数组，评分规则直接读取，不必每只股票再请求一次
+"""
+
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Iterable
+
+import numpy as np
+
+from adjustment import sina_symbol
+from full_analysis import TRADING_CALENDAR, call_aktools
+from kline_clean import to_number
+from kline_store import normalize_date
+
+# 个股资金流向历史的字段
+FUND_FLOW_FIELDS = {
+    "main_net": "主力净流入-净额",
+    "main_pct": "主力净流入-净占比",
+    "super_net": "超大单净流入-净额",
+    "large_net": "大单净流入-净额",
+    "medium_net": "中单净流入-净额",
+    "small_net": "小单净流入-净额",
+}
+# 资金流排行（今日）中对应的字段
+RANK_FIELDS = {name: f"今日{column}" for name, column in FUND_FLOW_FIELDS.items()}
+
+LHB_FIELDS = {
+    "net_buy": "龙虎榜净买额",
+    "buy": "龙虎榜买入额",
+    "sell": "龙虎榜卖出额",
+    "turnover": "龙虎榜成交额",
+}
+LHB_LOOKBACK_DAYS = 30   # 首次拉取龙虎榜的回看天数
+FUND_FLOW_FINAL = "15:30"  # 当天资金流向在此之后才视为收盘定稿
+
+
+class DatedTable:
+    """一只股票按日期升序的记录（按列存储；同一日期后写入的覆盖先写入的）"""
+
+    def __init__(self, fields: Iterable[str]):
+        self.dates: List[str] = []
+        self.columns: Dict[str, list] = {f: [] for f in fields}
+        self._pos: Optional[Dict[str, int]] = None
+
+    def __len__(self):
+        return len(self.dates)
+
+    def upsert(self, date_str: str, values: Dict):
+        i = bisect_left(self.dates, date_str)
+        if i < len(self.dates) and self.dates[i] == date_str:
+            for f, col in self.columns.items():
+                col[i] = values.get(f, col[i])
+            return
+        self.dates.insert(i, date_str)
+        for f, col in self.columns.items():
+            col.insert(i, values.get(f))
+        self._pos = None
+
+    def get(self, date_str: str) -> Optional[Dict]:
+        i = bisect_left(self.dates, date_str)
+        if i < len(self.dates) and self.dates[i] == date_str:
+            return {"date": date_str, **{f: col[i] for f, col in self.columns.items()}}
+        return None
+
+    def aligned(self, dates: List[str], field: str) -> np.ndarray:
+        """按给定日期取某一数值列（没有记录的日期为 NaN）"""
+        if self._pos is None:
+            self._pos = {d: i for i, d in enumerate(self.dates)}
+        col = self.columns[field]
+        pos = self._pos
+        return np.array([col[pos[d]] if d in pos else np.nan for d in dates], dtype=float)
+
+    @property
+    def last_date(self) -> Optional[str]:
+        return self.dates[-1] if self.dates else None
+
+
+class FlowStore:
+    """资金流向 + 龙虎榜存储（进程内，与 KLINE_STORE 相同的生命周期）"""
+
+    def __init__(self):
+        self._flows: Dict[str, DatedTable] = {}
+        self._lhb: Dict[str, DatedTable] = {}
+        self.lhb_through: Optional[str] = None   # 龙虎榜已拉取到的日期
+        self._flow_tried: Dict[str, str] = {}    # 资金流向最近一次尝试补到的交易日（失败、停牌也记）
+
+    # ---------- 写入 ----------
+
+    def _flow_table(self, symbol: str) -> DatedTable:
+        table = self._flows.get(symbol)
+        if table is None:
+            table = self._flows[symbol] = DatedTable(FUND_FLOW_FIELDS)
+        return table
+
+    def ingest_fund_flow(self, symbol: str, rows: List[Dict]) -> int:
+        """写入一只股票的资金流向历史，返回写入的天数"""
+        table = self._flow_table(symbol)
+        n = 0
+        for row in rows or []:
+            date_str = normalize_date(row.get("日期", ""))
+            if date_str:
+                table.upsert(date_str, {f: to_number(row.get(col)) for f, col in FUND_FLOW_FIELDS.items()})
+                n += 1
+        return n
+
+    def ingest_fund_flow_rank(self, rows: List[Dict], date_str: str) -> int:
+        """写入全市场某一天的资金流排行，返回写入的股票数"""
+        n = 0
+        for row in rows or []:
+            symbol = str(row.get("代码", ""))
+            if symbol:
+                self._flow_table(symbol).upsert(date_str, {f: to_number(row.get(col)) for f, col in RANK_FIELDS.items()})
+                n += 1
+        return n
+
+    def mark_flow_tried(self, symbols: Iterable[str], date_str: str):
+        """记录已尝试把这些股票的资金流向补到 date_str（当天不再重复请求）"""
+        for symbol in symbols:
+            self._flow_tried[symbol] = date_str
+
+    def ingest_lhb(self, rows: List[Dict]) -> int:
+        """
+        写入龙虎榜明细，返回写入的 (股票, 日期) 数
+        同一天因多个原因上榜时合并原因，金额取成交额最大的那条
+        """
+        merged: Dict[tuple, Dict] = {}
+        for row in rows or []:
+            symbol = str(row.get("代码", ""))
+            date_str = normalize_date(row.get("上榜日", ""))
+            if not symbol or not date_str:
+                continue
+            values = {f: to_number(row.get(col)) for f, col in LHB_FIELDS.items()}
+            values["reason"] = str(row.get("上榜原因", "") or "")
+            prev = merged.get((symbol, date_str))
+            if prev is not None:
+                reasons = [r for r in (prev["reason"], values["reason"]) if r]
+                if not values["turnover"] > prev["turnover"]:
+                    values = dict(prev)
+                values["reason"] = "; ".join(dict.fromkeys(reasons))
+            merged[(symbol, date_str)] = values
+        for (symbol, date_str), values in merged.items():
+            table = self._lhb.get(symbol)
+            if table is None:
+                table = self._lhb[symbol] = DatedTable(list(LHB_FIELDS) + ["reason"])
+            table.upsert(date_str, values)
+        return len(merged)
+
+    def clear(self, symbol: Optional[str] = None):
+        if symbol is None:
+            self._flows.clear()
+            self._lhb.clear()
+            self._flow_tried.clear()
+            self.lhb_through = None
+        else:
+            self._flows.pop(symbol, None)
+            self._lhb.pop(symbol, None)
+            self._flow_tried.pop(symbol, None)
+
+    # ---------- 读取 ----------
+
+    def fund_flow(self, symbol: str, date_str: str) -> Optional[Dict]:
+        table = self._flows.get(symbol)
+        return table.get(date_str) if table else None
+
+    def lhb(self, symbol: str, date_str: str) -> Optional[Dict]:
+        table = self._lhb.get(symbol)
+        return table.get(date_str) if table else None
+
+    def flow_through(self, symbol: str) -> Optional[str]:
+        table = self._flows.get(symbol)
+        return table.last_date if table else None
+
+    def flow_tried(self, symbol: str) -> Optional[str]:
+        return self._flow_tried.get(symbol)
+
+    def aligned_fund_flow(self, symbol: str, dates: List[str], field: str = "main_net") -> np.ndarray:
+        """与K线日期对齐的资金流向（如主力净流入，单位元；缺失为 NaN）"""
+        table = self._flows.get(symbol)
+        return table.aligned(dates, field) if table else np.full(len(dates), np.nan)
+
+    def aligned_lhb(self, symbol: str, dates: List[str], field: str = "net_buy") -> np.ndarray:
+        """与K线日期对齐的龙虎榜数据（未上榜为 NaN）"""
+        table = self._lhb.get(symbol)
+        return table.aligned(dates, field) if table else np.full(len(dates), np.nan)
+
+    def signals(self, symbol: str, date_str: str) -> Dict:
+        """某一天的资金面信号（与交易记忆中的信号字段一致，如 main_flow: 'in' / 'out'）"""
+        signals = {}
+        flow = self.fund_flow(symbol, date_str)
+        if flow and flow["main_net"] == flow["main_net"]:   # 非 NaN
+            signals["main_flow"] = "in" if flow["main_net"] > 0 else "out"
+            signals["main_net"] = flow["main_net"]
+        entry = self.lhb(symbol, date_str)
+        if entry:
+            signals["lhb_net_buy"] = entry["net_buy"]
+        return signals
+
+    def on_lhb(self, symbol: str, dates: List[str]) -> np.ndarray:
+        """各日期是否上了龙虎榜"""
+        return ~np.isnan(self.aligned_lhb(symbol, dates, "turnover"))
+
+
+# 进程内全局存储
+FLOW_STORE = FlowStore()
+
+
+# ==================== 增量更新 ====================
+
+def _last_closed_day(close_time: str) -> Optional[str]:
+    """数据已经定稿的最近交易日：当天在 close_time 之后才算，否则取上一个交易日"""
+    today = date.today().isoformat()
+    if TRADING_CALENDAR.is_trading_day(today) and datetime.now().strftime("%H:%M") >= close_time:
+        return today
+    return TRADING_CALENDAR.previous(today, inclusive=False)
+
+
+def refresh_fund_flow(symbols: List[str], store: FlowStore = FLOW_STORE) -> Dict[str, int]:
+    """
+    更新资金流向：没有历史或落后不止一个交易日的股票逐只回填（历史接口覆盖中间缺的日子），
+    只差当天的股票用一次全市场排行请求补上；排行是"今日"实时数据，收盘后（FUND_FLOW_FINAL）才写入。
+    每只股票每个交易日只尝试一次：回填失败、停牌（排行里没有）的股票当天不再重复请求。
+    会访问网络，放在定时任务里批量调用，不要放在交互请求的路径上
+    返回 {"backfilled": 回填股票数, "ranked": 排行写入股票数}
+    """
+    latest = _last_closed_day(FUND_FLOW_FINAL)
+    if not latest:
+        return {"backfilled": 0, "ranked": 0}
+    day_before = TRADING_CALENDAR.previous(latest, inclusive=False)
+    ranked_today = latest == date.today().isoformat()
+    stats = {"backfilled": 0, "ranked": 0}
+    stale = []
+    for symbol in symbols:
+        through = store.flow_through(symbol)
+        if (through is not None and through >= latest) or store.flow_tried(symbol) == latest:
+            continue
+        if through is None or not ranked_today or (day_before and through < day_before):
+            rows = call_aktools("stock_individual_fund_flow", {"stock": symbol, "market": sina_symbol(symbol)[:2]})
+            # 盘中历史接口也带着当天的实时行，未定稿的不写入
+            rows = [row for row in rows or [] if normalize_date(row.get("日期", "")) <= latest]
+            if rows and store.ingest_fund_flow(symbol, rows):
+                stats["backfilled"] += 1
+            store.mark_flow_tried([symbol], latest)
+        else:
+            stale.append(symbol)
+    if stale:
+        rows = call_aktools("stock_individual_fund_flow_rank", {"indicator": "今日"})
+        stats["ranked"] = store.ingest_fund_flow_rank(rows, latest)
+        store.mark_flow_tried(stale, latest)
+    return stats
+
+
+def refresh_lhb(end_date: Optional[str] = None, store: FlowStore = FLOW_STORE) -> int:
+    """从上次拉取到的日期之后增量拉取龙虎榜（首次回看 LHB_LOOKBACK_DAYS 天），返回写入的条数"""
+    end_date = end_date or date.today().isoformat()
+    if store.lhb_through:
+        start = (datetime.strptime(store.lhb_through, "%Y-%m-%d") + timedelta(days=1)).date().isoformat()
+    else:
+        start = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=LHB_LOOKBACK_DAYS)).date().isoformat()
+    if start > end_date:
+        return 0
+    rows = call_aktools("stock_lhb_detail_em", {
+        "start_date": start.replace("-", ""),
+        "end_date": end_date.replace("-", ""),
+    })
+    if rows is None:
+        return 0
+    n = store.ingest_lhb(rows)
+    # 当天的龙虎榜盘后才公布，只把已收盘的交易日记为已拉取
+    today = date.today().isoformat()
+    if end_date < today or datetime.now().strftime("%H:%M") >= "18:00":
+        store.lhb_through = end_date
+    else:
+        store.lhb_through = max(store.lhb_through or "", TRADING_CALENDAR.previous(today, inclusive=False) or "") or None
+    return n
@@ -4,18 +4,109 @@
 """
 
 import json
-import requests
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 
-AKTOOLS_URL = "http://127.0.0.1:8081/api/public"
+from adjustment import parse_factor_rows, sina_symbol
+from data_backend import create_backend
+from kline_store import KlineStore, DateIndex, normalize_date
+from lookback import ANALYSIS_LOOKBACK
+from metrics import METRICS
+from report_renderer import render_report
+from resample import parse_timeframe, timeframe_span
+from sector import SectorIndex, fetch_industry_map
+from trade_calendar import TradingCalendar
+
+# 数据后端（AKTools HTTP 或进程内 akshare，由环境变量 STOCK_DATA_BACKEND 选择）
+DATA_BACKEND = create_backend()
+
+# 进程内日K缓存：同一股票的多次分析、多周期分析共用一份数据（N日K按交易日历的序号分组）
+KLINE_STORE = KlineStore(day_index=lambda d: TRADING_CALENDAR.day_index(d))
+
+# 沪深交易日历（首次使用时加载，本地缓存）
+TRADING_CALENDAR = TradingCalendar(lambda: call_aktools("tool_trade_date_hist_sina"))
+SECTOR_INDEX = SectorIndex(lambda: fetch_industry_map(call_aktools))
 
 # ==================== 数据结构 ====================
 
-@dataclass
+# "没走弱"检查清单的位标志（清单文字只在需要时由 render_checklist 生成）
+CHECK_ABOVE_MA5 = 1 << 0
+CHECK_ABOVE_MA10 = 1 << 1
+CHECK_MACD_RED = 1 << 2
+CHECK_MACD_EXPANDING = 1 << 3
+CHECK_RSI_ABOVE_30 = 1 << 4
+CHECK_VOLUME_CALM = 1 << 5   # 缩量/正常
+CHECK_VOLUME_UP = 1 << 6     # 放量上涨
+
+# 计分项（第5项缩量/正常或放量上涨都算满足）
+SCORED_CHECKS = (CHECK_ABOVE_MA5, CHECK_ABOVE_MA10, CHECK_MACD_RED,
+                 CHECK_RSI_ABOVE_30, CHECK_VOLUME_CALM | CHECK_VOLUME_UP)
+
+def checklist_score(flags: int) -> int:
+    """清单得分（满分5分）"""
+    return sum(1 for bits in SCORED_CHECKS if flags & bits)
+
+def render_checklist(flags: int, rsi: float, vol_status: str) -> List[str]:
+    """把清单位标志渲染为文字"""
+    items = []
+    items.append("✅ 收盘价在MA5之上" if flags & CHECK_ABOVE_MA5 else "❌ 收盘价跌破MA5")
+    items.append("✅ 收盘价在MA10之上" if flags & CHECK_ABOVE_MA10 else "❌ 收盘价跌破MA10")
+    if flags & CHECK_MACD_RED:
+        items.append("✅ MACD红柱存在且扩大" if flags & CHECK_MACD_EXPANDING else "✅ MACD红柱存在（但在缩小）")
+    else:
+        items.append("❌ MACD已转绿柱")
+    if flags & CHECK_RSI_ABOVE_30:
+        items.append(f"✅ RSI={rsi:.0f} 在30以上")
+    else:
+        items.append(f"❌ RSI={rsi:.0f} 处于超卖区")
+    if flags & CHECK_VOLUME_CALM:
+        items.append(f"✅ 成交量{vol_status}（无砸盘迹象）")
+    elif flags & CHECK_VOLUME_UP:
+        items.append(f"✅ 放量上涨（资金进场）")
+    else:
+        items.append(f"❌ 放量下跌（有资金离场）")
+    return items
+
+def build_entry_suggestions(ma5: float, ma10: float, ma20: float,
+                            close: float, recent_high: float) -> List[Dict]:
+    """分批进场建议"""
+    return [
+        # 第一笔：回踩MA5
+        {
+            "batch": 1,
+            "position": "30-40%",
+            "trigger": f"回踩MA5({ma5:.2f}元)但缩量",
+            "entry_price": ma5,
+            "stop_loss": ma10,
+            "target": close * 1.1,
+        },
+        # 第二笔：回踩MA10
+        {
+            "batch": 2,
+            "position": "35-40%",
+            "trigger": f"回踩MA10({ma10:.2f}元)但收不破",
+            "entry_price": ma10,
+            "stop_loss": ma20,
+            "target": close * 1.15,
+        },
+        # 第三笔：突破新高
+        {
+            "batch": 3,
+            "position": "20-30%",
+            "trigger": f"突破近期高点({recent_high:.2f}元)",
+            "entry_price": recent_high,
+            "stop_loss": ma5,
+            "target": recent_high * 1.1,
+        },
+    ]
+
+@dataclass(slots=True)
 class AnalysisResult:
-    """分析结果"""
+    """
+    分析结果
+    使用 __slots__ 节省内存；检查清单以位标志保存，清单文字和进场建议按需生成
+    """
     symbol: str
     name: str
     date: str
@@ -58,7 +149,7 @@ class AnalysisResult:
     
     # 综合判断
     not_weakened_score: int  # "没走弱"得分（满分5分）
-    not_weakened_items: List[str]  # 满足的条件
+    checklist_flags: int  # 检查清单位标志（CHECK_*）
     should_hold: bool  # 是否应该持有
     should_sell: bool  # 是否应该卖出
     
@@ -67,22 +158,28 @@ class AnalysisResult:
     stop_loss_moderate: float    # 稳健止损（MA10）
     stop_loss_conservative: float  # 保守止损（MA20）
     
-    # 分批进场建议
-    entry_suggestions: List[Dict]
+    # 近20日最高价（第三笔进场价）
+    recent_high: float
+    
+    @property
+    def not_weakened_items(self) -> List[str]:
+        """满足的条件（按需渲染）"""
+        return render_checklist(self.checklist_flags, self.rsi, self.vol_status)
+    
+    @property
+    def entry_suggestions(self) -> List[Dict]:
+        """分批进场建议（按需生成）"""
+        if not self.should_hold or self.should_sell:
+            return []
+        return build_entry_suggestions(self.ma5, self.ma10, self.ma20, self.price, self.recent_high)
 
 # ==================== API 调用 ====================
 
 def call_aktools(endpoint: str, params: dict = None) -> dict:
-    """调用 AKTools API"""
-    try:
-        url = f"{AKTOOLS_URL}/{endpoint}"
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"   [AKTools Error] {endpoint}: {e}")
-        return None
+    """调用数据接口（经由 DATA_BACKEND）"""
+    return DATA_BACKEND.call(endpoint, params)
 
+@METRICS.timed("get_stock_info")
 def get_stock_info(symbol: str) -> dict:
     """获取股票基本信息"""
     data = call_aktools("stock_individual_info_em", {"symbol": symbol})
@@ -90,6 +187,7 @@ def get_stock_info(symbol: str) -> dict:
         info = {}
         for item in data:
             info[item.get("item")] = item.get("value")
+        SECTOR_INDEX.record(symbol, info.get("行业", ""))
         return {
             "symbol": symbol,
             "name": info.get("股票简称", ""),
@@ -98,40 +196,76 @@ def get_stock_info(symbol: str) -> dict:
         }
     return None
 
-def get_kline_data(symbol: str, count: int = 120) -> list:
-    """获取K线数据"""
-    end_date = datetime.now().strftime("%Y%m%d")
-    start_date = (datetime.now() - timedelta(days=count * 2)).strftime("%Y%m%d")
-    
-    data = call_aktools("stock_zh_a_hist", {
+def _fetch_kline_range(symbol: str, start_date: str, end_date: str) -> Optional[list]:
+    """拉取指定区间的不复权日K线（失败返回 None；复权由本地因子表完成）"""
+    columns = DATA_BACKEND.kline_columns("stock_zh_a_hist", {
         "symbol": symbol,
         "period": "daily",
         "start_date": start_date,
         "end_date": end_date,
-        "adjust": "qfq"
+        "adjust": ""
     })
+    return None if columns is None else columns.to_klines()
+
+def _refresh_factors(symbol: str):
+    """每天刷新一次复权因子表（除权除息只影响这张小表）"""
+    if KLINE_STORE.factors_fresh(symbol):
+        return
+    rows = call_aktools("stock_zh_a_daily", {"symbol": sina_symbol(symbol), "adjust": "hfq-factor"})
+    table = parse_factor_rows(rows)
+    if table is None:
+        # 记下失败，当天不再重复请求；降级的复权口径见 KLINE_STORE.quality(symbol)["adjust"]
+        KLINE_STORE.mark_factors_failed(symbol)
+        state = "沿用旧的复权因子" if KLINE_STORE.factors(symbol) is not None else "暂按不复权计算"
+        print(f"   ⚠️ 无法获取 {symbol} 的复权因子，{state}")
+        return
+    had_factors = KLINE_STORE.factors(symbol) is not None
+    if KLINE_STORE.set_factors(symbol, table) and had_factors:
+        print(f"   🔄 {symbol} 复权因子有更新（除权除息），已重算复权价，无需重新下载K线")
+
+@METRICS.timed("get_kline_data")
+def get_kline_data(symbol: str, count: int = ANALYSIS_LOOKBACK.bars, adjust: str = "qfq", as_of: str = None) -> list:
+    """
+    获取最近 count 个交易日的K线数据（按交易日历精确计算起始日）
+    优先读取本地缓存，只向上游补拉缺失的区间（更早的历史或最新的几根）
+    本地存不复权K线，adjust='qfq'|'hfq'|'none' 的视图由复权因子即时计算；
+    as_of 指定前复权基准日（按历史日期回测时使用当时的复权价）
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    end_date = today.replace('-', '')
+    start_iso = TRADING_CALENDAR.start_for(count, today)
+    if adjust != "none":
+        # 先刷新复权因子：入库清洗要用它判断除权日的价格跳变
+        _refresh_factors(symbol)
+    
+    if KLINE_STORE.covers(symbol, start_iso):
+        METRICS.inc("cache_hits_total", "kline")
+    else:
+        METRICS.inc("cache_misses_total", "kline")
+        covered_from = KLINE_STORE.covered_from(symbol)
+        cached = KLINE_STORE.get_daily(symbol)
+        if covered_from and KLINE_STORE.is_fresh(symbol):
+            # 最新数据已有，只补更早的历史
+            backfill_end = datetime.strptime(covered_from, "%Y-%m-%d") - timedelta(days=1)
+            klines = _fetch_kline_range(symbol, start_iso.replace('-', ''), backfill_end.strftime("%Y%m%d"))
+        elif covered_from and covered_from <= start_iso and cached:
+            # 历史已有，只拉最后一根之后（含最后一根，盘中会变）的数据
+            klines = _fetch_kline_range(symbol, cached[-1]['date'].replace('-', ''), end_date)
+        else:
+            klines = _fetch_kline_range(symbol, start_iso.replace('-', ''), end_date)
+        if klines is None:
+            return []
+        holidays = None if TRADING_CALENDAR.fallback else TRADING_CALENDAR.holidays(start_iso, today)
+        cleaned = KLINE_STORE.ingest(symbol, klines, holidays=holidays)
+        if not cleaned.ok:
+            print(f"   ⚠️ 数据清洗 {symbol}: {cleaned.summary()}")
+        KLINE_STORE.mark_fetched(symbol, start_iso)
     
-    if data:
-        klines = []
-        for item in data:
-            date_str = item.get("日期", "")
-            if 'T' in str(date_str):
-                date_str = str(date_str).split('T')[0]
-            klines.append({
-                "date": date_str,
-                "open": float(item.get("开盘", 0)),
-                "close": float(item.get("收盘", 0)),
-                "high": float(item.get("最高", 0)),
-                "low": float(item.get("最低", 0)),
-                "volume": float(item.get("成交量", 0)),
-                "amount": float(item.get("成交额", 0)),
-                "change_pct": float(item.get("涨跌幅", 0)),
-            })
-        return klines
-    return []
+    return KLINE_STORE.get_daily(symbol, start_iso, adjust, as_of)
 
 # ==================== 技术指标计算 ====================
 
+@METRICS.timed("calculate_ma")
 def calculate_ma(closes: list, period: int) -> list:
     """计算移动平均线"""
     if len(closes) < period:
@@ -145,6 +279,7 @@ def calculate_ma(closes: list, period: int) -> list:
             result.append(sum(closes[i-period+1:i+1]) / period)
     return result
 
+@METRICS.timed("calculate_ema")
 def calculate_ema(data: list, period: int) -> list:
     """计算指数移动平均"""
     if not data:
@@ -155,6 +290,7 @@ def calculate_ema(data: list, period: int) -> list:
         result.append((data[i] - result[-1]) * multiplier + result[-1])
     return result
 
+@METRICS.timed("calculate_rsi")
 def calculate_rsi(closes: list, period: int = 14) -> float:
     """计算 RSI"""
     if len(closes) < period + 1:
@@ -181,6 +317,7 @@ def calculate_rsi(closes: list, period: int = 14) -> float:
     rs = avg_gain / avg_loss
     return round(100 - (100 / (1 + rs)), 2)
 
+@METRICS.timed("calculate_macd")
 def calculate_macd(closes: list, fast=12, slow=26, signal=9) -> Tuple[list, list, list]:
     """计算 MACD"""
     if len(closes) < slow:
@@ -195,6 +332,7 @@ def calculate_macd(closes: list, fast=12, slow=26, signal=9) -> Tuple[list, list
     
     return dif_list, dea_list, histogram
 
+@METRICS.timed("calculate_kdj")
 def calculate_kdj(highs: list, lows: list, closes: list, n=9) -> Tuple[list, list, list]:
     """计算 KDJ"""
     if len(closes) < n:
@@ -231,16 +369,86 @@ def calculate_kdj(highs: list, lows: list, closes: list, n=9) -> Tuple[list, lis
     
     return k_list, d_list, j_list
 
+@METRICS.timed("calculate_rsi_series")
+def calculate_rsi_series(closes: list, period: int = 14) -> list:
+    """计算 RSI 序列（第 i 项等于 calculate_rsi(closes[:i+1])）"""
+    gains = []
+    losses = []
+    for i in range(1, len(closes)):
+        change = closes[i] - closes[i-1]
+        if change > 0:
+            gains.append(change)
+            losses.append(0)
+        else:
+            gains.append(0)
+            losses.append(abs(change))
+    
+    result = []
+    for i in range(len(closes)):
+        if i < period:
+            result.append(50.0)
+            continue
+        avg_gain = sum(gains[i-period:i]) / period
+        avg_loss = sum(losses[i-period:i]) / period
+        if avg_loss == 0:
+            result.append(100.0)
+        else:
+            result.append(round(100 - (100 / (1 + avg_gain / avg_loss)), 2))
+    return result
+
+class IndicatorSeries:
+    """
+    整段K线的指标序列，只计算一次，供多个分析日期共享
+    *_tail(idx) 返回截至 idx 的末尾两项，与对 klines[:idx+1] 重新计算的结果一致
+    """
+    
+    def __init__(self, klines: list):
+        self.closes = [k['close'] for k in klines]
+        self.highs = [k['high'] for k in klines]
+        self.lows = [k['low'] for k in klines]
+        self.volumes = [k['volume'] for k in klines]
+        self.ma = {p: calculate_ma(self.closes, p) for p in (5, 10, 20)}
+        self.dif, self.dea, self.histogram = calculate_macd(self.closes)
+        self.k, self.d, self.j = calculate_kdj(self.highs, self.lows, self.closes)
+        self.rsi = calculate_rsi_series(self.closes)
+    
+    def ma_at(self, period: int, idx: int) -> float:
+        if idx + 1 < period:
+            return self.closes[idx]
+        return self.ma[period][idx]
+    
+    def macd_tail(self, idx: int, slow: int = 26) -> Tuple[list, list, list]:
+        if idx + 1 < slow:
+            return [0], [0], [0]
+        lo = max(0, idx - 1)
+        return self.dif[lo:idx + 1], self.dea[lo:idx + 1], self.histogram[lo:idx + 1]
+    
+    def kdj_tail(self, idx: int, n: int = 9) -> Tuple[list, list, list]:
+        if idx + 1 < n:
+            return [50], [50], [50]
+        i = idx - (n - 1)
+        lo = max(0, i - 1)
+        return self.k[lo:i + 1], self.d[lo:i + 1], self.j[lo:i + 1]
+
 # ==================== 核心分析逻辑 ====================
 
-def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResult]:
+def analyze_stock(symbol: str, target_date: str = None, timeframe: str = "daily") -> Optional[AnalysisResult]:
     """
     完整股票分析
     基于 stock-trading-analysis-guide.md 的所有规则
+    timeframe: 'daily' | 'weekly' | 'monthly' | 'Nd'，非日K由本地日K重采样得到，不额外请求网络
+    """
+    return analyze_dates(symbol, [target_date], timeframe)[0]
+
+def analyze_dates(symbol: str, dates: List[Optional[str]], timeframe: str = "daily") -> List[Optional[AnalysisResult]]:
     """
+    多日期分析：只获取一次数据、只计算一次指标序列，按日期索引逐个评估
+    dates 中的 None 表示最新交易日；找不到的日期对应位置返回 None
+    """
+    kind, _ = parse_timeframe(timeframe)
     
     print(f"\n{'='*60}")
-    print(f"📊 分析 {symbol}")
+    print(f"📊 分析 {symbol}" + (f" [{timeframe}]" if kind != "daily" else ""))
     print(f"{'='*60}")
     
     # 获取股票信息
@@ -248,54 +456,67 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
     stock_info = get_stock_info(symbol)
     if not stock_info:
         print("❌ 无法获取股票信息")
-        return None
+        return [None] * len(dates)
     print(f"   ✅ {stock_info['name']}({symbol})")
     
-    # 获取K线数据
+    # 获取K线数据：指标收敛所需的预热根数 + 最早分析日期以来的交易日（周/月K按周期长度放大）
     print("\n🔍 获取K线数据...")
-    klines = get_kline_data(symbol, count=120)
+    today = datetime.now().strftime("%Y-%m-%d")
+    earliest = min((normalize_date(d) for d in dates if d), default=None)
+    history = TRADING_CALENDAR.count_between(earliest, today) if earliest else 0
+    # 按历史日期分析时以当时为前复权基准（多个日期取最晚的一个；前复权只是整体缩放，指标信号不变）
+    as_of = max(normalize_date(d) for d in dates) if dates and all(dates) else None
+    klines = get_kline_data(symbol, count=ANALYSIS_LOOKBACK.scaled(timeframe_span(timeframe)).bars + history,
+                            as_of=as_of)
     if not klines:
         print("❌ 无法获取K线数据")
-        return None
+        return [None] * len(dates)
     print(f"   ✅ {len(klines)} 条K线数据")
     
-    # 确定分析日期
-    if target_date:
-        # 找到目标日期的索引
-        target_idx = None
-        for i, k in enumerate(klines):
-            if k['date'] == target_date:
-                target_idx = i
-                break
-        if target_idx is None:
-            print(f"❌ 未找到 {target_date} 的数据")
-            return None
-    else:
-        target_idx = len(klines) - 1
-        target_date = klines[target_idx]['date']
-    
+    index = DateIndex(klines)
+    series = IndicatorSeries(klines) if kind == "daily" else None
+    
+    results = []
+    for target_date in dates:
+        # 确定分析日期
+        if target_date:
+            target_idx = index.get(target_date)
+            if target_idx is None:
+                print(f"❌ 未找到 {target_date} 的数据")
+                results.append(None)
+                continue
+        else:
+            target_idx = len(klines) - 1
+            target_date = klines[target_idx]['date']
+        
+        if kind == "daily":
+            bars, bar_series = klines, series
+        else:
+            # 截至分析日期的周期K线（分析日期所在周期按已有日K部分聚合）
+            bars = KLINE_STORE.get_timeframe(symbol, timeframe, as_of=target_date)
+            bar_series = IndicatorSeries(bars)
+            target_idx = len(bars) - 1
+            print(f"   ✅ 重采样为 {len(bars)} 根{timeframe}K线" + ("（最后一根未完成）" if bars[-1]['partial'] else ""))
+        
+        results.append(_evaluate(stock_info, bars, bar_series, target_idx, target_date))
+    return results
+
+@METRICS.timed("evaluate")
+def _evaluate(stock_info: dict, klines: list, series: IndicatorSeries,
+              target_idx: int, target_date: str) -> AnalysisResult:
+    """在 target_idx 处按全部规则评估（只读取共享的指标序列）"""
+    symbol = stock_info['symbol']
     print(f"\n📅 分析日期: {target_date}")
     
-    # 使用到目标日期为止的数据
-    data = klines[:target_idx + 1]
     today = klines[target_idx]
     
-    closes = [k['close'] for k in data]
-    highs = [k['high'] for k in data]
-    lows = [k['low'] for k in data]
-    volumes = [k['volume'] for k in data]
-    
-    # ========== 计算所有指标 ==========
+    # ========== 读取所有指标 ==========
     print("\n🧮 计算技术指标...")
     
     # 均线
-    ma5_list = calculate_ma(closes, 5)
-    ma10_list = calculate_ma(closes, 10)
-    ma20_list = calculate_ma(closes, 20)
-    
-    ma5 = ma5_list[-1]
-    ma10 = ma10_list[-1]
-    ma20 = ma20_list[-1]
+    ma5 = series.ma_at(5, target_idx)
+    ma10 = series.ma_at(10, target_idx)
+    ma20 = series.ma_at(20, target_idx)
     
     is_ma_bullish = ma5 > ma10 > ma20
     price_above_ma5 = today['close'] > ma5
@@ -306,7 +527,7 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
     print(f"   多头排列: {'✅ 是' if is_ma_bullish else '❌ 否'}")
     
     # MACD
-    dif_list, dea_list, histogram_list = calculate_macd(closes)
+    dif_list, dea_list, histogram_list = series.macd_tail(target_idx)
     macd_dif = dif_list[-1]
     macd_dea = dea_list[-1]
     macd_histogram = histogram_list[-1]
@@ -333,7 +554,7 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
         print(f"   🔴🔴🔴 MACD 死叉！")
     
     # RSI
-    rsi = calculate_rsi(closes)
+    rsi = series.rsi[target_idx]
     if rsi < 30:
         rsi_zone = "oversold"
     elif rsi > 70:
@@ -344,7 +565,7 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
     print(f"   RSI(14)={rsi} ({'超卖' if rsi_zone == 'oversold' else '超买' if rsi_zone == 'overbought' else '正常'})")
     
     # KDJ
-    k_list, d_list, j_list = calculate_kdj(highs, lows, closes)
+    k_list, d_list, j_list = series.kdj_tail(target_idx)
     kdj_k = k_list[-1] if k_list else 50
     kdj_d = d_list[-1] if d_list else 50
     kdj_j = j_list[-1] if j_list else 50
@@ -364,7 +585,8 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
         print(f"   🔴🔴🔴 KDJ 死叉！")
     
     # 成交量
-    vol_avg_5 = sum(volumes[-5:]) / 5 if len(volumes) >= 5 else volumes[-1]
+    volumes = series.volumes[max(0, target_idx - 4):target_idx + 1]
+    vol_avg_5 = sum(volumes) / 5 if len(volumes) >= 5 else volumes[-1]
     vol_ratio = today['volume'] / vol_avg_5 if vol_avg_5 > 0 else 1
     
     if vol_ratio < 0.7:
@@ -379,50 +601,29 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
     # ========== "没走弱"判定（5项检查清单）==========
     print("\n📋 '没走弱'判定清单:")
     
-    not_weakened_items = []
-    not_weakened_score = 0
-    
+    checklist_flags = 0
     # 1. 收盘价是否在MA5之上？
     if price_above_ma5:
-        not_weakened_items.append("✅ 收盘价在MA5之上")
-        not_weakened_score += 1
-    else:
-        not_weakened_items.append("❌ 收盘价跌破MA5")
-    
+        checklist_flags |= CHECK_ABOVE_MA5
     # 2. 收盘价是否在MA10之上？
     if price_above_ma10:
-        not_weakened_items.append("✅ 收盘价在MA10之上")
-        not_weakened_score += 1
-    else:
-        not_weakened_items.append("❌ 收盘价跌破MA10")
-    
+        checklist_flags |= CHECK_ABOVE_MA10
     # 3. MACD红柱是否存在？
     if macd_is_red:
+        checklist_flags |= CHECK_MACD_RED
         if macd_expanding:
-            not_weakened_items.append("✅ MACD红柱存在且扩大")
-        else:
-            not_weakened_items.append("✅ MACD红柱存在（但在缩小）")
-        not_weakened_score += 1
-    else:
-        not_weakened_items.append("❌ MACD已转绿柱")
-    
+            checklist_flags |= CHECK_MACD_EXPANDING
     # 4. RSI是否在30以上？
     if rsi > 30:
-        not_weakened_items.append(f"✅ RSI={rsi:.0f} 在30以上")
-        not_weakened_score += 1
-    else:
-        not_weakened_items.append(f"❌ RSI={rsi:.0f} 处于超卖区")
-    
-    # 5. 成交量是否正常/缩量？（缩量回调是好信号）
+        checklist_flags |= CHECK_RSI_ABOVE_30
+    # 5. 成交量是否正常/缩量？（缩量回调是好信号；放量上涨也算资金进场）
     if vol_status in ["shrink", "normal"]:
-        not_weakened_items.append(f"✅ 成交量{vol_status}（无砸盘迹象）")
-        not_weakened_score += 1
-    else:
-        if today['change_pct'] < 0:
-            not_weakened_items.append(f"❌ 放量下跌（有资金离场）")
-        else:
-            not_weakened_items.append(f"✅ 放量上涨（资金进场）")
-            not_weakened_score += 1
+        checklist_flags |= CHECK_VOLUME_CALM
+    elif today['change_pct'] >= 0:
+        checklist_flags |= CHECK_VOLUME_UP
+    
+    not_weakened_score = checklist_score(checklist_flags)
+    not_weakened_items = render_checklist(checklist_flags, rsi, vol_status)
     
     for item in not_weakened_items:
         print(f"   {item}")
@@ -493,39 +694,10 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
     print(f"   保守止损（MA20）: {stop_loss_conservative:.2f}元")
     
     # ========== 分批进场建议 ==========
+    recent_high = max(series.highs[max(0, target_idx - 19):target_idx + 1])
     entry_suggestions = []
-    
     if should_hold and not should_sell:
-        # 第一笔：回踩MA5
-        entry_suggestions.append({
-            "batch": 1,
-            "position": "30-40%",
-            "trigger": f"回踩MA5({ma5:.2f}元)但缩量",
-            "entry_price": ma5,
-            "stop_loss": ma10,
-            "target": today['close'] * 1.1,
-        })
-        
-        # 第二笔：回踩MA10
-        entry_suggestions.append({
-            "batch": 2,
-            "position": "35-40%",
-            "trigger": f"回踩MA10({ma10:.2f}元)但收不破",
-            "entry_price": ma10,
-            "stop_loss": ma20,
-            "target": today['close'] * 1.15,
-        })
-        
-        # 第三笔：突破新高
-        recent_high = max([k['high'] for k in data[-20:]])
-        entry_suggestions.append({
-            "batch": 3,
-            "position": "20-30%",
-            "trigger": f"突破近期高点({recent_high:.2f}元)",
-            "entry_price": recent_high,
-            "stop_loss": ma5,
-            "target": recent_high * 1.1,
-        })
+        entry_suggestions = build_entry_suggestions(ma5, ma10, ma20, today['close'], recent_high)
     
     print(f"\n📈 分批进场建议:")
     if entry_suggestions:
@@ -565,107 +737,24 @@ def analyze_stock(symbol: str, target_date: str = None) -> Optional[AnalysisResu
         vol_ratio=vol_ratio,
         vol_status=vol_status,
         not_weakened_score=not_weakened_score,
-        not_weakened_items=not_weakened_items,
+        checklist_flags=checklist_flags,
         should_hold=should_hold,
         should_sell=should_sell,
         stop_loss_aggressive=stop_loss_aggressive,
         stop_loss_moderate=stop_loss_moderate,
         stop_loss_conservative=stop_loss_conservative,
-        entry_suggestions=entry_suggestions,
+        recent_high=recent_high,
     )
     
     return result
 
-def generate_report(result: AnalysisResult) -> str:
-    """生成标准分析报告"""
-    
-    report = f"""
-{'━'*60}
-【日期】{result.date}
-【股票】{result.name} {result.symbol}
-{'━'*60}
-
-一、日K面技术面评估
-
-1.1 趋势判定
-├─ MA系统：MA5({result.ma5:.2f}) {'>' if result.is_ma_bullish else '<'} MA10({result.ma10:.2f}) {'>' if result.ma10 > result.ma20 else '<'} MA20({result.ma20:.2f})
-│  → {'✅ 多头排列' if result.is_ma_bullish else '❌ 非多头排列'}
-├─ 收盘价位置：{result.price:.2f}元
-│  → 在MA5 {'上方' if result.price_above_ma5 else '下方'} | 在MA10 {'上方' if result.price_above_ma10 else '下方'}
-├─ MACD状态：{'🟢 红柱' if result.macd_is_red else '🔴 绿柱'} {'扩大中' if result.macd_expanding else '缩小中'}
-│  → DIF={result.macd_dif:.4f}, DEA={result.macd_dea:.4f}
-└─ 结论：{'✅ 没走弱，可考虑持有/回补' if result.should_hold else '❌ 有走弱信号，谨慎'}
-
-1.2 支撑压力位
-├─ 激进止损位（MA5）：{result.stop_loss_aggressive:.2f}元
-├─ 稳健止损位（MA10）：{result.stop_loss_moderate:.2f}元
-└─ 保守止损位（MA20）：{result.stop_loss_conservative:.2f}元
-
-1.3 成交量分析
-├─ 量比：{result.vol_ratio:.2f}
-└─ 评价：{'📉 缩量' if result.vol_status == 'shrink' else '📈 放量' if result.vol_status == 'expand' else '➖ 正常'}
-
-{'━'*60}
-
-二、动能指标评估
-
-2.1 RSI(14)
-└─ 当前值：{result.rsi:.1f} ({'⚠️ 超买区' if result.rsi_zone == 'overbought' else '🟢 超卖区' if result.rsi_zone == 'oversold' else '正常区'})
-
-2.2 MACD
-├─ DIF：{result.macd_dif:.4f}
-├─ DEA：{result.macd_dea:.4f}
-├─ 柱状：{result.macd_histogram:.4f}
-└─ 交叉：{'🟢 金叉' if result.macd_cross == 'golden' else '🔴 死叉' if result.macd_cross == 'dead' else '无交叉'}
-
-2.3 KDJ
-├─ K={result.kdj_k:.1f}, D={result.kdj_d:.1f}, J={result.kdj_j:.1f}
-└─ 交叉：{'🟢 金叉' if result.kdj_cross == 'golden' else '🔴 死叉' if result.kdj_cross == 'dead' else '无交叉'}
-
-{'━'*60}
-
-三、"没走弱"综合判定
-
-得分：{result.not_weakened_score}/5
-
-"""
-    for item in result.not_weakened_items:
-        report += f"{item}\n"
-    
-    report += f"""
-判定结果：{'✅ 满足条件，应该持有' if result.should_hold else '❌ 不满足条件，谨慎/离场'}
-是否有卖出信号：{'🔴 是' if result.should_sell else '✅ 否'}
-
-{'━'*60}
-
-四、操作建议
-
-"""
-    
-    if result.entry_suggestions:
-        for e in result.entry_suggestions:
-            report += f"""第{e['batch']}笔 ({e['position']})
-├─ 触发条件：{e['trigger']}
-├─ 进场价：{e['entry_price']:.2f}元
-├─ 止损位：{e['stop_loss']:.2f}元
-└─ 目标位：{e['target']:.2f}元
-
-"""
-    else:
-        report += "当前不建议进场，等待更清晰信号。\n"
-    
-    report += f"""
-{'━'*60}
-
-风险提示：
-⚠️ 投资有风险，以上分析仅供参考，不构成投资建议
-⚠️ 如果跌破止损位，应严格执行止损
-⚠️ 关注大盘整体走势，大盘大跌时个股难独善其身
-
-{'━'*60}
-"""
-    
-    return report
+@METRICS.timed("generate_report")
+def generate_report(result: AnalysisResult, fmt: str = "text", sections: List[str] = None) -> str:
+    """
+    生成标准分析报告
+    fmt: 'text' | 'markdown' | 'html' | 'json'；sections 为 None 时输出全部章节
+    """
+    return render_report(result, fmt, sections)
 
 # ==================== 主程序 ====================
 
@@ -674,21 +763,18 @@ def main():
     print(f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("基于 stock-trading-analysis-guide.md 的所有规则\n")
     
-    # 分析蓝思科技 - 周三（1月8日）
-    print("\n" + "="*60)
-    print("🔍 案例1: 蓝思科技(300433) 周三 2026-01-08")
-    print("="*60)
-    result1 = analyze_stock("300433", "2026-01-08")
-    if result1:
-        print("\n" + generate_report(result1))
-    
-    # 分析蓝思科技 - 周四（1月9日）
-    print("\n" + "="*60)
-    print("🔍 案例2: 蓝思科技(300433) 周四 2026-01-09")
-    print("="*60)
-    result2 = analyze_stock("300433", "2026-01-09")
-    if result2:
-        print("\n" + generate_report(result2))
+    # 蓝思科技 周三（1月8日）/ 周四（1月9日）：只获取一次数据
+    cases = [
+        ("2026-01-08", "🔍 案例1: 蓝思科技(300433) 周三 2026-01-08"),
+        ("2026-01-09", "🔍 案例2: 蓝思科技(300433) 周四 2026-01-09"),
+    ]
+    results = analyze_dates("300433", [date for date, _ in cases])
+    for (_, title), result in zip(cases, results):
+        print("\n" + "="*60)
+        print(title)
+        print("="*60)
+        if result:
+            print("\n" + generate_report(result))
 
 if __name__ == "__main__":
     main()
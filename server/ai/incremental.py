@@ -0,0 +1,179 @@
+"""
+增量技术指标
+每来一根K线只做 O(1) 更新，口径与 full_analysis 中的 calculate_* 完全一致
+状态可序列化，用于分钟级盯盘和收盘后的增量更新
+"""
+
+from collections import deque
+from typing import Dict, Optional
+
+
+def cross_of(prev_a: float, prev_b: float, a: float, b: float) -> str:
+    """两条线的金叉/死叉判定（与 analyze_stock 相同）"""
+    if prev_a < prev_b and a > b:
+        return "golden"
+    if prev_a > prev_b and a < b:
+        return "dead"
+    return "none"
+
+
+class IndicatorState:
+    """
+    单只股票的增量指标状态
+    MA / MACD / RSI / KDJ / 量比 / 近期高点
+    """
+
+    MA_PERIODS = (5, 10, 20)
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9,
+                 rsi_period: int = 14, kdj_n: int = 9,
+                 vol_window: int = 5, high_window: int = 20):
+        self.fast = fast
+        self.slow = slow
+        self.signal = signal
+        self.rsi_period = rsi_period
+        self.kdj_n = kdj_n
+        self.vol_window = vol_window
+        self.high_window = high_window
+
+        self.count = 0
+        self.last_date: Optional[str] = None
+        self.last_close: Optional[float] = None
+        self.closes = deque(maxlen=max(self.MA_PERIODS))
+        self.highs = deque(maxlen=max(kdj_n, high_window))
+        self.lows = deque(maxlen=kdj_n)
+        self.volumes = deque(maxlen=vol_window)
+        self.gains = deque(maxlen=rsi_period)
+        self.losses = deque(maxlen=rsi_period)
+
+        self.ema_fast = 0.0
+        self.ema_slow = 0.0
+        self.dif = 0.0
+        self.dea = 0.0
+        self.prev_dif = 0.0
+        self.prev_dea = 0.0
+        self.k: Optional[float] = None
+        self.d: Optional[float] = None
+        self.prev_k: Optional[float] = None
+        self.prev_d: Optional[float] = None
+
+    # ---------- 更新 ----------
+
+    def update(self, bar: Dict):
+        """推进一根K线"""
+        close = bar["close"]
+        if self.count == 0:
+            self.ema_fast = self.ema_slow = close
+            self.dif = self.dea = 0.0
+        else:
+            change = close - self.last_close
+            self.gains.append(change if change > 0 else 0)
+            self.losses.append(0 if change > 0 else abs(change))
+            self.prev_dif, self.prev_dea = self.dif, self.dea
+            self.ema_fast = (close - self.ema_fast) * (2 / (self.fast + 1)) + self.ema_fast
+            self.ema_slow = (close - self.ema_slow) * (2 / (self.slow + 1)) + self.ema_slow
+            self.dif = self.ema_fast - self.ema_slow
+            self.dea = (self.dif - self.dea) * (2 / (self.signal + 1)) + self.dea
+
+        self.closes.append(close)
+        self.highs.append(bar["high"])
+        self.lows.append(bar["low"])
+        self.volumes.append(bar["volume"])
+        self.count += 1
+        self.last_close = close
+        self.last_date = bar.get("date")
+
+        if self.count >= self.kdj_n:
+            n = self.kdj_n
+            low_n = min(self.lows)
+            high_n = max(list(self.highs)[-n:])
+            rsv = 50 if high_n == low_n else (close - low_n) / (high_n - low_n) * 100
+            self.prev_k, self.prev_d = self.k, self.d
+            self.k = rsv if self.k is None else (2/3) * self.k + (1/3) * rsv
+            self.d = self.k if self.d is None else (2/3) * self.d + (1/3) * self.k
+
+    # ---------- 读取 ----------
+
+    def ma(self, period: int) -> float:
+        if self.count < period:
+            return self.last_close
+        return sum(list(self.closes)[-period:]) / period
+
+    def rsi(self) -> float:
+        if self.count < self.rsi_period + 1:
+            return 50.0
+        avg_gain = sum(self.gains) / self.rsi_period
+        avg_loss = sum(self.losses) / self.rsi_period
+        if avg_loss == 0:
+            return 100.0
+        return round(100 - (100 / (1 + avg_gain / avg_loss)), 2)
+
+    def macd(self) -> Dict:
+        """当前与上一根的 DIF/DEA/柱状（不足 slow 根时与 calculate_macd 一样返回 0）"""
+        if self.count < self.slow:
+            return {"dif": 0, "dea": 0, "histogram": 0,
+                    "prev_dif": 0, "prev_dea": 0, "prev_histogram": None}
+        return {
+            "dif": self.dif,
+            "dea": self.dea,
+            "histogram": self.dif - self.dea,
+            "prev_dif": self.prev_dif,
+            "prev_dea": self.prev_dea,
+            "prev_histogram": self.prev_dif - self.prev_dea,
+        }
+
+    def kdj(self) -> Dict:
+        if self.k is None:
+            return {"k": 50, "d": 50, "j": 50, "prev_k": None, "prev_d": None}
+        return {"k": self.k, "d": self.d, "j": 3 * self.k - 2 * self.d,
+                "prev_k": self.prev_k, "prev_d": self.prev_d}
+
+    def vol_ratio(self) -> float:
+        volumes = self.volumes
+        vol_avg = sum(volumes) / self.vol_window if len(volumes) >= self.vol_window else volumes[-1]
+        return volumes[-1] / vol_avg if vol_avg > 0 else 1
+
+    def recent_high(self) -> float:
+        return max(list(self.highs)[-self.high_window:])
+
+    def snapshot(self) -> Dict:
+        """当前全部指标值"""
+        macd = self.macd()
+        kdj = self.kdj()
+        macd_cross = "none"
+        if macd["prev_histogram"] is not None:
+            macd_cross = cross_of(macd["prev_dif"], macd["prev_dea"], macd["dif"], macd["dea"])
+        kdj_cross = "none"
+        if kdj["prev_k"] is not None:
+            kdj_cross = cross_of(kdj["prev_k"], kdj["prev_d"], kdj["k"], kdj["d"])
+        snap = {"date": self.last_date, "close": self.last_close, "count": self.count,
+                "rsi": self.rsi(), "vol_ratio": self.vol_ratio(), "recent_high": self.recent_high(),
+                "macd_cross": macd_cross, "kdj_cross": kdj_cross}
+        for p in self.MA_PERIODS:
+            snap[f"ma{p}"] = self.ma(p)
+        snap.update({f"macd_{k}": v for k, v in macd.items()})
+        snap.update({f"kdj_{k}": v for k, v in kdj.items()})
+        return snap
+
+    # ---------- 序列化 ----------
+
+    _SCALARS = ("count", "last_date", "last_close", "ema_fast", "ema_slow", "dif", "dea",
+                "prev_dif", "prev_dea", "k", "d", "prev_k", "prev_d")
+    _WINDOWS = ("closes", "highs", "lows", "volumes", "gains", "losses")
+    _PARAMS = ("fast", "slow", "signal", "rsi_period", "kdj_n", "vol_window", "high_window")
+
+    def to_dict(self) -> Dict:
+        """导出检查点"""
+        data = {name: getattr(self, name) for name in self._PARAMS + self._SCALARS}
+        data.update({name: list(getattr(self, name)) for name in self._WINDOWS})
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "IndicatorState":
+        """从检查点恢复"""
+        state = cls(**{name: data[name] for name in cls._PARAMS})
+        for name in cls._SCALARS:
+            setattr(state, name, data[name])
+        for name in cls._WINDOWS:
+            getattr(state, name).extend(data[name])
+        return state
@@ -0,0 +1,222 @@
+"""
+分钟级盯盘
+拉取 1/5 分钟K线，每只股票保留固定长度的环形缓冲区，
+每根新K线增量更新 MA/MACD/KDJ/RSI，并实时发出交叉事件
+一轮轮询中各股票的分钟K线由有界线程池并发拉取，写入和指标更新仍在调用线程里逐只进行
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Dict, Optional, Callable
+
+from full_analysis import call_aktools
+from incremental import IndicatorState, cross_of
+
+# 一个交易日 240 根 1 分钟K线，默认保留 5 个交易日
+DEFAULT_CAPACITY = 240 * 5
+POLL_INTERVAL = 60.0        # 轮询间隔（秒），一轮用时超过它会打印警告
+DEFAULT_FETCH_WORKERS = 16  # 并发拉取分钟K线的线程数
+
+
+@dataclass
+class CrossEvent:
+    """交叉事件"""
+    symbol: str
+    time: str
+    indicator: str   # 'ma' | 'macd' | 'kdj' | 'rsi'
+    kind: str        # 'golden' | 'dead' | 'oversold' | 'overbought'
+    price: float
+    value: float
+
+
+class RingBuffer:
+    """定长环形缓冲区（按列存储，内存固定）"""
+
+    FIELDS = ("time", "open", "high", "low", "close", "volume")
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._cols = {f: [None] * capacity for f in self.FIELDS}
+        self._head = 0   # 下一次写入的位置
+        self.size = 0
+
+    def append(self, bar: Dict):
+        for f in self.FIELDS:
+            self._cols[f][self._head] = bar[f]
+        self._head = (self._head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def column(self, field: str) -> list:
+        """按时间顺序返回某一列"""
+        col = self._cols[field]
+        if self.size < self.capacity:
+            return col[:self.size]
+        return col[self._head:] + col[:self._head]
+
+    def last(self) -> Optional[Dict]:
+        if not self.size:
+            return None
+        i = (self._head - 1) % self.capacity
+        return {f: self._cols[f][i] for f in self.FIELDS}
+
+    def __len__(self):
+        return self.size
+
+
+def fetch_minute_bars(symbol: str, period: str = "1", start: Optional[str] = None) -> list:
+    """获取分钟K线（period: '1' | '5'）"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    data = call_aktools("stock_zh_a_hist_min_em", {
+        "symbol": symbol,
+        "period": period,
+        "start_date": start or f"{today} 09:30:00",
+        "end_date": f"{today} 15:00:00",
+        "adjust": "",
+    })
+    if not data:
+        return []
+    bars = []
+    for item in data:
+        bars.append({
+            "time": str(item.get("时间", "")).replace("T", " ")[:19],
+            "open": float(item.get("开盘", 0)),
+            "close": float(item.get("收盘", 0)),
+            "high": float(item.get("最高", 0)),
+            "low": float(item.get("最低", 0)),
+            "volume": float(item.get("成交量", 0)),
+        })
+    return bars
+
+
+class _SymbolState:
+    __slots__ = ("buffer", "indicators")
+
+    def __init__(self, capacity: int):
+        self.buffer = RingBuffer(capacity)
+        self.indicators = IndicatorState()
+
+
+class IntradayMonitor:
+    """
+    分钟级信号监控
+    每只股票一份环形缓冲区 + 增量指标状态，单根K线的处理是 O(1)
+    """
+
+    def __init__(self, period: str = "1", capacity: int = DEFAULT_CAPACITY,
+                 on_event: Optional[Callable[[CrossEvent], None]] = None,
+                 workers: int = DEFAULT_FETCH_WORKERS, interval: float = POLL_INTERVAL):
+        if period not in ("1", "5"):
+            raise ValueError(f"不支持的分钟周期: {period}")
+        self.period = period
+        self.capacity = capacity
+        self.on_event = on_event
+        self.workers = workers
+        self.interval = interval
+        self.last_round_seconds = 0.0   # 最近一轮轮询的用时
+        self._states: Dict[str, _SymbolState] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def buffer(self, symbol: str) -> Optional[RingBuffer]:
+        state = self._states.get(symbol)
+        return state.buffer if state else None
+
+    def snapshot(self, symbol: str) -> Optional[Dict]:
+        state = self._states.get(symbol)
+        return state.indicators.snapshot() if state and state.indicators.count else None
+
+    def ingest(self, symbol: str, bars: List[Dict]) -> List[CrossEvent]:
+        """写入新的分钟K线（已处理过的时间点会被跳过），返回触发的交叉事件"""
+        state = self._states.get(symbol)
+        if state is None:
+            state = self._states[symbol] = _SymbolState(self.capacity)
+        last = state.buffer.last()
+        last_time = last["time"] if last else ""
+        events = []
+        for bar in bars:
+            if bar["time"] <= last_time:
+                continue
+            events.extend(self._on_bar(symbol, state, bar))
+            last_time = bar["time"]
+        return events
+
+    def _on_bar(self, symbol: str, state: _SymbolState, bar: Dict) -> List[CrossEvent]:
+        ind = state.indicators
+        prev_rsi = ind.rsi() if ind.count else None
+        prev_ma = (ind.ma(5), ind.ma(10)) if ind.count else None
+
+        state.buffer.append(bar)
+        ind.update({**bar, "date": bar["time"]})
+        snap = ind.snapshot()
+
+        events = []
+
+        def emit(indicator: str, kind: str, value: float):
+            event = CrossEvent(symbol, bar["time"], indicator, kind, bar["close"], value)
+            events.append(event)
+            if self.on_event:
+                self.on_event(event)
+
+        if prev_ma is not None and ind.count > 10:
+            ma_cross = cross_of(prev_ma[0], prev_ma[1], snap["ma5"], snap["ma10"])
+            if ma_cross != "none":
+                emit("ma", ma_cross, snap["ma5"])
+        if snap["macd_cross"] != "none":
+            emit("macd", snap["macd_cross"], snap["macd_dif"])
+        if snap["kdj_cross"] != "none":
+            emit("kdj", snap["kdj_cross"], snap["kdj_k"])
+        if prev_rsi is not None and ind.count > ind.rsi_period + 1:
+            if prev_rsi >= 30 > snap["rsi"]:
+                emit("rsi", "oversold", snap["rsi"])
+            elif prev_rsi <= 70 < snap["rsi"]:
+                emit("rsi", "overbought", snap["rsi"])
+        return events
+
+    def poll(self, symbols: List[str]) -> List[CrossEvent]:
+        """拉取一轮最新分钟K线并处理（并发拉取，按 symbols 顺序逐只写入）"""
+        start = time.perf_counter()
+        starts = []
+        for symbol in symbols:
+            buffer = self.buffer(symbol)
+            last = buffer.last() if buffer else None
+            starts.append(last["time"] if last else None)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="intraday-fetch")
+        fetched = self._pool.map(lambda args: fetch_minute_bars(args[0], self.period, start=args[1]),
+                                 zip(symbols, starts))
+        events = []
+        for symbol, bars in zip(symbols, fetched):
+            # 分钟K线以结束时间标记，标记时间晚于当前分钟的那根尚未走完
+            now_minute = datetime.now().strftime("%Y-%m-%d %H:%M")
+            bars = [b for b in bars if b["time"][:16] <= now_minute]
+            events.extend(self.ingest(symbol, bars))
+        self.last_round_seconds = time.perf_counter() - start
+        if self.last_round_seconds > self.interval:
+            print(f"⚠️ 分钟K线一轮轮询 {len(symbols)} 只用时 {self.last_round_seconds:.1f}s，"
+                  f"超过轮询间隔 {self.interval:.0f}s（可调大 workers 或减少股票）")
+        return events
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def main():
+    import sys
+
+    symbols = sys.argv[1:] or ["300433"]
+    monitor = IntradayMonitor(period="1", on_event=lambda e: print(
+        f"   [{e.time}] {e.symbol} {e.indicator.upper()} {e.kind} 价格={e.price:.2f} 值={e.value:.2f}"))
+    print(f"📡 分钟级盯盘: {', '.join(symbols)}（Ctrl+C 退出）")
+    try:
+        while True:
+            monitor.poll(symbols)
+            time.sleep(max(monitor.interval - monitor.last_round_seconds, 0.0))
+    finally:
+        monitor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+K线入库清洗
+数据写入本地K线存储时做一次向量化检查（按列用 numpy 一次算完），输出问题掩码并按修复策略处理；
+入库后的K线保证：日期严格递增且不重复、OHLC 为正且 low <= open/close <= high，分析时不必再逐根防御性检查
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Tuple, Callable
+
+import numpy as np
+
+PRICE_FIELDS = ("open", "high", "low", "close")
+
+# 问题类型（掩码与原始输入逐行对齐）
+ISSUES = (
+    "missing_price",    # 价格缺失或 <= 0
+    "bad_range",        # high < low，或开/收盘价超出高低价区间
+    "duplicate_date",   # 同一日期出现多次（保留最后一条）
+    "non_monotonic",    # 日期比前面的行早（乱序）
+    "zero_volume",      # 有价格但成交量为 0（停牌日的占位K线）
+    "volume_spike",     # 成交量异常（对数成交量的稳健 z 分数过大）
+    "price_jump",       # 涨跌幅超出涨跌停限制（可能是复权错误或脏数据；给出复权因子时按复权价算，除权日不误报）
+)
+
+# 修复策略
+DEFAULT_POLICY = {
+    "missing_price": "drop",    # drop: 剔除 | ffill: 用前收盘价补齐、成交量记 0
+    "bad_range": "clip",        # clip: 高低价扩展到包含开收盘价 | drop: 剔除
+    "zero_volume": "drop",      # drop: 剔除 | keep: 保留
+    "volume_spike": "flag",     # flag: 只标记 | cap: 截断到阈值
+}
+
+VOLUME_SPIKE_Z = 6.0        # 稳健 z 分数阈值（MAD 口径）
+PRICE_JUMP_LIMIT = 0.21     # 超过 20% 涨跌停（再加 1% 容差）视为异常跳变
+SUSPENSION_GAP_DAYS = 6     # 相邻两根K线之间缺失超过 6 个工作日视为停牌（长假最多缺 5 个工作日左右）
+
+
+@dataclass
+class CleanResult:
+    """清洗结果"""
+    klines: List[Dict]
+    masks: Dict[str, np.ndarray]                  # 各类问题的布尔掩码（对齐原始输入）
+    gaps: List[Tuple[str, str, int]] = field(default_factory=list)   # (前一交易日, 复牌日, 缺失工作日数)
+    repairs: Dict[str, int] = field(default_factory=dict)           # 各策略实际处理的行数
+
+    def counts(self) -> Dict[str, int]:
+        return {name: int(mask.sum()) for name, mask in self.masks.items() if mask.any()}
+
+    @property
+    def ok(self) -> bool:
+        return not self.counts() and not self.gaps
+
+    def summary(self) -> str:
+        parts = [f"{name}={n}" for name, n in self.counts().items()]
+        if self.gaps:
+            parts.append(f"停牌缺口={len(self.gaps)}")
+        parts += [f"{name}:{n}" for name, n in self.repairs.items() if n]
+        return ", ".join(parts) if parts else "无异常"
+
+
+def to_number(value) -> float:
+    """解析上游数值字段（缺失、空串、无法解析都记为 NaN，而不是 0）"""
+    if value is None or value == "":
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _column(klines: List[Dict], name: str) -> np.ndarray:
+    values = [k.get(name) for k in klines]
+    try:
+        return np.array(values, dtype=float)   # None 会变成 NaN
+    except (TypeError, ValueError):
+        return np.array([to_number(v) for v in values], dtype=float)
+
+
+def _parse_dates(dates: List[str]) -> np.ndarray:
+    try:
+        return np.array(dates, dtype="datetime64[D]")
+    except ValueError:
+        parsed = []
+        for d in dates:
+            try:
+                parsed.append(np.datetime64(d, "D"))
+            except ValueError:
+                parsed.append(np.datetime64("NaT"))
+        return np.array(parsed, dtype="datetime64[D]")
+
+
+def clean_klines(klines: List[Dict], policy: Optional[Dict[str, str]] = None,
+                 prev_close: Optional[float] = None, holidays: Optional[List[str]] = None,
+                 factors_for: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> CleanResult:
+    """
+    向量化清洗一批日K
+    prev_close: 这批数据之前最后一根K线的收盘价（增量入库时用于检查首根的跳变）
+    holidays: 交易日历中的休市工作日；给出时缺失任何一个交易日都算停牌缺口
+    factors_for: 日期数组 → 后复权因子（如 AdjustmentTable.factors_for）；不复权K线给出时，
+                 跳变按复权后的收盘价计算（prev_close 也要换算到同一后复权口径），送转除权日不再误报
+    """
+    policy = {**DEFAULT_POLICY, **(policy or {})}
+    n = len(klines)
+    if n == 0:
+        return CleanResult([], {name: np.zeros(0, dtype=bool) for name in ISSUES})
+
+    cols = {f: _column(klines, f) for f in PRICE_FIELDS + ("volume", "amount", "change_pct")}
+    dates = _parse_dates([k.get("date", "") for k in klines])
+    masks = {}
+
+    # 价格缺失 / 非正
+    prices = np.stack([cols[f] for f in PRICE_FIELDS])
+    missing = (~np.isfinite(prices) | (prices <= 0)).any(axis=0) | np.isnat(dates)
+    masks["missing_price"] = missing
+
+    # 高低价区间
+    o, h, l, c = (cols[f] for f in PRICE_FIELDS)
+    with np.errstate(invalid="ignore"):
+        masks["bad_range"] = ~missing & ((h < l) | (o > h) | (o < l) | (c > h) | (c < l))
+
+    # 乱序：比之前出现过的最大日期还早
+    day = dates.astype("int64")
+    running_max = np.maximum.accumulate(np.where(np.isnat(dates), np.iinfo(np.int64).min, day))
+    non_monotonic = np.zeros(n, dtype=bool)
+    non_monotonic[1:] = day[1:] < running_max[:-1]
+    masks["non_monotonic"] = non_monotonic & ~np.isnat(dates)
+
+    # 重复日期（稳定排序后相邻相等，保留原始顺序中的最后一条）
+    order = np.argsort(day, kind="stable")
+    dup_sorted = np.zeros(n, dtype=bool)
+    dup_sorted[:-1] = day[order][:-1] == day[order][1:]
+    duplicate = np.zeros(n, dtype=bool)
+    duplicate[order] = dup_sorted
+    masks["duplicate_date"] = duplicate & ~np.isnat(dates)
+
+    volume = np.nan_to_num(cols["volume"], nan=0.0)   # 成交量缺失按 0 处理
+    with np.errstate(invalid="ignore"):
+        masks["zero_volume"] = ~missing & (volume <= 0)
+        # 成交量异常：log(volume) 相对中位数的 MAD z 分数
+        log_vol = np.log(np.where(volume > 0, volume, np.nan))
+    spike = np.zeros(n, dtype=bool)
+    valid = np.isfinite(log_vol)
+    if valid.sum() >= 20:
+        med = np.median(log_vol[valid])
+        mad = np.median(np.abs(log_vol[valid] - med)) * 1.4826
+        if mad > 0:
+            with np.errstate(invalid="ignore"):
+                spike = np.abs(log_vol - med) / mad > VOLUME_SPIKE_Z
+    masks["volume_spike"] = spike
+
+    # 按修复策略决定保留哪些行
+    keep = ~duplicate & ~np.isnat(dates)
+    repairs = {}
+    if policy["missing_price"] == "drop":
+        keep &= ~missing
+        repairs["drop_missing_price"] = int((missing & ~duplicate).sum())
+    if policy["bad_range"] == "drop":
+        keep &= ~masks["bad_range"]
+        repairs["drop_bad_range"] = int((masks["bad_range"] & ~duplicate).sum())
+    if policy["zero_volume"] == "drop":
+        keep &= ~masks["zero_volume"]
+        repairs["drop_zero_volume"] = int((masks["zero_volume"] & ~duplicate).sum())
+
+    idx = order[keep[order]]   # 按日期排序后的保留行（乱序在这里被纠正）
+
+    # 涨跌幅跳变（在排序去重之后的相邻收盘价上算）
+    closes = c[idx] * factors_for(dates[idx]) if factors_for is not None and len(idx) else c[idx]
+    prev = np.empty_like(closes)
+    if len(closes):
+        prev[0] = prev_close if prev_close else np.nan
+        prev[1:] = closes[:-1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        jump = np.abs(closes / prev - 1) > PRICE_JUMP_LIMIT
+    price_jump = np.zeros(n, dtype=bool)
+    price_jump[idx] = jump
+    masks["price_jump"] = price_jump
+
+    # 修复
+    o, h, l, c, v = o[idx].copy(), h[idx].copy(), l[idx].copy(), c[idx].copy(), volume[idx].copy()
+    if policy["missing_price"] == "ffill":
+        bad = missing[idx]
+        repairs["ffill_missing_price"] = int(bad.sum())
+        if bad.any():
+            last_good = np.where(~bad, np.arange(len(idx)), -1)
+            np.maximum.accumulate(last_good, out=last_good)
+            filled = np.where(last_good >= 0, c[np.maximum(last_good, 0)], np.nan)
+            for col in (o, h, l, c):
+                col[bad] = filled[bad]
+            v[bad] = 0
+            still_bad = ~np.isfinite(c)   # 开头就缺失的只能剔除
+            if still_bad.any():
+                keep_rows = ~still_bad
+                idx, o, h, l, c, v = idx[keep_rows], o[keep_rows], h[keep_rows], l[keep_rows], c[keep_rows], v[keep_rows]
+    if policy["bad_range"] == "clip":
+        bad = masks["bad_range"][idx]
+        repairs["clip_bad_range"] = int(bad.sum())
+        h = np.maximum.reduce([h, o, c, l])
+        l = np.minimum.reduce([l, o, c, h])
+    if policy["volume_spike"] == "cap" and spike.any():
+        cap = float(np.exp(med + VOLUME_SPIKE_Z * mad))
+        capped = v > cap
+        repairs["cap_volume_spike"] = int(capped.sum())
+        v = np.minimum(v, cap)
+
+    extras = {f: cols[f] for f in ("amount", "change_pct")}
+    untouched = (
+        len(idx) == n and not non_monotonic.any() and not any(repairs.values())
+        and np.isfinite(cols["volume"]).all() and all(np.isfinite(col).all() for col in extras.values())
+        and all(isinstance(k.get("date"), str) and len(k["date"]) == 10 for k in klines)
+    )
+    if untouched:
+        # 干净数据（绝大多数情况）：原样入库，不重建每根K线
+        cleaned = list(klines)
+    else:
+        cleaned = []
+        for j, i in enumerate(idx.tolist()):
+            bar = dict(klines[i])
+            bar["date"] = str(dates[i])
+            bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"] = (
+                float(o[j]), float(h[j]), float(l[j]), float(c[j]), float(v[j]))
+            for f, values in extras.items():
+                bar[f] = float(values[i]) if math.isfinite(values[i]) else 0.0
+            cleaned.append(bar)
+
+    return CleanResult(cleaned, masks, _suspension_gaps(dates[idx], holidays), repairs)
+
+
+def _suspension_gaps(dates: np.ndarray, holidays: Optional[List[str]] = None) -> List[Tuple[str, str, int]]:
+    """相邻K线之间缺失的交易日数超过阈值的位置（没有交易日历时按工作日估算）"""
+    if len(dates) < 2:
+        return []
+    if holidays is None:
+        missing = np.busday_count(dates[:-1] + 1, dates[1:])
+        threshold = SUSPENSION_GAP_DAYS
+    else:
+        missing = np.busday_count(dates[:-1] + 1, dates[1:], holidays=np.array(holidays, dtype="datetime64[D]"))
+        threshold = 0
+    where = np.nonzero(missing > threshold)[0]
+    return [(str(dates[i]), str(dates[i + 1]), int(missing[i])) for i in where]
@@ -0,0 +1,268 @@
+"""
+本地K线存储
+按股票缓存不复权日K线和复权因子表，增量合并新数据，按需生成复权视图，并维护各周期的重采样视图
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import List, Dict, Optional, Callable
+
+from adjustment import AdjustmentTable, adjust_klines
+from kline_clean import CleanResult, clean_klines
+from resample import Resampler, aggregate_bars, parse_timeframe
+
+
+def normalize_date(value) -> str:
+    """统一日期格式为 YYYY-MM-DD（兼容 2026-01-08T00:00:00.000 等格式）"""
+    return str(value).split('T')[0].split(' ')[0]
+
+
+class DateIndex:
+    """K线日期索引：按日期 O(1) 定位下标，按日期二分查找最近的交易日"""
+
+    def __init__(self, klines: List[Dict]):
+        self.dates = [normalize_date(k["date"]) for k in klines]
+        self._pos = {d: i for i, d in enumerate(self.dates)}
+
+    def get(self, date_str: str) -> Optional[int]:
+        """日期对应的下标（非交易日返回 None）"""
+        return self._pos.get(normalize_date(date_str))
+
+    def at_or_before(self, date_str: str) -> Optional[int]:
+        """不晚于该日期的最后一个交易日下标"""
+        i = bisect_right(self.dates, normalize_date(date_str)) - 1
+        return i if i >= 0 else None
+
+    def __contains__(self, date_str: str) -> bool:
+        return normalize_date(date_str) in self._pos
+
+    def __len__(self):
+        return len(self.dates)
+
+
+class KlineStore:
+    """日K线缓存（进程内）；day_index 为交易日序号函数，N日K按它分组（见 Resampler）"""
+
+    def __init__(self, day_index: Optional[Callable[[str], int]] = None):
+        self.day_index = day_index
+        self._daily: Dict[str, List[Dict]] = {}
+        self._dates: Dict[str, List[str]] = {}
+        self._covered_from: Dict[str, str] = {}   # 已向上游请求过的最早日期
+        self._refreshed_on: Dict[str, str] = {}   # 最近一次拉取到最新数据的自然日
+        self._resamplers: Dict[tuple, Resampler] = {}
+        self._quality: Dict[str, Dict] = {}       # 入库清洗发现的问题（累计）
+        self._factors: Dict[str, AdjustmentTable] = {}
+        self._factors_on: Dict[str, str] = {}     # 复权因子最近一次刷新（含失败的尝试）的自然日
+        self._factors_failed: Dict[str, str] = {} # 复权因子获取失败的自然日（成功后清除）
+        self._qfq: Dict[str, List[Dict]] = {}     # 最新基准的前复权视图（合并/因子变化时失效）
+
+    # ---------- 读取 ----------
+
+    def get_daily(self, symbol: str, start_date: Optional[str] = None,
+                  adjust: str = "qfq", as_of: Optional[str] = None) -> List[Dict]:
+        """
+        返回日K（可选从 start_date 开始）
+        adjust: 'qfq' | 'hfq' | 'none'；as_of 为前复权的基准日（回测时按当时的复权口径）
+        """
+        if adjust == "qfq" and as_of is None:
+            bars = self._qfq_view(symbol)
+        else:
+            bars = adjust_klines(self._daily.get(symbol, []), self._factors.get(symbol), adjust, as_of)
+        if start_date:
+            return bars[bisect_left(self._dates.get(symbol, []), start_date):]
+        return list(bars)
+
+    def _qfq_view(self, symbol: str) -> List[Dict]:
+        view = self._qfq.get(symbol)
+        if view is None:
+            view = adjust_klines(self._daily.get(symbol, []), self._factors.get(symbol), "qfq")
+            if symbol in self._daily:
+                self._qfq[symbol] = view
+        return view
+
+    def get_timeframe(self, symbol: str, timeframe: str, as_of: Optional[str] = None) -> List[Dict]:
+        """返回指定周期的K线（周/月/N日K由日K增量重采样并缓存）"""
+        kind, _ = parse_timeframe(timeframe)
+        if kind == "daily":
+            return self.get_daily(symbol)
+        key = (symbol, timeframe)
+        resampler = self._resamplers.get(key)
+        if resampler is None:
+            resampler = Resampler(timeframe, self.day_index)
+            resampler.update(self._qfq_view(symbol))
+            self._resamplers[key] = resampler
+        bars = resampler.bars(as_of)
+        if as_of is None or not bars or as_of >= bars[-1]["date"]:
+            return bars
+        return self._truncate_as_of(symbol, bars, as_of)
+
+    def _truncate_as_of(self, symbol: str, bars: List[Dict], as_of: str) -> List[Dict]:
+        """
+        截取到 as_of 为止的重采样K线（回测时不能看到未来）
+        as_of 之前的周期直接复用缓存，只重新聚合 as_of 所在周期的前几根日K
+        """
+        j = bisect_left([b["date"] for b in bars], as_of)
+        period = bars[j]
+        if period["date"] == as_of:
+            return bars[:j + 1]
+        if period["start_date"] > as_of:
+            return bars[:j]
+        dates = self._dates[symbol]
+        members = self._qfq_view(symbol)[bisect_left(dates, period["start_date"]):bisect_left(dates, as_of) + 1]
+        members = [k for k in members if k["date"] <= as_of]
+        current = aggregate_bars(members, bars[j - 1]["close"] if j > 0 else None)
+        current["partial"] = True
+        return bars[:j] + [current]
+
+    def covers(self, symbol: str, start_date: str) -> bool:
+        """缓存是否覆盖从 start_date 到今天的数据"""
+        covered_from = self._covered_from.get(symbol)
+        return (
+            covered_from is not None
+            and covered_from <= start_date
+            and self._refreshed_on.get(symbol) == date.today().isoformat()
+        )
+
+    def covered_from(self, symbol: str) -> Optional[str]:
+        return self._covered_from.get(symbol)
+
+    def is_fresh(self, symbol: str) -> bool:
+        return self._refreshed_on.get(symbol) == date.today().isoformat()
+
+    def symbols(self) -> List[str]:
+        return list(self._daily)
+
+    def factors(self, symbol: str) -> Optional[AdjustmentTable]:
+        return self._factors.get(symbol)
+
+    def factors_fresh(self, symbol: str) -> bool:
+        return self._factors_on.get(symbol) == date.today().isoformat()
+
+    def adjust_state(self, symbol: str) -> str:
+        """复权口径：'ok' | 'stale'（今天刷新失败，沿用旧因子）| 'unadjusted'（没有因子，按不复权计算）"""
+        if symbol not in self._factors:
+            return "unadjusted"
+        return "stale" if symbol in self._factors_failed else "ok"
+
+    def quality(self, symbol: str) -> Dict:
+        """
+        入库清洗的累计统计：{"issues": {问题: 行数}, "repairs": {...}, "gaps": [...], "adjust": 复权口径}
+        adjust 不是 'ok' 时复权价不可靠（见 adjust_state）
+        """
+        report = dict(self._quality.get(symbol, {"issues": {}, "repairs": {}, "gaps": []}))
+        report["adjust"] = self.adjust_state(symbol)
+        return report
+
+    # ---------- 写入 ----------
+
+    def mark_fetched(self, symbol: str, start_date: str, through_today: bool = True):
+        """记录已请求过的日期范围"""
+        if symbol not in self._covered_from or start_date < self._covered_from[symbol]:
+            self._covered_from[symbol] = start_date
+        if through_today:
+            self._refreshed_on[symbol] = date.today().isoformat()
+
+    def set_factors(self, symbol: str, table: AdjustmentTable) -> bool:
+        """
+        更新复权因子表（除权除息后只需刷新这张小表，不必重新下载K线）
+        返回因子是否有变化；有变化时丢弃该股票的复权视图和重采样缓存
+        """
+        self._factors_on[symbol] = date.today().isoformat()
+        self._factors_failed.pop(symbol, None)
+        if self._factors.get(symbol) == table:
+            return False
+        self._factors[symbol] = table
+        self._qfq.pop(symbol, None)
+        for key in [key for key in self._resamplers if key[0] == symbol]:
+            del self._resamplers[key]
+        return True
+
+    def mark_factors_failed(self, symbol: str):
+        """记录今天获取复权因子失败：当天不再重试，quality() 中标出复权口径降级"""
+        today = date.today().isoformat()
+        self._factors_on[symbol] = today
+        self._factors_failed[symbol] = today
+
+    def merge(self, symbol: str, klines: List[Dict]) -> int:
+        """
+        合并不复权K线（按日期去重，新数据覆盖旧数据）
+        只在尾部追加时增量更新重采样视图，否则丢弃该股票的重采样缓存
+        返回新增的K线条数
+        """
+        if not klines:
+            return 0
+        bars = self._daily.setdefault(symbol, [])
+        dates = self._dates.setdefault(symbol, [])
+        klines = sorted(klines, key=lambda k: k["date"])
+        self._qfq.pop(symbol, None)
+
+        if not bars or klines[0]["date"] >= dates[-1]:
+            # 快路径：尾部追加（与最后一根同日期则替换）
+            added = 0
+            for k in klines:
+                if dates and k["date"] == dates[-1]:
+                    bars[-1] = k
+                elif not dates or k["date"] > dates[-1]:
+                    bars.append(k)
+                    dates.append(k["date"])
+                    added += 1
+            adjusted = None
+            for (sym, _), resampler in self._resamplers.items():
+                if sym == symbol:
+                    if adjusted is None:
+                        adjusted = adjust_klines(klines, self._factors.get(symbol), "qfq")
+                    resampler.update(adjusted)
+            return added
+
+        merged = {k["date"]: k for k in bars}
+        before = len(merged)
+        for k in klines:
+            merged[k["date"]] = k
+        self._daily[symbol] = [merged[d] for d in sorted(merged)]
+        self._dates[symbol] = sorted(merged)
+        for key in [key for key in self._resamplers if key[0] == symbol]:
+            del self._resamplers[key]
+        return len(merged) - before
+
+    def ingest(self, symbol: str, klines: List[Dict], policy: Optional[Dict[str, str]] = None,
+               holidays: Optional[List[str]] = None) -> CleanResult:
+        """
+        清洗后入库（上游数据只在这里检查一次）
+        入库后的K线日期严格递增、价格为正且在高低价区间内，分析时不再重复检查
+        """
+        # 存的是不复权价：有复权因子时跳变检查按后复权价算，送转除权日不会被当成异常
+        table = self._factors.get(symbol)
+        prev_close = None
+        dates = self._dates.get(symbol)
+        if dates and klines:
+            i = bisect_left(dates, min(str(k.get("date", "")) for k in klines))
+            if i > 0:
+                prev_close = self._daily[symbol][i - 1]["close"]
+                if table is not None:
+                    prev_close *= table.factor_at(dates[i - 1])
+        result = clean_klines(klines, policy, prev_close, holidays, table.factors_for if table is not None else None)
+        self.merge(symbol, result.klines)
+
+        quality = self._quality.setdefault(symbol, {"issues": {}, "repairs": {}, "gaps": []})
+        for name, n in result.counts().items():
+            quality["issues"][name] = quality["issues"].get(name, 0) + n
+        for name, n in result.repairs.items():
+            if n:
+                quality["repairs"][name] = quality["repairs"].get(name, 0) + n
+        quality["gaps"] = sorted(set(quality["gaps"]) | set(result.gaps))
+        return result
+
+    def append_bar(self, symbol: str, bar: Dict) -> int:
+        """追加一根日K（收盘后增量更新）"""
+        return self.merge(symbol, [bar])
+
+    def clear(self, symbol: Optional[str] = None):
+        """清空缓存"""
+        if symbol is None:
+            self.__init__(self.day_index)
+            return
+        for d in (self._daily, self._dates, self._covered_from, self._refreshed_on, self._quality,
+                  self._factors, self._factors_on, self._factors_failed, self._qfq):
+            d.pop(symbol, None)
+        for key in [key for key in self._resamplers if key[0] == symbol]:
+            del self._resamplers[key]
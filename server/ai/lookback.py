@@ -0,0 +1,59 @@
+"""
+回看窗口规划
+按指标参数算出收敛所需的最少K线根数：EMA 类指标的初值影响按 (1-α)^n 衰减，
+取衰减到 tolerance 以下所需的根数作为预热长度，取数时按交易日精确请求这么多根
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Dict
+
+DEFAULT_TOLERANCE = 1e-3   # 初值残留权重（0.1%）
+
+
+def ema_warmup(period: int, tolerance: float = DEFAULT_TOLERANCE) -> int:
+    """EMA(period) 初值权重衰减到 tolerance 以下所需的根数"""
+    alpha = 2 / (period + 1)
+    return math.ceil(math.log(tolerance) / math.log(1 - alpha))
+
+
+def smoothing_warmup(weight: float, tolerance: float = DEFAULT_TOLERANCE) -> int:
+    """递推平滑 x = weight * x_prev + (1 - weight) * v 的预热根数（KDJ 的 weight 为 2/3）"""
+    return math.ceil(math.log(tolerance) / math.log(weight))
+
+
+@dataclass
+class LookbackPlan:
+    """回看窗口：bars 为总共需要的根数，warmup 为各指标的预热根数"""
+    bars: int
+    warmup: Dict[str, int] = field(default_factory=dict)
+
+    def scaled(self, factor: int) -> "LookbackPlan":
+        """换算为更长周期（周K/月K）所需的日K根数"""
+        return LookbackPlan(self.bars * factor, {k: v * factor for k, v in self.warmup.items()})
+
+
+def plan_lookback(ma_periods=(5, 10, 20), macd=(12, 26, 9), kdj_n: int = 9, rsi_period: int = 14,
+                  vol_window: int = 5, high_window: int = 20,
+                  tolerance: float = DEFAULT_TOLERANCE, history: int = 1) -> LookbackPlan:
+    """
+    分析所需的最少K线根数
+    history: 需要输出结果的K线根数（最后一根为 1；回测多个日期时为覆盖的交易日数）
+    交叉、红柱扩大等判断要用到前一根，所以额外多 1 根
+    """
+    fast, slow, signal = macd
+    warmup = {
+        "ma": max(ma_periods),
+        # DIF 由快慢两条 EMA 相减，DEA 再对 DIF 做 EMA，误差依次叠加
+        "macd": max(ema_warmup(fast, tolerance), ema_warmup(slow, tolerance)) + ema_warmup(signal, tolerance),
+        # RSV 需要 n 根，K、D 各自按 2/3 递推平滑
+        "kdj": kdj_n - 1 + 2 * smoothing_warmup(2 / 3, tolerance),
+        "rsi": rsi_period + 1,
+        "volume": vol_window,
+        "recent_high": high_window,
+    }
+    return LookbackPlan(max(warmup.values()) + history + 1, warmup)
+
+
+# full_analysis 的默认指标参数下的回看窗口
+ANALYSIS_LOOKBACK = plan_lookback()
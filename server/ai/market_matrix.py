@@ -0,0 +1,148 @@
+"""
+全市场 股票×日期 矩阵
+把各股票的日K按日期对齐成 (T, N) 的收盘价 / 成交量矩阵（当天无交易为 NaN），
+供市场宽度、板块指数等横截面统计一次向量化计算
+"""
+
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+import numpy as np
+
+
+@dataclass
+class MarketMatrix:
+    """按日期对齐的全市场日K（行为日期、列为股票）"""
+    dates: List[str]
+    symbols: List[str]
+    close: np.ndarray    # (T, N)，当天无交易（未上市、停牌）为 NaN
+    volume: np.ndarray   # (T, N)
+    amount: np.ndarray   # (T, N)
+
+    @classmethod
+    def from_klines(cls, universe: Dict[str, List[Dict]]) -> "MarketMatrix":
+        """{symbol: 日K列表}（日期升序）→ 矩阵"""
+        symbols = list(universe)
+        dates = sorted({k["date"] for klines in universe.values() for k in klines})
+        row = {d: i for i, d in enumerate(dates)}
+        shape = (len(dates), len(symbols))
+        close, volume, amount = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+        for j, symbol in enumerate(symbols):
+            klines = universe[symbol]
+            if not klines:
+                continue
+            idx = np.fromiter((row[k["date"]] for k in klines), dtype=np.int64, count=len(klines))
+            close[idx, j] = [k["close"] for k in klines]
+            volume[idx, j] = [k["volume"] for k in klines]
+            amount[idx, j] = [k.get("amount", np.nan) for k in klines]
+        return cls(dates, symbols, close, volume, amount)
+
+    @classmethod
+    def from_store(cls, symbols: Optional[List[str]] = None, store=None, adjust: str = "qfq") -> "MarketMatrix":
+        """从本地K线缓存构建（默认 KLINE_STORE 中的全部股票）"""
+        if store is None:
+            from full_analysis import KLINE_STORE as store
+        symbols = symbols if symbols is not None else store.symbols()
+        return cls.from_klines({s: store.get_daily(s, adjust=adjust) for s in symbols})
+
+    def __len__(self):
+        return len(self.dates)
+
+    def column(self, symbol: str) -> Optional[int]:
+        try:
+            return self.symbols.index(symbol)
+        except ValueError:
+            return None
+
+    def take(self, columns) -> "MarketMatrix":
+        """按列下标取子矩阵（如某个行业的成分股）"""
+        columns = np.asarray(columns, dtype=np.int64)
+        return MarketMatrix(list(self.dates), [self.symbols[j] for j in columns],
+                            self.close[:, columns], self.volume[:, columns], self.amount[:, columns])
+
+    def row_of(self, bars: Dict[str, Dict], field: str) -> np.ndarray:
+        """一天的 {symbol: bar} → 按列顺序排好的一行（缺失为 NaN）"""
+        out = np.full(len(self.symbols), np.nan)
+        pos = {s: j for j, s in enumerate(self.symbols)}
+        for symbol, bar in bars.items():
+            j = pos.get(symbol)
+            if j is not None:
+                out[j] = bar.get(field, np.nan)
+        return out
+
+    def append(self, date_str: str, bars: Dict[str, Dict]):
+        """追加一天（bars 中没有的股票记为无交易；不在矩阵中的股票忽略）"""
+        self.dates.append(date_str)
+        self.close = np.vstack([self.close, self.row_of(bars, "close")])
+        self.volume = np.vstack([self.volume, self.row_of(bars, "volume")])
+        self.amount = np.vstack([self.amount, self.row_of(bars, "amount")])
+
+
+def ffill(a: np.ndarray) -> np.ndarray:
+    """沿日期向前填充 NaN（停牌日沿用最后的收盘价）"""
+    rows = np.arange(len(a))[:, None]
+    idx = np.where(np.isnan(a), 0, rows)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return a[idx, np.arange(a.shape[1])]
+
+
+def compact(a: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    每列只保留 valid 的行、按原顺序靠底对齐（上方补 NaN）
+    停牌日被跳过，之后按行滑动的窗口就是各股票自己最近的 N 根K线
+    """
+    rows, width = a.shape
+    out = np.where(valid, a, np.nan)
+    # 已经是"上方无效、下方全有效"的列不用移动（逐日追加时绝大多数股票如此）
+    moved = np.flatnonzero(~(valid[1:] >= valid[:-1]).all(axis=0)) if rows > 1 else np.arange(0)
+    if len(moved):
+        sub = valid[:, moved]
+        dest = rows - sub.sum(axis=0) + np.cumsum(sub, axis=0) - 1
+        t_idx, k_idx = np.nonzero(sub)
+        block = np.full((rows, len(moved)), np.nan)
+        block[dest[t_idx, k_idx], k_idx] = a[t_idx, moved[k_idx]]
+        out[:, moved] = block
+    return out
+
+
+def window_sum(a: np.ndarray, p: int) -> np.ndarray:
+    """
+    按行的 p 行滑动窗口和（前 p-1 行为 NaN）
+    逐项顺序累加而不是累积和相减：结果与只对末尾 p 行求和完全一致，增量更新与全量计算逐位相同
+    """
+    out = np.full(a.shape, np.nan)
+    n = len(a) - p + 1
+    if n > 0:
+        s = a[:n].astype(float)
+        for k in range(1, p):
+            s += a[k:k + n]
+        out[p - 1:] = s
+    return out
+
+
+def rolling_max(a: np.ndarray, w: int) -> np.ndarray:
+    """按行的 w 行滑动最大值（忽略 NaN；van Herk 分块前缀/后缀最大值，与 w 无关的 O(T·N)）"""
+    return _rolling_extreme(a, w, np.fmax)
+
+
+def rolling_min(a: np.ndarray, w: int) -> np.ndarray:
+    return _rolling_extreme(a, w, np.fmin)
+
+
+def _rolling_extreme(a: np.ndarray, w: int, op) -> np.ndarray:
+    t = len(a)
+    out = np.full(a.shape, np.nan)
+    if t < w:
+        return out
+    if t - w < 8:
+        # 只要最后几行（逐日追加）时直接归约
+        for s in range(t - w + 1):
+            out[s + w - 1] = op.reduce(a[s:s + w], axis=0)
+        return out
+    pad = (-t) % w
+    x = np.concatenate([a, np.full((pad,) + a.shape[1:], np.nan)]).reshape((-1, w) + a.shape[1:])
+    prefix = op.accumulate(x, axis=1).reshape((-1,) + a.shape[1:])
+    suffix = op.accumulate(x[:, ::-1], axis=1)[:, ::-1].reshape((-1,) + a.shape[1:])
+    # 窗口 [s, s+w-1] = 起点所在块的后缀 ∪ 终点所在块的前缀
+    out[w - 1:] = op(suffix[:t - w + 1], prefix[w - 1:t])
+    return out
@@ -0,0 +1,227 @@
+"""
+分析链路的阶段计时与指标导出
+按阶段记录耗时直方图、按接口记录 AKTools 延迟、统计缓存命中率，可导出 Prometheus 文本或 JSON
+
+默认关闭，关闭时每次调用只多一次布尔判断；通过 enable() 或环境变量 STOCK_METRICS=1 开启
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Dict, Tuple
+
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """固定桶直方图（与 Prometheus histogram 同口径）"""
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最后一格为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数（返回所在桶的上限）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(b): n for b, n in zip(self.buckets + ("+Inf",), self.counts)},
+        }
+
+
+class _Span:
+    __slots__ = ("_registry", "_metric", "_label", "_start")
+
+    def __init__(self, registry: "Metrics", metric: str, label: str):
+        self._registry = registry
+        self._metric = metric
+        self._label = label
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._registry.observe(self._metric, self._label, time.perf_counter() - self._start)
+        return False
+
+
+class _NullSpan:
+    """关闭时复用的空计时器"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """
+    指标注册表
+    histograms: {指标名: {标签值: Histogram}}，counters: {指标名: {标签值: 计数}}
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[str, Histogram]] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    # ---------- 开关 ----------
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+    # ---------- 记录 ----------
+
+    def observe(self, metric: str, label: str, seconds: float):
+        with self._lock:
+            series = self.histograms.setdefault(metric, {})
+            hist = series.get(label)
+            if hist is None:
+                hist = series[label] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, metric: str, label: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self.counters.setdefault(metric, {})
+            series[label] = series.get(label, 0) + n
+
+    def span(self, label: str, metric: str = "stage_seconds"):
+        """计时上下文：with METRICS.span("json_parse"): ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, metric, label)
+
+    def timed(self, label: str, metric: str = "stage_seconds"):
+        """计时装饰器（关闭时直接调用原函数）"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(metric, label, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    # ---------- 读取 ----------
+
+    def cache_hit_ratio(self, cache: str) -> float:
+        hits = self.counters.get("cache_hits_total", {}).get(cache, 0)
+        misses = self.counters.get("cache_misses_total", {}).get(cache, 0)
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            data = {
+                "histograms": {m: {label: h.to_dict() for label, h in series.items()}
+                               for m, series in self.histograms.items()},
+                "counters": {m: dict(series) for m, series in self.counters.items()},
+            }
+        caches = set(self.counters.get("cache_hits_total", {})) | set(self.counters.get("cache_misses_total", {}))
+        data["cache_hit_ratio"] = {c: self.cache_hit_ratio(c) for c in sorted(caches)}
+        return data
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def to_prometheus(self, prefix: str = "stock_analysis_") -> str:
+        """Prometheus 文本格式（exposition format 0.0.4）"""
+        lines = []
+        with self._lock:
+            for metric, series in sorted(self.histograms.items()):
+                name = prefix + metric
+                label_key = _label_key(metric)
+                lines.append(f"# TYPE {name} histogram")
+                for label, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets + ("+Inf",), hist.counts):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{{{label_key}="{_escape(label)}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label_key}="{_escape(label)}"}} {hist.sum}')
+                    lines.append(f'{name}_count{{{label_key}="{_escape(label)}"}} {hist.count}')
+            for metric, series in sorted(self.counters.items()):
+                name = prefix + metric
+                label_key = _label_key(metric)
+                lines.append(f"# TYPE {name} counter")
+                for label, value in sorted(series.items()):
+                    lines.append(f'{name}{{{label_key}="{_escape(label)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """导出到文件（.json 为 JSON，其余为 Prometheus 文本）"""
+        content = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+# 指标名 → 标签名
+_LABEL_KEYS = {
+    "aktools_request_seconds": "endpoint",
+    "aktools_errors_total": "endpoint",
+    "cache_hits_total": "cache",
+    "cache_misses_total": "cache",
+    "quote_feed_total": "event",
+    "price_alerts_total": "kind",
+    "service_request_seconds": "route",
+}
+
+
+def _label_key(metric: str) -> str:
+    return _LABEL_KEYS.get(metric, "stage")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# 进程内全局注册表
+METRICS = Metrics(enabled=os.environ.get("STOCK_METRICS", "") not in ("", "0"))
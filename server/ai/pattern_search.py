@@ -0,0 +1,342 @@
+"""
+K线形态相似检索
+“最近 20 根K线和哪些历史片段最像、之后走势如何”：把全市场日K的对数收盘价和对数成交量首尾相接成
+两条长序列，对每个长度为 window 的窗口做 z 标准化后的欧氏距离检索（MASS 思路：滑动点积 +
+滚动均值/标准差，一次向量化算出全部窗口的距离），也可用 LB_Keogh 下界剪枝的 DTW 精排
+
+用法:
+    python pattern_search.py --symbols 5000 --years 10            # 在合成股票池上计时
+    python pattern_search.py --symbols 500 --query 000001 --dtw
+"""
+
+import argparse
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_WINDOW = 20
+DEFAULT_HORIZONS = (5, 10, 20)   # 向后看的交易日数
+VOLUME_WEIGHT = 0.5              # 成交量形态在距离中的权重（收盘价为 1）
+MIN_STD = 1e-6                   # 窗口内几乎不动（停牌、一字板）时不参与检索
+
+
+@dataclass
+class PatternMatch:
+    """相似片段"""
+    symbol: str
+    start_date: str
+    end_date: str
+    distance: float
+    forward_returns: Dict[int, float] = field(default_factory=dict)   # 交易日数 → 之后的涨跌幅（%）
+
+
+def _rolling_stats(x: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """所有窗口的均值和（总体）标准差"""
+    cs = np.concatenate([[0.0], np.cumsum(x)])
+    cs2 = np.concatenate([[0.0], np.cumsum(x * x)])
+    mean = (cs[window:] - cs[:-window]) / window
+    var = (cs2[window:] - cs2[:-window]) / window - mean * mean
+    return mean, np.sqrt(np.maximum(var, 0.0))
+
+
+def _znorm(x: np.ndarray) -> Optional[np.ndarray]:
+    std = x.std()
+    return (x - x.mean()) / std if std > MIN_STD else None
+
+
+def _sliding_dot(q: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """q 与 x 每个窗口的点积（窗口短，按 q 的每一位累加比 FFT 卷积更省内存）"""
+    m = len(q)
+    out = np.zeros(len(x) - m + 1)
+    tmp = np.empty_like(out)
+    for j in range(m):
+        np.multiply(x[j:j + len(out)], q[j], out=tmp)
+        out += tmp
+    return out
+
+
+def _envelope(q: np.ndarray, band: int) -> Tuple[np.ndarray, np.ndarray]:
+    m = len(q)
+    upper = np.array([q[max(0, j - band):j + band + 1].max() for j in range(m)])
+    lower = np.array([q[max(0, j - band):j + band + 1].min() for j in range(m)])
+    return upper, lower
+
+
+def dtw_batch(q: np.ndarray, windows: np.ndarray, band: int) -> np.ndarray:
+    """
+    查询与一批窗口（C × m）的 DTW 距离（平方误差累加，Sakoe-Chiba 窗口）
+    动态规划按格子逐个推进，每一步对整批窗口向量化
+    """
+    count, m = windows.shape
+    prev = np.full((count, m + 1), np.inf)
+    prev[:, 0] = 0.0
+    for i in range(1, m + 1):
+        cur = np.full((count, m + 1), np.inf)
+        for j in range(max(1, i - band), min(m, i + band) + 1):
+            d = windows[:, j - 1] - q[i - 1]
+            cur[:, j] = d * d + np.minimum(np.minimum(prev[:, j], prev[:, j - 1]), cur[:, j - 1])
+        prev = cur
+    return prev[:, m]
+
+
+class PatternIndex:
+    """
+    全市场形态索引
+    add() 逐只加入K线，build() 拼接成连续数组并预计算每个窗口的均值/标准差；
+    跨越两只股票边界或波动过小的窗口不参与检索
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW, volume_weight: float = VOLUME_WEIGHT):
+        self.window = window
+        self.volume_weight = volume_weight
+        self.symbols: List[str] = []
+        self.dates: List[List[str]] = []
+        self._closes: List[np.ndarray] = []
+        self._volumes: List[np.ndarray] = []
+        self._built = False
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, symbol: str, klines: List[Dict]):
+        if len(klines) < self.window:
+            return
+        self.symbols.append(symbol)
+        self.dates.append([k["date"] for k in klines])
+        self._closes.append(np.log(np.array([k["close"] for k in klines], dtype=float)))
+        self._volumes.append(np.log1p(np.array([k["volume"] for k in klines], dtype=float)))
+        self._built = False
+
+    @classmethod
+    def from_store(cls, store, symbols: Optional[List[str]] = None, window: int = DEFAULT_WINDOW) -> "PatternIndex":
+        """用本地K线存储（前复权视图）建索引"""
+        index = cls(window)
+        for symbol in symbols or store.symbols():
+            index.add(symbol, store.get_daily(symbol))
+        return index.build()
+
+    def build(self) -> "PatternIndex":
+        m = self.window
+        lengths = np.array([len(c) for c in self._closes], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.close = np.concatenate(self._closes) if self._closes else np.zeros(0)
+        self.volume = np.concatenate(self._volumes) if self._volumes else np.zeros(0)
+        n_windows = max(0, len(self.close) - m + 1)
+
+        # 窗口起点所在的股票；起点距本股票末尾不足一个窗口的窗口跨越了边界
+        self.owner = np.repeat(np.arange(len(lengths)), lengths)[:n_windows]
+        starts = np.arange(n_windows)
+        valid = starts + m <= self.offsets[self.owner + 1]
+        if n_windows:
+            self.close_mean, self.close_std = _rolling_stats(self.close, m)
+            self.volume_mean, self.volume_std = _rolling_stats(self.volume, m)
+            valid &= self.close_std > MIN_STD
+        self.valid = valid
+        self._built = True
+        return self
+
+    # ---------- 检索 ----------
+
+    def locate(self, symbol: str, end_date: Optional[str] = None) -> Optional[int]:
+        """某只股票截至 end_date（默认最新）的最后一个窗口的起点（全局下标）"""
+        try:
+            s = self.symbols.index(symbol)
+        except ValueError:
+            return None
+        dates = self.dates[s]
+        end = len(dates) - 1 if end_date is None else int(np.searchsorted(dates, end_date, side="right")) - 1
+        if end < self.window - 1:
+            return None
+        return int(self.offsets[s]) + end - self.window + 1
+
+    def _profile(self, q_close: np.ndarray, q_volume: Optional[np.ndarray]) -> np.ndarray:
+        """z 标准化欧氏距离的平方：d² = 2(m - Σq·x / σ)（q 已标准化，Σq = 0）"""
+        m = self.window
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d2 = 2 * (m - _sliding_dot(q_close, self.close) / self.close_std)
+            if q_volume is not None:
+                vol_d2 = 2 * (m - _sliding_dot(q_volume, self.volume) / self.volume_std)
+                # 成交量不变的窗口按“与查询完全不相关”计
+                d2 += self.volume_weight * np.where(self.volume_std > MIN_STD, vol_d2, 2 * m)
+        return np.where(self.valid, np.maximum(d2, 0.0), np.inf)
+
+    def _lb_keogh(self, q: np.ndarray, series: np.ndarray, mean: np.ndarray, std: np.ndarray,
+                  band: int, starts: np.ndarray) -> np.ndarray:
+        """一批窗口相对查询包络的 LB_Keogh（DTW 距离的下界）"""
+        upper, lower = _envelope(q, band)
+        mean, std = mean[starts], np.where(std[starts] > MIN_STD, std[starts], np.inf)
+        lb = np.zeros(len(starts))
+        for j in range(self.window):
+            c = (series[starts + j] - mean) / std
+            lb += np.square(np.maximum(c - upper[j], 0.0)) + np.square(np.maximum(lower[j] - c, 0.0))
+        return lb
+
+    def _windows(self, starts: np.ndarray, series: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+        """一批窗口的 z 标准化值（C × m）"""
+        safe_std = np.where(std[starts] > MIN_STD, std[starts], np.inf)   # 不变的窗口标准化为全 0
+        return (series[starts[:, None] + np.arange(self.window)] - mean[starts, None]) / safe_std[:, None]
+
+    def search(self, closes: List[float], volumes: Optional[List[float]] = None, k: int = 10,
+               horizons=DEFAULT_HORIZONS, exclude: Optional[Tuple[str, int]] = None,
+               dtw_band: int = 0) -> List[PatternMatch]:
+        """
+        与给定的 window 根收盘价（和成交量）最相似的 k 个历史片段
+        exclude: (股票, 全局起点)，排除查询自身附近的窗口
+        dtw_band > 0 时按 DTW 距离排序：欧氏距离是 DTW 的上界、LB_Keogh 是下界，
+        先用欧氏距离的第 k 名作门槛，只对下界不超过门槛的窗口精算 DTW
+        """
+        if not self._built:
+            self.build()
+        m = self.window
+        if len(closes) != m or not len(self.valid):
+            return []
+        q_close = _znorm(np.log(np.asarray(closes, dtype=float)))
+        if q_close is None:
+            return []
+        q_volume = _znorm(np.log1p(np.asarray(volumes, dtype=float))) if volumes is not None else None
+
+        dist = self._profile(q_close, q_volume)
+        if exclude is not None:
+            self._mask_exclusion(dist, exclude)
+        pool = min(len(dist), k * 2 * m)
+        candidates = np.argpartition(dist, pool - 1)[:pool]
+        scores = self._distinct([(float(dist[i]), int(i)) for i in candidates if np.isfinite(dist[i])], k)
+        if dtw_band > 0 and scores:
+            scores = self._dtw_scores(q_close, q_volume, dtw_band, dist, scores[-1][0], k)
+        return [self._match(start, math.sqrt(d2), horizons) for d2, start in scores]
+
+    def search_symbol(self, symbol: str, end_date: Optional[str] = None, k: int = 10,
+                      horizons=DEFAULT_HORIZONS, dtw_band: int = 0) -> List[PatternMatch]:
+        """某只股票截至 end_date 的最后 window 根K线作为查询"""
+        if not self._built:
+            self.build()
+        start = self.locate(symbol, end_date)
+        if start is None:
+            return []
+        closes = np.exp(self.close[start:start + self.window])
+        volumes = np.expm1(self.volume[start:start + self.window])
+        return self.search(closes, volumes, k, horizons, (symbol, start), dtw_band)
+
+    def _mask_exclusion(self, dist: np.ndarray, exclude: Tuple[str, int]):
+        """同一只股票与查询窗口重叠的窗口（以及查询之后的窗口，避免用到“未来”）不参与检索"""
+        symbol, start = exclude
+        if symbol in self.symbols:
+            s = self.symbols.index(symbol)
+            dist[max(int(self.offsets[s]), start - self.window + 1):int(self.offsets[s + 1])] = np.inf
+
+    def _dtw_scores(self, q_close: np.ndarray, q_volume: Optional[np.ndarray], band: int,
+                    dist: np.ndarray, threshold: float, k: int, chunk: int = 20000) -> List[Tuple[float, int]]:
+        """
+        下界级联剪枝：依次用收盘价的下界、加上成交量的下界、收盘价的 DTW 加成交量的下界筛掉超过门槛的窗口，
+        按下界从小到大分批精算，每批之后用当前第 k 名收紧门槛
+        """
+        candidates = np.nonzero(np.isfinite(dist))[0]
+        lb = self._lb_keogh(q_close, self.close, self.close_mean, self.close_std, band, candidates)
+        keep = lb <= threshold
+        candidates, lb = candidates[keep], lb[keep]
+        vol_lb = np.zeros(len(candidates))
+        if q_volume is not None:
+            vol_lb = self.volume_weight * self._lb_keogh(q_volume, self.volume, self.volume_mean, self.volume_std,
+                                                         band, candidates)
+            keep = lb + vol_lb <= threshold
+            candidates, lb, vol_lb = candidates[keep], lb[keep], vol_lb[keep]
+        order = np.argsort(lb + vol_lb, kind="stable")
+        candidates, lb, vol_lb = candidates[order], lb[order], vol_lb[order]
+
+        scores: List[Tuple[float, int]] = []
+        for i in range(0, len(candidates), chunk):
+            keep = lb[i:i + chunk] + vol_lb[i:i + chunk] <= threshold
+            if not keep.any():
+                break   # 按下界升序，后面的只会更大
+            starts, rest = candidates[i:i + chunk][keep], vol_lb[i:i + chunk][keep]
+            d2 = dtw_batch(q_close, self._windows(starts, self.close, self.close_mean, self.close_std), band)
+            if q_volume is not None:
+                # 收盘价的 DTW 加上成交量的下界已经超过门槛的，不再算成交量的 DTW
+                keep = d2 + rest <= threshold
+                starts, d2 = starts[keep], d2[keep]
+                windows = self._windows(starts, self.volume, self.volume_mean, self.volume_std)
+                vol_d2 = np.where(self.volume_std[starts] > MIN_STD, dtw_batch(q_volume, windows, band), 2 * self.window)
+                d2 = d2 + self.volume_weight * vol_d2
+            scores = self._distinct(scores + [(d, s) for d, s in zip(d2.tolist(), starts.tolist()) if d <= threshold],
+                                    k * 2 * self.window)
+            best = self._distinct(scores, k)
+            if len(best) == k:
+                threshold = min(threshold, best[-1][0])
+        return self._distinct(scores, k)
+
+    def _distinct(self, scores: List[Tuple[float, int]], k: int) -> List[Tuple[float, int]]:
+        """按距离取前 k 个，同一只股票上互相重叠的窗口只保留最好的一个"""
+        chosen: List[Tuple[float, int]] = []
+        for d2, start in sorted(scores):
+            owner = self.owner[start]
+            if any(self.owner[s] == owner and abs(s - start) < self.window for _, s in chosen):
+                continue
+            chosen.append((d2, start))
+            if len(chosen) == k:
+                break
+        return chosen
+
+    def _match(self, start: int, distance: float, horizons) -> PatternMatch:
+        s = int(self.owner[start])
+        local = start - int(self.offsets[s])
+        end = local + self.window - 1
+        dates = self.dates[s]
+        closes = self.close[self.offsets[s]:self.offsets[s + 1]]
+        forward = {h: round(math.expm1(closes[end + h] - closes[end]) * 100, 2)
+                   for h in horizons if end + h < len(closes)}
+        return PatternMatch(self.symbols[s], dates[local], dates[end], distance, forward)
+
+
+def summarize(matches: List[PatternMatch], horizons=DEFAULT_HORIZONS) -> Dict[int, Dict[str, float]]:
+    """相似片段之后的平均涨跌幅和上涨比例"""
+    summary = {}
+    for h in horizons:
+        returns = [m.forward_returns[h] for m in matches if h in m.forward_returns]
+        if returns:
+            summary[h] = {
+                "count": len(returns),
+                "mean": round(sum(returns) / len(returns), 2),
+                "up_ratio": round(sum(r > 0 for r in returns) / len(returns), 2),
+            }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="K线形态相似检索（合成股票池计时）")
+    parser.add_argument("--symbols", type=int, default=5000, help="股票数量")
+    parser.add_argument("--years", type=float, default=10, help="每只股票的历史年数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser.add_argument("--query", default=None, help="查询股票（默认股票池第一只）")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--dtw", action="store_true", help="按 DTW 距离排序")
+    args = parser.parse_args()
+
+    sys.path.append('.')
+    from synthetic import generate_universe
+
+    start = time.perf_counter()
+    index = PatternIndex(args.window)
+    for symbol, klines in generate_universe(args.symbols, args.years, args.seed, date.today()):
+        index.add(symbol, klines)
+    index.build()
+    print(f"📦 {len(index)} 只股票, {len(index.close):,} 根日K，建索引 {time.perf_counter() - start:.1f}s")
+
+    query = args.query or index.symbols[0]
+    start = time.perf_counter()
+    matches = index.search_symbol(query, k=args.k, dtw_band=max(1, args.window // 10) if args.dtw else 0)
+    print(f"🔍 {query} 最近 {args.window} 根K线，检索耗时 {time.perf_counter() - start:.2f}s")
+    for m in matches:
+        fwd = " ".join(f"{h}日{r:+.2f}%" for h, r in m.forward_returns.items())
+        print(f"   {m.symbol} {m.start_date}~{m.end_date} 距离={m.distance:.3f}  {fwd}")
+    for h, s in summarize(matches).items():
+        print(f"   之后{h}日: 平均{s['mean']:+.2f}% 上涨比例{s['up_ratio']:.0%}（{s['count']}个）")
+
+
+if __name__ == "__main__":
+    main()
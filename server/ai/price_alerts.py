@@ -0,0 +1,280 @@
+"""
+价格提醒（止损 / 止盈 / 进场价）
+把 (股票, 价位, 方向) 阈值按股票放进有序数组，每来一笔行情只二分查找上一价格与当前价格之间的价位，
+单笔行情的开销是 O(log k + 触发数)，与阈值总数无关；只在价格穿越价位时产生事件
+
+阈值来源:
+- AnalysisResult 的三档止损位（向下）和分批进场价
+- 交易记忆中持仓的 stop_loss（向下）/ target_price（向上）
+
+用法:
+    python price_alerts.py 300433 600519      # 对这两只股票做一次分析，按其止损位/进场价实时提醒
+"""
+
+import itertools
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, Optional, Callable, Iterable
+
+from metrics import METRICS
+
+BELOW = "below"   # 价格跌到价位及以下时触发
+ABOVE = "above"   # 价格涨到价位及以上时触发
+
+_ids = itertools.count(1)
+
+
+@dataclass
+class Threshold:
+    """一个提醒价位"""
+    symbol: str
+    level: float
+    direction: str                # BELOW | ABOVE
+    kind: str = "custom"          # stop_loss_moderate / target / entry_1 ...
+    once: bool = True             # 触发后移除；False 时每次穿越都触发
+    payload: object = None
+    id: int = field(default_factory=lambda: next(_ids))
+
+
+@dataclass
+class AlertEvent:
+    """价格穿越事件"""
+    threshold: Threshold
+    price: float
+    prev_price: Optional[float]
+    time: str
+
+
+class _Book:
+    """一只股票的阈值：按价位升序"""
+    __slots__ = ("levels", "thresholds", "last")
+
+    def __init__(self):
+        self.levels: List[float] = []
+        self.thresholds: List[Threshold] = []
+        self.last: Optional[float] = None
+
+    def add(self, threshold: Threshold):
+        i = bisect_right(self.levels, threshold.level)
+        self.levels.insert(i, threshold.level)
+        self.thresholds.insert(i, threshold)
+
+    def remove(self, threshold: Threshold) -> bool:
+        i = bisect_left(self.levels, threshold.level)
+        while i < len(self.levels) and self.levels[i] == threshold.level:
+            if self.thresholds[i] is threshold:
+                del self.levels[i]
+                del self.thresholds[i]
+                return True
+            i += 1
+        return False
+
+    def crossed(self, price: float) -> List[Threshold]:
+        """从 last 到 price 穿越的阈值（首笔行情：已经越过的价位都算触发）"""
+        prev, self.last = self.last, price
+        if prev is None:
+            below = self.thresholds[bisect_left(self.levels, price):]
+            above = self.thresholds[:bisect_right(self.levels, price)]
+            return [t for t in below if t.direction == BELOW] + [t for t in above if t.direction == ABOVE]
+        if price < prev:
+            # 向下穿越：price <= level < prev
+            hit = self.thresholds[bisect_left(self.levels, price):bisect_left(self.levels, prev)]
+            return [t for t in hit if t.direction == BELOW]
+        if price > prev:
+            # 向上穿越：prev < level <= price
+            hit = self.thresholds[bisect_right(self.levels, prev):bisect_right(self.levels, price)]
+            return [t for t in hit if t.direction == ABOVE]
+        return []
+
+
+class AlertEngine:
+    """
+    价格提醒引擎
+    on_quote 可以在行情线程里直接调用；增删阈值与行情处理互斥
+    """
+
+    def __init__(self):
+        self._books: Dict[str, _Book] = {}
+        self._by_id: Dict[int, Threshold] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[AlertEvent], None]] = []
+
+    def __len__(self):
+        return len(self._by_id)
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._books)
+
+    # ---------- 阈值 ----------
+
+    def add(self, threshold: Threshold) -> Threshold:
+        if threshold.direction not in (BELOW, ABOVE):
+            raise ValueError(f"未知的方向: {threshold.direction}")
+        with self._lock:
+            book = self._books.get(threshold.symbol)
+            if book is None:
+                book = self._books[threshold.symbol] = _Book()
+            book.add(threshold)
+            self._by_id[threshold.id] = threshold
+        return threshold
+
+    def add_many(self, thresholds: Iterable[Threshold]) -> int:
+        n = 0
+        for threshold in thresholds:
+            self.add(threshold)
+            n += 1
+        return n
+
+    def remove(self, threshold_id: int) -> bool:
+        with self._lock:
+            return self._remove(threshold_id)
+
+    def _remove(self, threshold_id: int) -> bool:
+        threshold = self._by_id.pop(threshold_id, None)
+        if threshold is None:
+            return False
+        book = self._books[threshold.symbol]
+        book.remove(threshold)
+        if not book.levels:
+            del self._books[threshold.symbol]
+        return True
+
+    def clear(self, symbol: Optional[str] = None):
+        """清空阈值（symbol 为 None 时清空全部）"""
+        with self._lock:
+            if symbol is None:
+                self._books.clear()
+                self._by_id.clear()
+                return
+            book = self._books.pop(symbol, None)
+            for threshold in book.thresholds if book else ():
+                self._by_id.pop(threshold.id, None)
+
+    def thresholds(self, symbol: str) -> List[Threshold]:
+        book = self._books.get(symbol)
+        return list(book.thresholds) if book else []
+
+    # ---------- 行情 ----------
+
+    def listen(self, callback: Callable[[AlertEvent], None]):
+        """注册事件回调（在调用 on_quote 的线程中执行）"""
+        self._listeners.append(callback)
+
+    def on_quote(self, symbol: str, price: float, time: Optional[str] = None) -> List[AlertEvent]:
+        """处理一笔行情，返回本次触发的事件"""
+        book = self._books.get(symbol)
+        if book is None or price != price:   # 没有阈值 / 停牌（NaN）
+            return []
+        with self._lock:
+            prev = book.last
+            hit = book.crossed(price)
+            for threshold in hit:
+                if threshold.once:
+                    self._remove(threshold.id)
+        if not hit:
+            return []
+        time = time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        events = [AlertEvent(threshold, price, prev, time) for threshold in hit]
+        for event in events:
+            METRICS.inc("price_alerts_total", event.threshold.kind)
+            for callback in self._listeners:
+                callback(event)
+        return events
+
+    def on_quotes(self, quotes: Dict, time: Optional[str] = None) -> List[AlertEvent]:
+        """处理一轮行情 {symbol: Quote}（只遍历有阈值的股票和本轮变化的股票中较少的一方）"""
+        if len(quotes) > len(self._books):
+            pairs = [(s, quotes[s]) for s in list(self._books) if s in quotes]
+        else:
+            pairs = [(s, q) for s, q in quotes.items() if s in self._books]
+        events = []
+        for symbol, quote in pairs:
+            events += self.on_quote(symbol, quote.price, time)
+        return events
+
+    def watch(self, feed, callback: Optional[Callable[[AlertEvent], None]] = None) -> threading.Thread:
+        """订阅 QuoteFeed（全市场，之后新增的阈值也能收到行情），在后台线程中处理"""
+        if callback is not None:
+            self.listen(callback)
+        sub = feed.subscribe()
+
+        def consume():
+            for update in sub:
+                self.on_quotes(update.quotes, update.time)
+
+        thread = threading.Thread(target=consume, name="price-alerts", daemon=True)
+        thread.start()
+        return thread
+
+
+# ==================== 阈值来源 ====================
+
+def thresholds_from_result(result, entries: bool = True) -> List[Threshold]:
+    """AnalysisResult 的三档止损位（向下），以及分批进场价（回踩向下、突破向上）"""
+    thresholds = [
+        Threshold(result.symbol, result.stop_loss_aggressive, BELOW, "stop_loss_aggressive", payload=result),
+        Threshold(result.symbol, result.stop_loss_moderate, BELOW, "stop_loss_moderate", payload=result),
+        Threshold(result.symbol, result.stop_loss_conservative, BELOW, "stop_loss_conservative", payload=result),
+    ]
+    if entries:
+        for entry in result.entry_suggestions:
+            direction = ABOVE if entry["entry_price"] >= result.price else BELOW
+            thresholds.append(Threshold(result.symbol, entry["entry_price"], direction,
+                                        f"entry_{entry['batch']}", payload=entry))
+    return [t for t in thresholds if t.level and t.level > 0]
+
+
+def thresholds_from_positions(positions: Iterable) -> List[Threshold]:
+    """交易记忆中的持仓（Position）：stop_loss 向下、target_price 向上"""
+    thresholds = []
+    for p in positions:
+        if p.stop_loss:
+            thresholds.append(Threshold(p.symbol, p.stop_loss, BELOW, "stop_loss", payload=p))
+        if p.target_price:
+            thresholds.append(Threshold(p.symbol, p.target_price, ABOVE, "target", payload=p))
+    return thresholds
+
+
+def format_event(event: AlertEvent) -> str:
+    t = event.threshold
+    arrow = "跌破" if t.direction == BELOW else "突破"
+    return f"🔔 [{event.time}] {t.symbol} {arrow} {t.kind} {t.level:.2f}（现价 {event.price:.2f}）"
+
+
+def main():
+    import argparse
+    from full_analysis import analyze_stock
+    from quote_feed import QuoteFeed, DEFAULT_INTERVAL
+
+    parser = argparse.ArgumentParser(description="止损/进场价提醒")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="行情轮询间隔（秒）")
+    args = parser.parse_args()
+
+    engine = AlertEngine()
+    for symbol in args.symbols:
+        result = analyze_stock(symbol)
+        if result is None:
+            print(f"❌ {symbol} 分析失败，跳过")
+            continue
+        engine.add_many(thresholds_from_result(result))
+    if not len(engine):
+        return
+    for symbol in engine.symbols:
+        levels = ", ".join(f"{t.kind}={t.level:.2f}" for t in engine.thresholds(symbol))
+        print(f"   {symbol}: {levels}")
+
+    feed = QuoteFeed(args.interval).start()
+    engine.watch(feed, lambda event: print(format_event(event)))
+    print(f"📡 监控 {len(engine)} 个价位（Ctrl+C 退出）")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        feed.stop()
+
+
+if __name__ == "__main__":
+    main()
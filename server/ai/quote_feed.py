@@ -0,0 +1,303 @@
+"""
+实时行情推送
+交易时段内按固定间隔拉取一次全市场快照（stock_zh_a_spot_em），与上一次快照比较，
+只把有变化的股票推送给订阅者（线程队列或 asyncio 队列）；
+不管有多少个消费方（分析、提醒、止损监控），上游每个间隔只收到一次请求
+
+用法:
+    python quote_feed.py 300433 600519          # 打印这两只股票的变化
+    python quote_feed.py --interval 5           # 订阅全市场，打印每轮变化数量
+"""
+
+import asyncio
+import math
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Callable, Iterable
+
+from full_analysis import TRADING_CALENDAR, call_aktools
+from kline_clean import to_number
+from metrics import METRICS
+
+DEFAULT_INTERVAL = 3.0   # 秒
+# 交易时段（含 9:15 开始的集合竞价）
+TRADING_SESSIONS = (("09:15", "11:30"), ("13:00", "15:00"))
+QUEUE_SIZE = 100         # 每个订阅者最多积压多少轮更新，满了丢弃最旧的
+
+
+@dataclass
+class Quote:
+    """单只股票的实时行情"""
+    symbol: str
+    name: str
+    price: float
+    change_pct: float
+    volume: float
+    amount: float
+    open: float
+    high: float
+    low: float
+    prev_close: float
+
+    def key(self) -> tuple:
+        """判断是否变化的字段（NaN 视为相等）"""
+        return tuple(None if math.isnan(v) else v for v in (self.price, self.volume, self.amount))
+
+
+@dataclass
+class QuoteUpdate:
+    """一轮推送：本轮发生变化的股票"""
+    time: str
+    quotes: Dict[str, Quote]
+
+
+def parse_spot_rows(rows: List[Dict]) -> Dict[str, Quote]:
+    """解析 stock_zh_a_spot_em 的返回（停牌股票的价格为 NaN）"""
+    quotes = {}
+    for row in rows or []:
+        symbol = str(row.get("代码", ""))
+        if not symbol:
+            continue
+        quotes[symbol] = Quote(
+            symbol=symbol,
+            name=str(row.get("名称", "")),
+            price=to_number(row.get("最新价")),
+            change_pct=to_number(row.get("涨跌幅")),
+            volume=to_number(row.get("成交量")),
+            amount=to_number(row.get("成交额")),
+            open=to_number(row.get("今开")),
+            high=to_number(row.get("最高")),
+            low=to_number(row.get("最低")),
+            prev_close=to_number(row.get("昨收")),
+        )
+    return quotes
+
+
+def diff_quotes(previous: Dict[str, Quote], current: Dict[str, Quote]) -> Dict[str, Quote]:
+    """本次快照中新出现或行情有变化的股票"""
+    changed = {}
+    for symbol, quote in current.items():
+        old = previous.get(symbol)
+        if old is None or old.key() != quote.key():
+            changed[symbol] = quote
+    return changed
+
+
+def is_trading_time(now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now()
+    if not TRADING_CALENDAR.is_trading_day(now.date().isoformat()):
+        return False
+    hm = now.strftime("%H:%M")
+    return any(start <= hm < end for start, end in TRADING_SESSIONS)
+
+
+def next_session_start(now: Optional[datetime] = None) -> datetime:
+    """下一个交易时段的开始时间"""
+    now = now or datetime.now()
+    today = now.date().isoformat()
+    if TRADING_CALENDAR.is_trading_day(today):
+        for start, _ in TRADING_SESSIONS:
+            at = datetime.strptime(f"{today} {start}", "%Y-%m-%d %H:%M")
+            if at > now:
+                return at
+    day = TRADING_CALENDAR.next(today) or (now.date() + timedelta(days=1)).isoformat()
+    return datetime.strptime(f"{day} {TRADING_SESSIONS[0][0]}", "%Y-%m-%d %H:%M")
+
+
+class Subscription:
+    """
+    订阅（只收 symbols 中股票的变化；symbols 为空表示全市场）
+    线程里用 get() / for update in sub 读取；传入 loop 时推送到 asyncio 队列，用 await sub.aget() 读取
+    """
+
+    def __init__(self, feed: "QuoteFeed", symbols: Optional[Iterable[str]] = None,
+                 maxsize: int = QUEUE_SIZE, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.feed = feed
+        self.symbols = set(symbols) if symbols else None
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize) if loop else queue.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def _put(self, update: QuoteUpdate):
+        """推送（在行情线程中调用）；队列满时丢弃最旧的一轮，消费方总能拿到最新行情"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._put_nowait, update)
+        else:
+            self._put_nowait(update)
+
+    def _put_nowait(self, update: QuoteUpdate):
+        while True:
+            try:
+                self.queue.put_nowait(update)
+                return
+            except (queue.Full, asyncio.QueueFull):
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    METRICS.inc("quote_feed_total", "dropped")
+                except (queue.Empty, asyncio.QueueEmpty):
+                    pass
+
+    def get(self, timeout: Optional[float] = None) -> Optional[QuoteUpdate]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self) -> QuoteUpdate:
+        return await self.queue.get()
+
+    def __iter__(self):
+        while not self.closed:
+            update = self.get(timeout=1.0)
+            if update is not None:
+                yield update
+
+    def close(self):
+        self.closed = True
+        self.feed.unsubscribe(self)
+
+
+class QuoteFeed:
+    """
+    行情推送服务（单个后台线程）
+    按订阅的股票建立索引，每轮只遍历有变化的股票，推送开销与订阅者数量、股票池大小无关
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL,
+                 fetch: Optional[Callable[[], Optional[List[Dict]]]] = None,
+                 trading_hours_only: bool = True):
+        self.interval = interval
+        self.trading_hours_only = trading_hours_only
+        self._fetch = fetch or (lambda: call_aktools("stock_zh_a_spot_em"))
+        self.latest: Dict[str, Quote] = {}
+        self._all: List[Subscription] = []
+        self._by_symbol: Dict[str, List[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- 订阅 ----------
+
+    def subscribe(self, symbols: Optional[Iterable[str]] = None, maxsize: int = QUEUE_SIZE) -> Subscription:
+        return self._add(Subscription(self, symbols, maxsize))
+
+    def subscribe_async(self, symbols: Optional[Iterable[str]] = None, maxsize: int = QUEUE_SIZE) -> Subscription:
+        """在 asyncio 事件循环中订阅"""
+        return self._add(Subscription(self, symbols, maxsize, asyncio.get_running_loop()))
+
+    def _add(self, sub: Subscription) -> Subscription:
+        with self._lock:
+            if sub.symbols is None:
+                self._all.append(sub)
+            else:
+                for symbol in sub.symbols:
+                    self._by_symbol.setdefault(symbol, []).append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._all:
+                self._all.remove(sub)
+            for symbol in sub.symbols or ():
+                subs = self._by_symbol.get(symbol, [])
+                if sub in subs:
+                    subs.remove(sub)
+                if not subs:
+                    self._by_symbol.pop(symbol, None)
+
+    def quote(self, symbol: str) -> Optional[Quote]:
+        """最近一次快照中的行情（不发请求）"""
+        return self.latest.get(symbol)
+
+    # ---------- 拉取与推送 ----------
+
+    def poll_once(self) -> Dict[str, Quote]:
+        """拉取一次快照，推送变化，返回本轮变化的股票"""
+        with METRICS.span("quote_snapshot"):
+            rows = self._fetch()
+        if not rows:
+            return {}
+        current = parse_spot_rows(rows)
+        changed = diff_quotes(self.latest, current)
+        self.latest = current
+        METRICS.inc("quote_feed_total", "ticks")
+        METRICS.inc("quote_feed_total", "changed", len(changed))
+        if changed:
+            self._publish(changed)
+        return changed
+
+    def _publish(self, changed: Dict[str, Quote]):
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            everyone = list(self._all)
+            per_sub: Dict[int, tuple] = {}
+            for symbol, quote in changed.items():
+                for sub in self._by_symbol.get(symbol, ()):
+                    per_sub.setdefault(id(sub), (sub, {}))[1][symbol] = quote
+        for sub in everyone:
+            sub._put(QuoteUpdate(now, changed))
+        for sub, quotes in per_sub.values():
+            sub._put(QuoteUpdate(now, quotes))
+
+    def run(self):
+        """按固定节拍轮询（节拍对齐到开始时间，不随单次请求耗时漂移）；非交易时段休眠到下一个时段"""
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            if self.trading_hours_only and not is_trading_time():
+                wait = (next_session_start() - datetime.now()).total_seconds()
+                self._stop.wait(min(max(wait, 1.0), 600))
+                next_tick = time.monotonic()
+                continue
+            self.poll_once()
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # 请求比间隔还慢：跳过错过的节拍
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self) -> "QuoteFeed":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="quote-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="实时行情推送")
+    parser.add_argument("symbols", nargs="*", help="订阅的股票（默认全市场）")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="轮询间隔（秒）")
+    parser.add_argument("--always", action="store_true", help="非交易时段也轮询")
+    args = parser.parse_args()
+
+    feed = QuoteFeed(args.interval, trading_hours_only=not args.always).start()
+    sub = feed.subscribe(args.symbols or None)
+    print(f"📡 行情推送: {', '.join(args.symbols) if args.symbols else '全市场'}，每 {args.interval:g}s（Ctrl+C 退出）")
+    try:
+        for update in sub:
+            if args.symbols:
+                for q in update.quotes.values():
+                    print(f"   [{update.time}] {q.symbol} {q.name} {q.price:.2f} ({q.change_pct:+.2f}%)")
+            else:
+                print(f"   [{update.time}] {len(update.quotes)} 只股票行情变化")
+    except KeyboardInterrupt:
+        feed.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+"""
+分析报告渲染
+模板在导入时预编译；按章节惰性渲染（只格式化需要的章节），
+支持 text / markdown / html / json 四种格式，并可流式写入文件或 socket
+"""
+
+import html
+import io
+import json
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from metrics import METRICS
+
+LINE = '━' * 60
+
+# 章节顺序
+SECTIONS = ("header", "trend", "momentum", "verdict", "advice", "risk")
+
+FORMATS = ("text", "markdown", "html", "json")
+
+
+def _compile(name: str, source: str, arg: str):
+    """把模板编译为以 f-string 为函数体的 lambda（只在导入时做一次）"""
+    code = compile(f'lambda {arg}: f"""{source}"""', f"<report:{name}>", "eval")
+    return eval(code, _GLOBALS)
+
+
+def _cross_label(cross: str) -> str:
+    return '🟢 金叉' if cross == 'golden' else '🔴 死叉' if cross == 'dead' else '无交叉'
+
+
+def _vol_label(status: str) -> str:
+    return '📉 缩量' if status == 'shrink' else '📈 放量' if status == 'expand' else '➖ 正常'
+
+
+def _rsi_label(zone: str) -> str:
+    return '⚠️ 超买区' if zone == 'overbought' else '🟢 超卖区' if zone == 'oversold' else '正常区'
+
+
+_GLOBALS = {
+    "LINE": LINE,
+    "esc": html.escape,
+    "cross_label": _cross_label,
+    "vol_label": _vol_label,
+    "rsi_label": _rsi_label,
+}
+
+# ==================== 模板 ====================
+# 每个章节: head（每份报告一次）、item（清单逐条）、entry（进场建议逐笔）、empty（无建议）
+
+_TEXT = {
+    "header": {"head": """
+{LINE}
+【日期】{r.date}
+【股票】{r.name} {r.symbol}
+{LINE}
+
+"""},
+    "trend": {"head": """一、日K面技术面评估
+
+1.1 趋势判定
+├─ MA系统：MA5({r.ma5:.2f}) {'>' if r.is_ma_bullish else '<'} MA10({r.ma10:.2f}) {'>' if r.ma10 > r.ma20 else '<'} MA20({r.ma20:.2f})
+│  → {'✅ 多头排列' if r.is_ma_bullish else '❌ 非多头排列'}
+├─ 收盘价位置：{r.price:.2f}元
+│  → 在MA5 {'上方' if r.price_above_ma5 else '下方'} | 在MA10 {'上方' if r.price_above_ma10 else '下方'}
+├─ MACD状态：{'🟢 红柱' if r.macd_is_red else '🔴 绿柱'} {'扩大中' if r.macd_expanding else '缩小中'}
+│  → DIF={r.macd_dif:.4f}, DEA={r.macd_dea:.4f}
+└─ 结论：{'✅ 没走弱，可考虑持有/回补' if r.should_hold else '❌ 有走弱信号，谨慎'}
+
+1.2 支撑压力位
+├─ 激进止损位（MA5）：{r.stop_loss_aggressive:.2f}元
+├─ 稳健止损位（MA10）：{r.stop_loss_moderate:.2f}元
+└─ 保守止损位（MA20）：{r.stop_loss_conservative:.2f}元
+
+1.3 成交量分析
+├─ 量比：{r.vol_ratio:.2f}
+└─ 评价：{vol_label(r.vol_status)}
+
+{LINE}
+
+"""},
+    "momentum": {"head": """二、动能指标评估
+
+2.1 RSI(14)
+└─ 当前值：{r.rsi:.1f} ({rsi_label(r.rsi_zone)})
+
+2.2 MACD
+├─ DIF：{r.macd_dif:.4f}
+├─ DEA：{r.macd_dea:.4f}
+├─ 柱状：{r.macd_histogram:.4f}
+└─ 交叉：{cross_label(r.macd_cross)}
+
+2.3 KDJ
+├─ K={r.kdj_k:.1f}, D={r.kdj_d:.1f}, J={r.kdj_j:.1f}
+└─ 交叉：{cross_label(r.kdj_cross)}
+
+{LINE}
+
+"""},
+    "verdict": {
+        "head": """三、"没走弱"综合判定
+
+得分：{r.not_weakened_score}/5
+
+""",
+        "item": """{item}
+""",
+        "tail": """
+判定结果：{'✅ 满足条件，应该持有' if r.should_hold else '❌ 不满足条件，谨慎/离场'}
+是否有卖出信号：{'🔴 是' if r.should_sell else '✅ 否'}
+
+{LINE}
+
+""",
+    },
+    "advice": {
+        "head": """四、操作建议
+
+""",
+        "entry": """第{e['batch']}笔 ({e['position']})
+├─ 触发条件：{e['trigger']}
+├─ 进场价：{e['entry_price']:.2f}元
+├─ 止损位：{e['stop_loss']:.2f}元
+└─ 目标位：{e['target']:.2f}元
+
+""",
+        "empty": """当前不建议进场，等待更清晰信号。
+""",
+    },
+    "risk": {"head": """
+{LINE}
+
+风险提示：
+⚠️ 投资有风险，以上分析仅供参考，不构成投资建议
+⚠️ 如果跌破止损位，应严格执行止损
+⚠️ 关注大盘整体走势，大盘大跌时个股难独善其身
+
+{LINE}
+"""},
+}
+
+_MARKDOWN = {
+    "header": {"head": """## {r.name}（{r.symbol}）{r.date}
+
+"""},
+    "trend": {"head": """### 一、日K面技术面评估
+
+| 项目 | 数值 | 判断 |
+|------|------|------|
+| 均线 | MA5={r.ma5:.2f} / MA10={r.ma10:.2f} / MA20={r.ma20:.2f} | {'✅ 多头排列' if r.is_ma_bullish else '❌ 非多头排列'} |
+| 收盘价 | {r.price:.2f}元 | MA5{'上方' if r.price_above_ma5 else '下方'}，MA10{'上方' if r.price_above_ma10 else '下方'} |
+| MACD | DIF={r.macd_dif:.4f} / DEA={r.macd_dea:.4f} | {'🟢 红柱' if r.macd_is_red else '🔴 绿柱'}{'扩大中' if r.macd_expanding else '缩小中'} |
+| 止损位 | 激进 {r.stop_loss_aggressive:.2f} / 稳健 {r.stop_loss_moderate:.2f} / 保守 {r.stop_loss_conservative:.2f} | - |
+| 量比 | {r.vol_ratio:.2f} | {vol_label(r.vol_status)} |
+
+"""},
+    "momentum": {"head": """### 二、动能指标评估
+
+- RSI(14)：{r.rsi:.1f}（{rsi_label(r.rsi_zone)}）
+- MACD：DIF={r.macd_dif:.4f}，DEA={r.macd_dea:.4f}，柱状={r.macd_histogram:.4f}（{cross_label(r.macd_cross)}）
+- KDJ：K={r.kdj_k:.1f}，D={r.kdj_d:.1f}，J={r.kdj_j:.1f}（{cross_label(r.kdj_cross)}）
+
+"""},
+    "verdict": {
+        "head": """### 三、"没走弱"综合判定（{r.not_weakened_score}/5）
+
+""",
+        "item": """- {item}
+""",
+        "tail": """
+**判定结果**：{'✅ 满足条件，应该持有' if r.should_hold else '❌ 不满足条件，谨慎/离场'}
+**卖出信号**：{'🔴 是' if r.should_sell else '✅ 否'}
+
+""",
+    },
+    "advice": {
+        "head": """### 四、操作建议
+
+""",
+        "table": """| 批次 | 仓位 | 触发条件 | 进场价 | 止损位 | 目标位 |
+|------|------|----------|--------|--------|--------|
+""",
+        "entry": """| 第{e['batch']}笔 | {e['position']} | {e['trigger']} | {e['entry_price']:.2f} | {e['stop_loss']:.2f} | {e['target']:.2f} |
+""",
+        "empty": """当前不建议进场，等待更清晰信号。
+""",
+    },
+    "risk": {"head": """
+> ⚠️ 投资有风险，以上分析仅供参考，不构成投资建议
+
+---
+
+"""},
+}
+
+_HTML = {
+    "header": {"head": """<h2>{esc(r.name)}（{esc(r.symbol)}）{esc(r.date)}</h2>
+"""},
+    "trend": {"head": """<section><h3>一、日K面技术面评估</h3><ul>
+<li>MA5={r.ma5:.2f} / MA10={r.ma10:.2f} / MA20={r.ma20:.2f}：{'✅ 多头排列' if r.is_ma_bullish else '❌ 非多头排列'}</li>
+<li>收盘价 {r.price:.2f}元：MA5{'上方' if r.price_above_ma5 else '下方'}，MA10{'上方' if r.price_above_ma10 else '下方'}</li>
+<li>MACD：{'🟢 红柱' if r.macd_is_red else '🔴 绿柱'}{'扩大中' if r.macd_expanding else '缩小中'}（DIF={r.macd_dif:.4f}, DEA={r.macd_dea:.4f}）</li>
+<li>止损位：激进 {r.stop_loss_aggressive:.2f} / 稳健 {r.stop_loss_moderate:.2f} / 保守 {r.stop_loss_conservative:.2f}</li>
+<li>量比 {r.vol_ratio:.2f}：{vol_label(r.vol_status)}</li>
+</ul></section>
+"""},
+    "momentum": {"head": """<section><h3>二、动能指标评估</h3><ul>
+<li>RSI(14)：{r.rsi:.1f}（{rsi_label(r.rsi_zone)}）</li>
+<li>MACD：DIF={r.macd_dif:.4f}，DEA={r.macd_dea:.4f}，柱状={r.macd_histogram:.4f}（{cross_label(r.macd_cross)}）</li>
+<li>KDJ：K={r.kdj_k:.1f}，D={r.kdj_d:.1f}，J={r.kdj_j:.1f}（{cross_label(r.kdj_cross)}）</li>
+</ul></section>
+""",
+    },
+    "verdict": {
+        "head": """<section><h3>三、"没走弱"综合判定（{r.not_weakened_score}/5）</h3><ul>
+""",
+        "item": """<li>{esc(item)}</li>
+""",
+        "tail": """</ul>
+<p>判定结果：{'✅ 满足条件，应该持有' if r.should_hold else '❌ 不满足条件，谨慎/离场'}；卖出信号：{'🔴 是' if r.should_sell else '✅ 否'}</p></section>
+""",
+    },
+    "advice": {
+        "head": """<section><h3>四、操作建议</h3>
+""",
+        "table": """<table><tr><th>批次</th><th>仓位</th><th>触发条件</th><th>进场价</th><th>止损位</th><th>目标位</th></tr>
+""",
+        "entry": """<tr><td>第{e['batch']}笔</td><td>{e['position']}</td><td>{esc(e['trigger'])}</td><td>{e['entry_price']:.2f}</td><td>{e['stop_loss']:.2f}</td><td>{e['target']:.2f}</td></tr>
+""",
+        "table_end": """</table>
+""",
+        "empty": """<p>当前不建议进场，等待更清晰信号。</p>
+""",
+        "tail": """</section>
+""",
+    },
+    "risk": {"head": """<p class="risk">⚠️ 投资有风险，以上分析仅供参考，不构成投资建议</p>
+"""},
+}
+
+# 每份报告的外层包裹（与请求的章节无关，保证标签闭合）
+_REPORT_WRAP = {
+    "text": ("", ""),
+    "markdown": ("", ""),
+    "html": ('<article class="report">\n', "</article>\n"),
+}
+
+# 文档级的开头/结尾（流式写多份报告时只写一次）
+_DOCUMENT = {
+    "text": ("", ""),
+    "markdown": ("# 技术分析报告\n\n", ""),
+    "html": ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>技术分析报告</title></head><body>\n',
+             "</body></html>\n"),
+    "json": ("", ""),
+}
+
+
+# 模板片段的参数名：清单逐条用 item，进场建议逐笔用 e，其余用 r（分析结果）
+_PART_ARGS = {"item": "item", "entry": "e"}
+
+
+def _compile_all(templates: Dict) -> Dict:
+    return {
+        section: {part: _compile(f"{section}.{part}", src, _PART_ARGS.get(part, "r"))
+                  for part, src in parts.items()}
+        for section, parts in templates.items()
+    }
+
+
+_COMPILED = {
+    "text": _compile_all(_TEXT),
+    "markdown": _compile_all(_MARKDOWN),
+    "html": _compile_all(_HTML),
+}
+
+
+# ==================== 渲染 ====================
+
+def _render_section(parts: Dict, section: str, result) -> Iterator[str]:
+    yield parts["head"](result)
+    if section == "verdict":
+        item = parts["item"]
+        for text in result.not_weakened_items:
+            yield item(text)
+    elif section == "advice":
+        entries = result.entry_suggestions
+        if entries:
+            if "table" in parts:
+                yield parts["table"](result)
+            entry = parts["entry"]
+            for e in entries:
+                yield entry(e)
+            if "table_end" in parts:
+                yield parts["table_end"](result)
+        else:
+            yield parts["empty"](result)
+    if "tail" in parts:
+        yield parts["tail"](result)
+
+
+def _json_sections(result, sections) -> Dict:
+    """JSON 格式：按章节只取需要的字段"""
+    data = {}
+    for section in sections:
+        if section == "header":
+            data.update(symbol=result.symbol, name=result.name, date=result.date)
+        elif section == "trend":
+            data.update(
+                price=result.price, change_pct=result.change_pct, volume=result.volume,
+                ma5=result.ma5, ma10=result.ma10, ma20=result.ma20,
+                is_ma_bullish=result.is_ma_bullish,
+                price_above_ma5=result.price_above_ma5, price_above_ma10=result.price_above_ma10,
+                price_above_ma20=result.price_above_ma20,
+                stop_loss_aggressive=result.stop_loss_aggressive,
+                stop_loss_moderate=result.stop_loss_moderate,
+                stop_loss_conservative=result.stop_loss_conservative,
+                vol_ratio=result.vol_ratio, vol_status=result.vol_status,
+            )
+        elif section == "momentum":
+            data.update(
+                rsi=result.rsi, rsi_zone=result.rsi_zone,
+                macd_dif=result.macd_dif, macd_dea=result.macd_dea,
+                macd_histogram=result.macd_histogram, macd_is_red=result.macd_is_red,
+                macd_expanding=result.macd_expanding, macd_cross=result.macd_cross,
+                kdj_k=result.kdj_k, kdj_d=result.kdj_d, kdj_j=result.kdj_j, kdj_cross=result.kdj_cross,
+            )
+        elif section == "verdict":
+            data.update(
+                not_weakened_score=result.not_weakened_score,
+                not_weakened_items=result.not_weakened_items,
+                should_hold=result.should_hold, should_sell=result.should_sell,
+            )
+        elif section == "advice":
+            data["entry_suggestions"] = result.entry_suggestions
+    return data
+
+
+def _check(fmt: str, sections: Optional[Iterable[str]]) -> List[str]:
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的报告格式: {fmt}")
+    if sections is None:
+        return list(SECTIONS)
+    sections = list(sections)
+    unknown = [s for s in sections if s not in SECTIONS]
+    if unknown:
+        raise ValueError(f"未知的报告章节: {', '.join(unknown)}")
+    return [s for s in SECTIONS if s in sections]
+
+
+def render(result, fmt: str = "text", sections: Optional[Iterable[str]] = None) -> Iterator[str]:
+    """
+    逐块渲染一份报告（生成器）
+    sections 为 None 时渲染全部章节；未请求的章节完全不会被格式化
+    """
+    return _render(result, fmt, _check(fmt, sections))
+
+
+def _render(result, fmt: str, sections: List[str]) -> Iterator[str]:
+    if fmt == "json":
+        yield json.dumps(_json_sections(result, sections), ensure_ascii=False) + "\n"
+        return
+    compiled = _COMPILED[fmt]
+    opening, closing = _REPORT_WRAP[fmt]
+    if opening:
+        yield opening
+    for section in sections:
+        yield from _render_section(compiled[section], section, result)
+    if closing:
+        yield closing
+
+
+def render_report(result, fmt: str = "text", sections: Optional[Iterable[str]] = None) -> str:
+    """渲染一份完整报告为字符串"""
+    return "".join(render(result, fmt, sections))
+
+
+# ==================== 流式输出 ====================
+
+class ReportWriter:
+    """
+    把多份报告流式写入文件或 socket
+    渲染结果先攒到缓冲区，满 buffer_size 字符再一次性写出，减少系统调用
+    """
+
+    def __init__(self, out, fmt: str = "text", sections: Optional[Iterable[str]] = None,
+                 buffer_size: int = 64 * 1024, encoding: str = "utf-8"):
+        self.fmt = fmt
+        self.sections = _check(fmt, sections)
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self.count = 0
+        self._out = out
+        self._chunks: List[str] = []
+        self._pending = 0
+        if hasattr(out, "sendall"):
+            self._emit = lambda text: out.sendall(text.encode(encoding))
+        elif isinstance(out, io.TextIOBase):
+            self._emit = out.write
+        else:
+            self._emit = lambda text: out.write(text.encode(encoding))
+        self._push(_DOCUMENT[fmt][0])
+
+    def _push(self, chunk: str):
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self._pending += len(chunk)
+        if self._pending >= self.buffer_size:
+            self.flush()
+
+    def write(self, result):
+        """写入一份报告"""
+        with METRICS.span("render_report"):
+            for chunk in _render(result, self.fmt, self.sections):
+                self._push(chunk)
+        self.count += 1
+
+    def write_all(self, results: Iterable) -> int:
+        for result in results:
+            if result is not None:
+                self.write(result)
+        return self.count
+
+    def flush(self):
+        if self._chunks:
+            self._emit("".join(self._chunks))
+            self._chunks = []
+            self._pending = 0
+        if hasattr(self._out, "flush"):
+            self._out.flush()
+
+    def close(self):
+        """写出文档结尾并刷新缓冲（不关闭底层文件/socket）"""
+        self._push(_DOCUMENT[self.fmt][1])
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_reports(results: Iterable, out, fmt: str = "text",
+                   sections: Optional[Iterable[str]] = None) -> int:
+    """把一批分析结果流式写入 out（文件对象或 socket），返回写出的报告数"""
+    with ReportWriter(out, fmt, sections) as writer:
+        return writer.write_all(results)
@@ -0,0 +1,153 @@
+"""
+多周期K线重采样
+由本地日K线合成周K、月K以及任意N日K，无需再次请求上游
+"""
+
+from datetime import date
+from typing import List, Dict, Optional, Tuple, Callable
+
+from trade_calendar import weekday_index
+
+# 周期名称 → (类型, N)
+TIMEFRAME_ALIASES = {
+    "daily": ("daily", 1),
+    "d": ("daily", 1),
+    "weekly": ("weekly", 1),
+    "w": ("weekly", 1),
+    "monthly": ("monthly", 1),
+    "m": ("monthly", 1),
+}
+
+# 每根K线大约对应的交易日数（用于估算需要多少日K）
+TIMEFRAME_SPAN = {"daily": 1, "weekly": 5, "monthly": 21}
+
+
+def parse_timeframe(timeframe: str) -> Tuple[str, int]:
+    """
+    解析周期字符串
+    支持 'daily' / 'weekly' / 'monthly' 以及 'Nd'（如 '3d' 表示3日K）
+    """
+    tf = (timeframe or "daily").strip().lower()
+    if tf in TIMEFRAME_ALIASES:
+        return TIMEFRAME_ALIASES[tf]
+    if tf.endswith("d") and tf[:-1].isdigit() and int(tf[:-1]) > 0:
+        n = int(tf[:-1])
+        return ("daily", 1) if n == 1 else ("nday", n)
+    raise ValueError(f"不支持的周期: {timeframe}")
+
+
+def timeframe_span(timeframe: str) -> int:
+    """一根该周期K线大约包含的交易日数"""
+    kind, n = parse_timeframe(timeframe)
+    if kind == "nday":
+        return n
+    return TIMEFRAME_SPAN[kind]
+
+
+def _to_date(date_str: str) -> date:
+    return date.fromisoformat(str(date_str)[:10])
+
+
+def _calendar_key(kind: str, date_str: str) -> tuple:
+    """周/月K的分组键"""
+    d = _to_date(date_str)
+    if kind == "weekly":
+        iso = d.isocalendar()
+        return (iso[0], iso[1])
+    return (d.year, d.month)
+
+
+def aggregate_bars(members: List[Dict], prev_close: Optional[float]) -> Dict:
+    """把一组日K聚合为一根K线（OHLC + 量额 + 涨跌幅）"""
+    first = members[0]
+    last = members[-1]
+    close = last["close"]
+    if prev_close is None:
+        # 第一根没有上一周期收盘价，用首日涨跌幅倒推昨收
+        chg = first.get("change_pct", 0) or 0
+        prev_close = first["close"] / (1 + chg / 100) if chg > -100 else first["open"]
+    return {
+        "date": last["date"],
+        "start_date": first["date"],
+        "open": first["open"],
+        "close": close,
+        "high": max(k["high"] for k in members),
+        "low": min(k["low"] for k in members),
+        "volume": sum(k["volume"] for k in members),
+        "amount": sum(k.get("amount", 0) for k in members),
+        "change_pct": round((close / prev_close - 1) * 100, 2) if prev_close else 0.0,
+        "bars": len(members),
+        "partial": False,
+    }
+
+
+class Resampler:
+    """
+    增量重采样器
+    已完成的周期只计算一次；新日K到来时只更新最后一个（可能未完成的）周期
+    N日K按交易日序号（day_index，默认按工作日计）整除 N 分组：分界只由日期决定，
+    不随缓存里有多少历史、是否补拉过更早的数据而移动
+    """
+
+    def __init__(self, timeframe: str, day_index: Optional[Callable[[str], int]] = None):
+        self.timeframe = timeframe
+        self.kind, self.n = parse_timeframe(timeframe)
+        if self.kind == "daily":
+            raise ValueError("日K无需重采样")
+        self.day_index = day_index or weekday_index
+        self._done: List[Dict] = []      # 已完成周期
+        self._members: List[Dict] = []   # 当前周期包含的日K
+        self._key = None
+        self._current: Optional[Dict] = None
+
+    def _group_key(self, date_str: str):
+        if self.kind == "nday":
+            return self.day_index(date_str) // self.n
+        return _calendar_key(self.kind, date_str)
+
+    def _prev_close(self) -> Optional[float]:
+        return self._done[-1]["close"] if self._done else None
+
+    def update(self, bars: List[Dict]):
+        """追加日K（与最后一根同日期的日K视为盘中更新，直接替换）"""
+        for bar in bars:
+            if self._members and bar["date"] == self._members[-1]["date"]:
+                self._members[-1] = bar
+            elif self._members and bar["date"] < self._members[-1]["date"]:
+                raise ValueError(f"日K必须按日期递增追加: {bar['date']}")
+            else:
+                key = self._group_key(bar["date"])
+                if self._members and key != self._key:
+                    self._done.append(aggregate_bars(self._members, self._prev_close()))
+                    self._members = []
+                self._key = key
+                self._members.append(bar)
+            self._current = None
+
+    def bars(self, as_of: Optional[str] = None) -> List[Dict]:
+        """
+        返回重采样后的K线
+        as_of 所在周期尚未结束时，最后一根标记 partial=True
+        """
+        if not self._members:
+            return list(self._done)
+        if self._current is None:
+            self._current = aggregate_bars(self._members, self._prev_close())
+        current = dict(self._current)
+        current["partial"] = self._is_partial(as_of)
+        return self._done + [current]
+
+    def _is_partial(self, as_of: Optional[str]) -> bool:
+        as_of = as_of or date.today().isoformat()
+        return self._group_key(as_of) == self._key
+
+
+def resample_klines(klines: List[Dict], timeframe: str, as_of: Optional[str] = None,
+                    day_index: Optional[Callable[[str], int]] = None) -> List[Dict]:
+    """一次性把日K重采样为指定周期"""
+    kind, _ = parse_timeframe(timeframe)
+    if kind == "daily":
+        return list(klines)
+    resampler = Resampler(timeframe, day_index)
+    resampler.update(klines)
+    return resampler.bars(as_of)
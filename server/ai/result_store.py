@@ -0,0 +1,247 @@
+"""
+分析结果列式存储
+按列（struct-of-arrays）保存大量 AnalysisResult，并支持批量导出/加载 SQLite、Parquet
+"""
+
+import sqlite3
+from array import array
+from typing import List, Dict, Iterator
+
+from full_analysis import AnalysisResult, checklist_score
+
+# 浮点列
+FLOAT_FIELDS = (
+    "price", "change_pct", "volume",
+    "ma5", "ma10", "ma20",
+    "macd_dif", "macd_dea", "macd_histogram",
+    "rsi", "kdj_k", "kdj_d", "kdj_j",
+    "vol_ratio", "recent_high",
+)
+
+# 枚举列（字符串 → 小整数）
+ENUMS = {
+    "macd_cross": ("none", "golden", "dead"),
+    "kdj_cross": ("none", "golden", "dead"),
+    "rsi_zone": ("normal", "oversold", "overbought"),
+    "vol_status": ("normal", "shrink", "expand"),
+}
+
+# 布尔列打包为一个状态位
+STATE_BITS = (
+    "is_ma_bullish", "price_above_ma5", "price_above_ma10", "price_above_ma20",
+    "macd_is_red", "macd_expanding", "should_hold", "should_sell",
+)
+
+# SQLite 列定义
+_SQL_COLUMNS = (
+    [("symbol", "TEXT"), ("date", "INTEGER")]
+    + [(f, "REAL") for f in FLOAT_FIELDS]
+    + [(f, "INTEGER") for f in ENUMS]
+    + [("state", "INTEGER"), ("checklist", "INTEGER")]
+)
+
+
+def _date_to_int(date_str: str) -> int:
+    return int(date_str[:10].replace("-", ""))
+
+
+def _int_to_date(value: int) -> str:
+    s = str(value)
+    return f"{s[:4]}-{s[4:6]}-{s[6:8]}"
+
+
+class ResultTable:
+    """
+    列式分析结果表
+    每行约 150 字节（15 个 float64 + 若干字节的枚举/位标志），股票名称按股票只存一份；
+    止损位与 MA5/MA10/MA20 相同，不重复存储；需要时用 row(i) 还原为 AnalysisResult
+    """
+
+    def __init__(self):
+        self.symbols: List[str] = []          # 股票代码字典
+        self.names: Dict[str, str] = {}
+        self._symbol_code: Dict[str, int] = {}
+        self.symbol = array("I")
+        self.date = array("I")
+        self.floats = {f: array("d") for f in FLOAT_FIELDS}
+        self.enums = {f: array("B") for f in ENUMS}
+        self.state = array("B")
+        self.checklist = array("B")
+
+    def __len__(self):
+        return len(self.date)
+
+    # ---------- 写入 ----------
+
+    def _code(self, symbol: str) -> int:
+        code = self._symbol_code.get(symbol)
+        if code is None:
+            code = self._symbol_code[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+    def append(self, result: AnalysisResult):
+        self.symbol.append(self._code(result.symbol))
+        self.names.setdefault(result.symbol, result.name)
+        self.date.append(_date_to_int(result.date))
+        for f in FLOAT_FIELDS:
+            self.floats[f].append(getattr(result, f))
+        for f, values in ENUMS.items():
+            self.enums[f].append(values.index(getattr(result, f)))
+        state = 0
+        for bit, f in enumerate(STATE_BITS):
+            if getattr(result, f):
+                state |= 1 << bit
+        self.state.append(state)
+        self.checklist.append(result.checklist_flags)
+
+    def extend(self, results):
+        for r in results:
+            if r is not None:
+                self.append(r)
+
+    # ---------- 读取 ----------
+
+    def row(self, i: int) -> AnalysisResult:
+        """还原第 i 行为 AnalysisResult"""
+        symbol = self.symbols[self.symbol[i]]
+        state = self.state[i]
+        values = {f: self.floats[f][i] for f in FLOAT_FIELDS}
+        values.update({f: ENUMS[f][self.enums[f][i]] for f in ENUMS})
+        values.update({f: bool(state >> bit & 1) for bit, f in enumerate(STATE_BITS)})
+        return AnalysisResult(
+            symbol=symbol,
+            name=self.names.get(symbol, ""),
+            date=_int_to_date(self.date[i]),
+            not_weakened_score=checklist_score(self.checklist[i]),
+            checklist_flags=self.checklist[i],
+            stop_loss_aggressive=values["ma5"],
+            stop_loss_moderate=values["ma10"],
+            stop_loss_conservative=values["ma20"],
+            **values,
+        )
+
+    def __iter__(self) -> Iterator[AnalysisResult]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def rows_for(self, symbol: str) -> List[int]:
+        """某只股票的全部行号"""
+        code = self._symbol_code.get(symbol)
+        if code is None:
+            return []
+        return [i for i, c in enumerate(self.symbol) if c == code]
+
+    # ---------- SQLite ----------
+
+    def to_sqlite(self, path: str, table: str = "analysis_results"):
+        """批量写入 SQLite（一个事务、executemany 按列拼行）"""
+        conn = sqlite3.connect(path)
+        try:
+            cols = ", ".join(f"{name} {kind}" for name, kind in _SQL_COLUMNS)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols}, PRIMARY KEY (symbol, date))")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_symbols (symbol TEXT PRIMARY KEY, name TEXT)")
+            symbols = [self.symbols[c] for c in self.symbol]
+            columns = ([symbols, self.date] + [self.floats[f] for f in FLOAT_FIELDS]
+                       + [self.enums[f] for f in ENUMS] + [self.state, self.checklist])
+            placeholders = ", ".join("?" * len(_SQL_COLUMNS))
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", zip(*columns))
+                conn.executemany(f"INSERT OR REPLACE INTO {table}_symbols VALUES (?, ?)", self.names.items())
+        finally:
+            conn.close()
+
+    @classmethod
+    def from_sqlite(cls, path: str, table: str = "analysis_results",
+                    where: str = "", params: tuple = ()) -> "ResultTable":
+        """从 SQLite 加载（可带 WHERE 条件，如 "date >= ?"）"""
+        conn = sqlite3.connect(path)
+        try:
+            names = dict(conn.execute(f"SELECT symbol, name FROM {table}_symbols"))
+            cursor = conn.execute(
+                f"SELECT {', '.join(name for name, _ in _SQL_COLUMNS)} FROM {table} "
+                f"{'WHERE ' + where if where else ''} ORDER BY symbol, date", params)
+            result = cls()
+            result.names = names
+            floats = [result.floats[f] for f in FLOAT_FIELDS]
+            enums = [result.enums[f] for f in ENUMS]
+            n_float = len(FLOAT_FIELDS)
+            for row in cursor:
+                result.symbol.append(result._code(row[0]))
+                result.date.append(row[1])
+                for col, value in zip(floats, row[2:2 + n_float]):
+                    col.append(value)
+                for col, value in zip(enums, row[2 + n_float:2 + n_float + len(ENUMS)]):
+                    col.append(value)
+                result.state.append(row[-2])
+                result.checklist.append(row[-1])
+            return result
+        finally:
+            conn.close()
+
+    # ---------- Parquet / Arrow ----------
+
+    def to_arrow(self):
+        """转换为 pyarrow.Table（数值列零拷贝）"""
+        import pyarrow as pa
+
+        def buffer_array(values: array, kind):
+            return pa.Array.from_buffers(kind, len(values), [None, pa.py_buffer(values)])
+
+        columns = {
+            "symbol": pa.DictionaryArray.from_arrays(
+                buffer_array(self.symbol, pa.uint32()), pa.array(self.symbols, pa.string())),
+            "date": buffer_array(self.date, pa.uint32()),
+        }
+        for f in FLOAT_FIELDS:
+            columns[f] = buffer_array(self.floats[f], pa.float64())
+        for f in ENUMS:
+            columns[f] = buffer_array(self.enums[f], pa.uint8())
+        columns["state"] = buffer_array(self.state, pa.uint8())
+        columns["checklist"] = buffer_array(self.checklist, pa.uint8())
+        metadata = {"names": "\n".join(f"{s}\t{n}" for s, n in self.names.items())}
+        return pa.table(columns, metadata=metadata)
+
+    def to_parquet(self, path: str):
+        """写入 Parquet（需要安装 pyarrow）"""
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path, compression="zstd")
+
+    @classmethod
+    def from_arrow(cls, table) -> "ResultTable":
+        import pyarrow as pa
+
+        def to_array(column, typecode: str, kind=None) -> array:
+            chunked = column.combine_chunks() if hasattr(column, "combine_chunks") else column
+            if kind is not None and chunked.type != kind:
+                chunked = chunked.cast(kind)
+            values = array(typecode)
+            values.frombytes(chunked.buffers()[1].to_pybytes())
+            start = chunked.offset
+            return values[start:start + len(chunked)]
+
+        result = cls()
+        symbol = table.column("symbol").combine_chunks()
+        if pa.types.is_dictionary(symbol.type):
+            result.symbols = symbol.dictionary.to_pylist()
+            result.symbol = to_array(symbol.indices, "I", pa.uint32())
+        else:
+            for s in symbol.to_pylist():
+                result.symbol.append(result._code(s))
+        result._symbol_code = {s: i for i, s in enumerate(result.symbols)}
+        result.date = to_array(table.column("date"), "I", pa.uint32())
+        for f in FLOAT_FIELDS:
+            result.floats[f] = to_array(table.column(f), "d", pa.float64())
+        for f in ENUMS:
+            result.enums[f] = to_array(table.column(f), "B", pa.uint8())
+        result.state = to_array(table.column("state"), "B", pa.uint8())
+        result.checklist = to_array(table.column("checklist"), "B", pa.uint8())
+        meta = (table.schema.metadata or {}).get(b"names", b"").decode("utf-8")
+        result.names = dict(line.split("\t", 1) for line in meta.splitlines() if "\t" in line)
+        return result
+
+    @classmethod
+    def from_parquet(cls, path: str) -> "ResultTable":
+        """从 Parquet 加载（需要安装 pyarrow）"""
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(path))
@@ -0,0 +1,170 @@
+"""
+规模测试
+用仿真股票池（默认 5000 只 × 20 年）离线跑完整的分析 + 批量报告流程，
+输出吞吐（股票·日/秒）、峰值内存和单只股票耗时分布，用于评估硬件规格
+
+用法:
+    python scale_test.py                                # 5000 只 × 20 年，逐日回放全部历史
+    python scale_test.py --symbols 500 --years 5
+    python scale_test.py --mode latest                  # 只分析最新交易日（盘后扫描的路径）
+    python scale_test.py --processes 8 --keep-results   # 多进程；保留全部结果测内存
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import List, Dict, Optional
+
+sys.path.append('.')
+import full_analysis as fa
+from full_analysis import IndicatorSeries
+from report_renderer import ReportWriter
+from result_store import ResultTable
+from sector import SectorIndex
+from synthetic import SyntheticAktools, generate_universe, trading_days
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """峰值常驻内存（MB；Linux 上 ru_maxrss 单位为 KB，macOS 为字节）"""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_history(klines: List[Dict], stock_info: Dict, table: Optional[ResultTable]):
+    """逐日回放：整段指标只算一次，再对每个交易日评估（analyze_dates 的同一路径）"""
+    series = IndicatorSeries(klines)
+    last = None
+    for idx in range(len(klines)):
+        last = fa._evaluate(stock_info, klines, series, idx, klines[idx]["date"])
+        if table is not None:
+            table.append(last)
+    return last
+
+
+def run_shard(symbols: int, years: float, seed: int, mode: str, fmt: str,
+              shard: int = 0, shards: int = 1, keep_results: bool = False) -> Dict:
+    """
+    跑股票池中属于本分片的股票（第 i 只属于第 i % shards 个分片）
+    返回本分片的逐只耗时、K线数和峰值内存
+    """
+    end_date = date.today()
+    fa.TRADING_CALENDAR.load(trading_days(int(years * 250) + 250, end_date))   # 合成数据按工作日生成
+    latencies = []
+    gen_seconds = 0.0
+    bars = 0
+    evaluated = 0
+    table = ResultTable() if keep_results else None
+    original = fa.DATA_BACKEND
+    fa.SECTOR_INDEX = SectorIndex(cache_path=os.devnull)   # 合成数据的"行业"不写进真实的行业缓存
+
+    with open(os.devnull, "w", encoding="utf-8") as sink, ReportWriter(sink, fmt) as writer:
+        universe = generate_universe(symbols, years, seed, end_date, shard, shards)
+        while True:
+            t0 = time.perf_counter()
+            symbol, klines = next(universe, (None, None))
+            gen_seconds += time.perf_counter() - t0
+            if symbol is None:
+                break
+            if not klines:
+                continue
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if mode == "latest":
+                    # 完整的盘后扫描路径：取数（离线替身）→ 解析 → 缓存 → 评估
+                    fa.DATA_BACKEND = SyntheticAktools({symbol: klines})
+                    try:
+                        result = fa.analyze_stock(symbol)
+                    finally:
+                        fa.DATA_BACKEND = original
+                    fa.KLINE_STORE.clear(symbol)
+                    evaluated += 1
+                    if table is not None and result is not None:
+                        table.append(result)
+                else:
+                    stock_info = {"symbol": symbol, "name": f"合成{symbol}", "price": klines[-1]["close"], "sector": "合成"}
+                    result = _run_history(klines, stock_info, table)
+                    evaluated += len(klines)
+            if result is not None:
+                writer.write(result)
+            latencies.append(time.perf_counter() - start)
+            bars += len(klines)
+
+    return {
+        "latencies": latencies,
+        "bars": bars,
+        "evaluated": evaluated,
+        "gen_seconds": gen_seconds,
+        "rows_kept": len(table) if table is not None else 0,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[i]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="仿真股票池规模测试")
+    parser.add_argument("--symbols", type=int, default=5000, help="股票数量")
+    parser.add_argument("--years", type=float, default=20, help="每只股票的历史年数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("history", "latest"), default="history",
+                        help="history=逐日回放全部历史，latest=只分析最新交易日")
+    parser.add_argument("--format", default="text", help="批量报告格式")
+    parser.add_argument("--processes", type=int, default=1, help="并行进程数")
+    parser.add_argument("--keep-results", action="store_true", help="把全部结果留在 ResultTable 中（测内存）")
+    args = parser.parse_args()
+
+    print("\n" + "🧪 规模测试".center(60, "="))
+    print(f"股票池: {args.symbols} 只 × {args.years:g} 年 | 模式: {args.mode} | 进程: {args.processes}")
+
+    start = time.perf_counter()
+    if args.processes <= 1:
+        shards = [run_shard(args.symbols, args.years, args.seed, args.mode, args.format,
+                            keep_results=args.keep_results)]
+    else:
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = [pool.submit(run_shard, args.symbols, args.years, args.seed, args.mode, args.format,
+                                   shard, args.processes, args.keep_results)
+                       for shard in range(args.processes)]
+            shards = [f.result() for f in futures]
+    wall = time.perf_counter() - start
+
+    latencies = sorted(t for s in shards for t in s["latencies"])
+    bars = sum(s["bars"] for s in shards)
+    evaluated = sum(s["evaluated"] for s in shards)
+    gen_seconds = sum(s["gen_seconds"] for s in shards)
+    busy = sum(latencies)
+    # 各进程并行生成自己分片的数据，生成耗时按最慢的分片扣除
+    gen_wall = max(s["gen_seconds"] for s in shards)
+    analysis_wall = max(wall - gen_wall, 1e-9)
+
+    print(f"\n📦 数据: {len(latencies)} 只股票, {bars:,} 根日K（生成耗时 {gen_seconds:.1f}s，不计入吞吐）")
+    print(f"⏱️ 总耗时: {wall:.1f}s（分析 {analysis_wall:.1f}s）")
+    print(f"🚀 吞吐: {evaluated / analysis_wall:,.0f} 股票·日/秒"
+          f"（单核 {evaluated / busy if busy else 0:,.0f}），{len(latencies) / analysis_wall:,.1f} 只/秒")
+    print("\n单只股票耗时:")
+    print(f"   p50={_percentile(latencies, 0.50) * 1e3:.1f}ms  p90={_percentile(latencies, 0.90) * 1e3:.1f}ms  "
+          f"p99={_percentile(latencies, 0.99) * 1e3:.1f}ms  max={latencies[-1] * 1e3 if latencies else 0:.1f}ms  "
+          f"mean={statistics.fmean(latencies) * 1e3 if latencies else 0:.1f}ms")
+    print("\n内存:")
+    print(f"   主进程峰值 RSS: {_peak_rss_mb():.0f} MB")
+    if args.processes > 1:
+        print(f"   子进程峰值 RSS: {_peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB（单个进程的最大值）")
+    if args.keep_results:
+        print(f"   保留结果: {sum(s['rows_kept'] for s in shards):,} 行")
+
+
+if __name__ == "__main__":
+    main()
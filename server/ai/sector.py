@@ -0,0 +1,377 @@
+"""
+行业板块
+- SectorIndex: 股票 → 行业（东方财富行业分类，与 stock_individual_info_em 的"行业"字段同一口径），
+  按板块成分一次性拉取（约 90 次请求代替逐只查询），缓存到本地 JSON，定期刷新；
+  get_stock_info 查到的行业也顺手记进来
+- SectorAnalysis: 在 MarketMatrix 上按行业分组（成分→行业的独热矩阵，一次矩阵乘法完成全部行业的分组求和），
+  得到等权 / 流通市值加权的行业指数、行业指数的 MACD / RSI（与个股相同的算法）和行业内的市场宽度，
+  个股信号与所属行业的对照只需一次查表（compare）
+
+用法:
+    python sector.py --refresh                 # 重新拉取行业成分，写入本地缓存
+    python sector.py                           # 合成股票池计时（随机分配行业）
+    python sector.py --symbols 5000 --years 10 --sectors 90
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Dict, Optional, Callable, Tuple
+
+import numpy as np
+
+from breadth import MarketBreadth, BreadthRow, MACD_SLOW
+from kline_clean import to_number
+from market_matrix import MarketMatrix, ffill
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sector_index.json")
+CACHE_MAX_AGE_DAYS = 7
+INDEX_BASE = 1000.0
+RETURN_DAYS = 20            # 对照用的区间涨幅天数
+
+
+def fetch_industry_map(call: Callable) -> Optional[Dict[str, str]]:
+    """按行业板块成分拉取 {symbol: 行业}（call 为 call_aktools）"""
+    boards = call("stock_board_industry_name_em")
+    if not boards:
+        return None
+    mapping = {}
+    for board in boards:
+        name = str(board.get("板块名称") or "")
+        if not name:
+            continue
+        for row in call("stock_board_industry_cons_em", {"symbol": name}) or []:
+            symbol = str(row.get("代码") or "")
+            if symbol:
+                mapping[symbol] = name
+    return mapping or None
+
+
+def float_shares(rows: List[Dict]) -> Dict[str, float]:
+    """stock_zh_a_spot_em 快照 → {symbol: 流通股本}（流通市值 / 最新价），用作市值加权的权重"""
+    shares = {}
+    for row in rows or []:
+        cap, price = to_number(row.get("流通市值")), to_number(row.get("最新价"))
+        if cap > 0 and price > 0:
+            shares[str(row.get("代码", ""))] = cap / price
+    return shares
+
+
+class SectorIndex:
+    """
+    股票 → 行业（首次使用时加载）
+    本地缓存记录最近一次完整拉取板块成分的日期（built_at），超过 CACHE_MAX_AGE_DAYS 天或从未完整拉取时
+    通过 fetch 重新拉取；record 记下的单只股票只在已有完整映射时写回缓存，不会刷新 built_at
+    """
+
+    def __init__(self, fetch: Optional[Callable[[], Optional[Dict[str, str]]]] = None,
+                 cache_path: str = CACHE_PATH):
+        self._fetch = fetch
+        self.cache_path = cache_path
+        self._map: Optional[Dict[str, str]] = None
+        self.built_at: Optional[str] = None
+        self._dirty = False
+        self._offline = False
+        atexit.register(self.save)
+
+    # ---------- 加载 ----------
+
+    def _ensure(self, download: bool = True) -> Dict[str, str]:
+        if self._map is None:
+            self._read_cache()
+        if download and not self._offline and self._build_age_days() > CACHE_MAX_AGE_DAYS:
+            self.refresh()
+        return self._map
+
+    def _build_age_days(self) -> float:
+        if not self.built_at:
+            return float("inf")
+        return (date.today() - date.fromisoformat(self.built_at)).days
+
+    def _read_cache(self):
+        self._map, self.built_at = {}, None
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(cache, dict) and isinstance(cache.get("sectors"), dict):
+            self._map, self.built_at = dict(cache["sectors"]), cache.get("built_at")
+
+    def refresh(self) -> bool:
+        """重新拉取全部行业成分（失败时保留原有映射）"""
+        mapping = self._fetch() if self._fetch else None
+        if not mapping:
+            print("   ⚠️ 无法获取行业成分，继续使用本地缓存")
+            return False
+        self._map = {**(self._map or {}), **mapping}
+        self.built_at = date.today().isoformat()
+        self._dirty = True
+        self.save()
+        return True
+
+    def save(self):
+        """写回缓存（从未完整拉取过板块成分时不写，避免零散记录被当成完整映射）"""
+        if not self._dirty or self._map is None or not self.built_at or self._offline:
+            return
+        try:
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump({"built_at": self.built_at, "sectors": self._map}, f, ensure_ascii=False)
+            self._dirty = False
+        except OSError as e:
+            print(f"   ⚠️ 行业缓存写入失败: {e}")
+
+    def load(self, mapping: Dict[str, str]):
+        """直接指定映射（测试或离线使用；不拉取、不写回缓存）"""
+        self._map = dict(mapping)
+        self._offline = True
+
+    def record(self, symbol: str, sector: str):
+        """记下单只股票的行业（来自 get_stock_info；不触发整体拉取）"""
+        sectors = self._ensure(download=False)
+        if sector and sectors.get(symbol) != sector:
+            sectors[symbol] = sector
+            self._dirty = True
+
+    # ---------- 查询 ----------
+
+    def __len__(self):
+        return len(self._ensure())
+
+    def get(self, symbol: str) -> Optional[str]:
+        return self._ensure().get(symbol)
+
+    def sectors(self) -> List[str]:
+        return sorted(set(self._ensure().values()))
+
+    def members(self, sector: str) -> List[str]:
+        return sorted(s for s, name in self._ensure().items() if name == sector)
+
+    def group(self, symbols: List[str]) -> Tuple[np.ndarray, List[str]]:
+        """按行业分组：返回每只股票的行业编号（未知为 -1）和编号对应的行业名"""
+        sectors = self._ensure()
+        names = sorted({sectors[s] for s in symbols if s in sectors})
+        code = {name: i for i, name in enumerate(names)}
+        return np.array([code.get(sectors.get(s), -1) for s in symbols], dtype=np.int64), names
+
+
+# ==================== 行业聚合 ====================
+
+@dataclass
+class SectorStats:
+    """一个行业在某一天的聚合指标"""
+    sector: str
+    date: str
+    members: int
+    index_equal: float          # 等权指数（基点 1000）
+    index_weighted: float       # 流通市值加权指数（没有股本数据时与等权相同）
+    change_pct: float           # 当天涨跌幅（%，按指标所用的指数）
+    return_20d: float           # 近 RETURN_DAYS 天涨跌幅（%）
+    macd_dif: float
+    macd_dea: float
+    macd_histogram: float
+    macd_is_red: bool
+    rsi: float
+    breadth: Optional[BreadthRow]
+
+
+def group_matrix(codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """行业编号 → (N, S) 独热矩阵；x @ G 即按行业分组求和（NaN 需先置 0）"""
+    onehot = np.zeros((len(codes), n_groups))
+    known = codes >= 0
+    onehot[np.flatnonzero(known), codes[known]] = 1.0
+    return onehot
+
+
+class SectorAnalysis:
+    """
+    行业聚合（对整个矩阵全量计算）
+    指数按成分股的日收益率合成：停牌日不计入，复牌当天的收益相对停牌前收盘价；
+    MACD / RSI 在流通市值加权指数上计算（没有股本数据时用等权指数）
+    """
+
+    def __init__(self, matrix: MarketMatrix, index: SectorIndex,
+                 shares: Optional[Dict[str, float]] = None, breadth: bool = True):
+        from full_analysis import calculate_macd, calculate_rsi_series
+
+        self.matrix = matrix
+        self.dates = matrix.dates
+        self._row = {d: i for i, d in enumerate(self.dates)}
+        self._col = {s: j for j, s in enumerate(matrix.symbols)}
+        self.codes, self.names = index.group(matrix.symbols)
+        self._code = {name: i for i, name in enumerate(self.names)}
+        onehot = group_matrix(self.codes, len(self.names))
+        self.member_count = onehot.sum(axis=0).astype(np.int64)
+
+        # 成分股日收益（相对上一根K线的收盘价）
+        close = matrix.close
+        prev = np.vstack([np.full((1, close.shape[1]), np.nan), ffill(close)[:-1]])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ret = close / prev - 1
+        valid = ~np.isnan(ret)
+        self.returns = ret
+
+        self.weighted_by_cap = bool(shares)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            count = valid.astype(float) @ onehot
+            equal = np.where(count > 0, np.where(valid, ret, 0.0) @ onehot / count, 0.0)
+            if shares:
+                w = np.array([shares.get(s, np.nan) for s in matrix.symbols])
+                base = np.where(valid, prev * w, 0.0)
+                base[np.isnan(base)] = 0.0
+                total = base @ onehot
+                weighted = np.where(total > 0, (base * np.where(valid, ret, 0.0)) @ onehot / total, 0.0)
+            else:
+                weighted = equal
+        self.index_equal = INDEX_BASE * np.cumprod(1 + equal, axis=0)
+        self.index_weighted = INDEX_BASE * np.cumprod(1 + weighted, axis=0)
+
+        # 行业指数的 MACD / RSI（S 条序列，沿用个股的算法）
+        level = self.index_weighted
+        self.macd = np.zeros((3,) + level.shape)
+        self.rsi = np.full(level.shape, 50.0)
+        for k in range(len(self.names)):
+            closes = level[:, k].tolist()
+            dif, dea, hist = calculate_macd(closes)
+            if len(dif) == len(closes):
+                self.macd[:, :, k] = dif, dea, hist
+            self.rsi[:, k] = calculate_rsi_series(closes)
+
+        # 行业内的市场宽度
+        self.breadth: Dict[str, MarketBreadth] = {}
+        if breadth:
+            for k, name in enumerate(self.names):
+                sub = matrix.take(np.flatnonzero(self.codes == k))
+                self.breadth[name] = MarketBreadth(sub.symbols).run(sub)
+
+    # ---------- 查询 ----------
+
+    def sector_of(self, symbol: str) -> Optional[str]:
+        j = self._col.get(symbol)
+        return self.names[self.codes[j]] if j is not None and self.codes[j] >= 0 else None
+
+    def _at(self, date_str: Optional[str]) -> Optional[int]:
+        if date_str is None:
+            return len(self.dates) - 1 if self.dates else None
+        return self._row.get(date_str)
+
+    def stats(self, sector: str, date_str: Optional[str] = None) -> Optional[SectorStats]:
+        k, t = self._code.get(sector), self._at(date_str)
+        if k is None or t is None:
+            return None
+        level = self.index_weighted[:, k]
+        prev = level[t - 1] if t > 0 else INDEX_BASE
+        start = level[t - RETURN_DAYS] if t >= RETURN_DAYS else INDEX_BASE
+        dif, dea, hist = self.macd[:, t, k]
+        breadth = self.breadth.get(sector)
+        return SectorStats(
+            sector=sector,
+            date=self.dates[t],
+            members=int(self.member_count[k]),
+            index_equal=round(float(self.index_equal[t, k]), 2),
+            index_weighted=round(float(level[t]), 2),
+            change_pct=round(float(level[t] / prev - 1) * 100, 2),
+            return_20d=round(float(level[t] / start - 1) * 100, 2),
+            macd_dif=float(dif),
+            macd_dea=float(dea),
+            macd_histogram=float(hist),
+            macd_is_red=bool(hist > 0 and t + 1 >= MACD_SLOW),
+            rsi=float(self.rsi[t, k]),
+            breadth=breadth.row(self.dates[t]) if breadth else None,
+        )
+
+    def table(self, date_str: Optional[str] = None) -> List[SectorStats]:
+        """全部行业当天的聚合指标（按近 RETURN_DAYS 天涨幅降序）"""
+        rows = [self.stats(name, date_str) for name in self.names]
+        return sorted((r for r in rows if r), key=lambda r: -r.return_20d)
+
+    def stock_return(self, symbol: str, date_str: Optional[str] = None, days: int = RETURN_DAYS) -> Optional[float]:
+        """个股近 days 天涨跌幅（%，与行业指数同口径：停牌日不计）"""
+        j, t = self._col.get(symbol), self._at(date_str)
+        if j is None or t is None:
+            return None
+        r = self.returns[max(0, t - days + 1):t + 1, j]
+        r = r[~np.isnan(r)]
+        return round(float(np.prod(1 + r) - 1) * 100, 2)
+
+    def compare(self, result) -> Optional[Dict]:
+        """个股分析结果（AnalysisResult）与所属行业当天的对照"""
+        sector = self.sector_of(result.symbol)
+        stats = self.stats(sector, result.date) if sector else None
+        if stats is None:
+            return None
+        stock_return = self.stock_return(result.symbol, result.date)
+        compared = {
+            "symbol": result.symbol,
+            "sector": sector,
+            "date": stats.date,
+            "stock_return_20d": stock_return,
+            "sector_return_20d": stats.return_20d,
+            "relative_20d": round(stock_return - stats.return_20d, 2),
+            "stock_rsi": result.rsi,
+            "sector_rsi": stats.rsi,
+            "stock_macd_red": result.macd_is_red,
+            "sector_macd_red": stats.macd_is_red,
+        }
+        breadth = self.breadth.get(sector)
+        backdrop = breadth.backdrop(result) if breadth else None
+        if backdrop:
+            compared.update({
+                "score": backdrop["score"],
+                "sector_score_percentile": backdrop["score_percentile"],
+                "sector_mean_score": backdrop["market_mean_score"],
+                "sector_above_ma20": backdrop["above_ma20"],
+                "sector_advance_ratio": backdrop["advance_ratio"],
+            })
+        return compared
+
+
+def format_stats(s: SectorStats) -> str:
+    line = (f"{s.sector:<8} {s.members:>4}只  指数 {s.index_weighted:>9.2f} ({s.change_pct:+.2f}%)  "
+            f"{RETURN_DAYS}日 {s.return_20d:+6.2f}%  RSI {s.rsi:5.1f}  MACD {'红' if s.macd_is_red else '绿'}")
+    if s.breadth:
+        line += f"  >MA20 {s.breadth.above_ma20:.0f}%  均分 {s.breadth.mean_score:.2f}"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行业板块聚合（合成股票池计时）")
+    parser.add_argument("--refresh", action="store_true", help="重新拉取行业成分并写入本地缓存")
+    parser.add_argument("--symbols", type=int, default=2000, help="股票数量")
+    parser.add_argument("--years", type=float, default=5, help="每只股票的历史年数")
+    parser.add_argument("--sectors", type=int, default=30, help="随机分配的行业数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.refresh:
+        from full_analysis import SECTOR_INDEX
+        if SECTOR_INDEX.refresh():
+            print(f"✅ {len(SECTOR_INDEX)} 只股票，{len(SECTOR_INDEX.sectors())} 个行业 → {SECTOR_INDEX.cache_path}")
+        return
+
+    sys.path.append('.')
+    from synthetic import generate_universe
+
+    t0 = time.perf_counter()
+    matrix = MarketMatrix.from_klines(dict(generate_universe(args.symbols, args.years, args.seed, date.today())))
+    rng = np.random.default_rng(args.seed)
+    index = SectorIndex()
+    index.load({s: f"行业{rng.integers(args.sectors):02d}" for s in matrix.symbols})
+    shares = {s: float(rng.lognormal(20, 1)) for s in matrix.symbols}
+    t1 = time.perf_counter()
+    analysis = SectorAnalysis(matrix, index, shares)
+    t2 = time.perf_counter()
+    print(f"📊 {len(matrix.symbols)} 只 × {len(matrix)} 天，{len(analysis.names)} 个行业: "
+          f"构建矩阵 {t1 - t0:.2f}s, 行业聚合 {t2 - t1:.2f}s")
+    for stats in analysis.table()[:args.top]:
+        print("   " + format_stats(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+合成行情数据
+用固定随机种子生成可复现的日K线，供基准测试、规模测试离线使用（不依赖 AKTools）
+
+synthetic_klines: 简单随机游走（基准测试的黄金输出依赖它，口径不要改动）
+realistic_klines: GBM + GARCH 波动聚集、量价相关、涨跌停、停牌
+"""
+
+import math
+import random
+from datetime import date, timedelta
+from typing import List, Dict, Optional, Iterator, Tuple
+
+from data_backend import DataBackend
+
+# 固定的结束日期，保证同一种子生成的日期和数值完全一致
+DEFAULT_END_DATE = date(2026, 1, 9)
+
+
+def trading_days(n: int, end_date: Optional[date] = None) -> List[str]:
+    """截至 end_date 的最后 n 个工作日（不含节假日，仅用于合成数据）"""
+    d = end_date or DEFAULT_END_DATE
+    days = []
+    while len(days) < n:
+        if d.weekday() < 5:
+            days.append(d.isoformat())
+        d -= timedelta(days=1)
+    return days[::-1]
+
+
+def synthetic_klines(n: int, seed: int = 0, start_price: float = 20.0,
+                     end_date: Optional[date] = None) -> List[Dict]:
+    """
+    生成 n 根日K线（随机游走，字段与 get_kline_data 返回的一致）
+    同样的 n / seed / end_date 生成完全相同的数据
+    """
+    rng = random.Random(seed)
+    price = start_price
+    klines = []
+    for day in trading_days(n, end_date):
+        prev = price
+        price = max(0.5, price * (1 + rng.gauss(0.0003, 0.02)))
+        open_ = max(0.5, prev * (1 + rng.gauss(0, 0.006)))
+        high = max(open_, price) * (1 + abs(rng.gauss(0, 0.008)))
+        low = min(open_, price) * (1 - abs(rng.gauss(0, 0.008)))
+        volume = float(rng.randint(50_000, 500_000))
+        klines.append({
+            "date": day,
+            "open": round(open_, 2),
+            "close": round(price, 2),
+            "high": round(high, 2),
+            "low": round(low, 2),
+            "volume": volume,
+            "amount": round(volume * price * 100, 2),
+            "change_pct": round((price / prev - 1) * 100, 2),
+        })
+    return klines
+
+
+# ==================== 仿真行情 ====================
+
+# 合成代码的板块前缀：沪市主板、深市主板、创业板、科创板
+BOARDS = ("600", "000", "300", "688")
+
+
+def price_limit(symbol: str) -> float:
+    """涨跌幅限制（创业板/科创板 20%，其余 10%）"""
+    return 0.20 if symbol.startswith(("300", "301", "688")) else 0.10
+
+
+def universe_symbols(n: int) -> List[str]:
+    """n 个合成股票代码，按板块轮流分配"""
+    return [f"{BOARDS[i % len(BOARDS)]}{i // len(BOARDS):03d}" for i in range(n)]
+
+
+def realistic_klines(n: int, seed: int = 0, limit: float = 0.10,
+                     end_date: Optional[date] = None,
+                     suspend_prob: float = 0.002, suspend_days: float = 5.0) -> List[Dict]:
+    """
+    生成约 n 个交易日的仿真日K（停牌日不产生K线，返回条数会略少于 n）
+    - 收益率：GBM 漂移 + GARCH(1,1) 波动聚集
+    - 成交量：与当日涨跌幅绝对值正相关，一字板缩量
+    - 涨跌停：收盘、开盘、最高、最低都截断在昨收 ±limit 以内
+    - 停牌：每天以 suspend_prob 的概率开始停牌，持续天数服从几何分布，复牌时补涨/补跌
+    """
+    rng = random.Random(seed)
+    daily_vol = rng.uniform(0.015, 0.035)
+    alpha, beta = 0.08, 0.90
+    omega = daily_vol ** 2 * (1 - alpha - beta)
+    drift = rng.gauss(0.0002, 0.0004)
+    base_volume = math.exp(rng.gauss(12.5, 1.0))     # 手
+
+    price = round(math.exp(rng.gauss(2.7, 0.8)), 2)  # 约 5 ~ 60 元
+    variance = daily_vol ** 2
+    last_return = 0.0
+    suspended = 0
+    pending_return = 0.0
+
+    klines = []
+    for day in trading_days(n, end_date):
+        variance = omega + alpha * last_return ** 2 + beta * variance
+        sigma = math.sqrt(variance)
+        r = drift - variance / 2 + sigma * rng.gauss(0, 1)
+        if suspended:
+            # 停牌期间收益累积到复牌当天
+            suspended -= 1
+            pending_return += r
+            last_return = r
+            continue
+        if rng.random() < suspend_prob:
+            suspended = max(1, int(rng.expovariate(1 / suspend_days)))
+            pending_return = r
+            last_return = r
+            continue
+
+        r += pending_return
+        pending_return = 0.0
+        prev = price
+        up, down = round(prev * (1 + limit), 2), round(prev * (1 - limit), 2)
+
+        close = min(up, max(down, round(prev * math.exp(r), 2)))
+        open_ = min(up, max(down, round(prev * math.exp(r * rng.uniform(0, 0.6) + rng.gauss(0, sigma * 0.3)), 2)))
+        high = min(up, round(max(open_, close) * (1 + abs(rng.gauss(0, sigma * 0.5))), 2))
+        low = max(down, round(min(open_, close) * (1 - abs(rng.gauss(0, sigma * 0.5))), 2))
+
+        actual = math.log(close / prev)
+        volume = base_volume * math.exp(1.2 * abs(actual) / daily_vol + rng.gauss(0, 0.3) - 1.0)
+        if high == low:
+            volume *= 0.2   # 一字板
+        volume = float(max(1, round(volume)))
+
+        klines.append({
+            "date": day,
+            "open": open_,
+            "close": close,
+            "high": high,
+            "low": low,
+            "volume": volume,
+            "amount": round(volume * 100 * (open_ + close + high + low) / 4, 2),
+            "change_pct": round((close / prev - 1) * 100, 2),
+        })
+        price = close
+        last_return = actual
+    return klines
+
+
+def generate_universe(n_symbols: int, years: float = 20, seed: int = 0,
+                      end_date: Optional[date] = None,
+                      shard: int = 0, shards: int = 1) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    逐只生成仿真股票池 (symbol, klines)
+    按需生成、用完即弃，5000 只 × 20 年也不需要一次性放进内存；
+    shards > 1 时只生成第 i % shards == shard 的股票（多进程各自生成自己的分片）
+    """
+    n_days = int(years * 250)
+    for i, symbol in enumerate(universe_symbols(n_symbols)):
+        if i % shards != shard:
+            continue
+        yield symbol, realistic_klines(n_days, seed=seed * 1_000_003 + i,
+                                       limit=price_limit(symbol), end_date=end_date)
+
+
+def to_aktools_rows(klines: List[Dict]) -> List[Dict]:
+    """转换为 AKTools stock_zh_a_hist 的原始返回格式"""
+    return [{
+        "日期": f"{k['date']}T00:00:00.000",
+        "开盘": k["open"],
+        "收盘": k["close"],
+        "最高": k["high"],
+        "最低": k["low"],
+        "成交量": k["volume"],
+        "成交额": k["amount"],
+        "涨跌幅": k["change_pct"],
+    } for k in klines]
+
+
+class SyntheticAktools(DataBackend):
+    """
+    离线的 AKTools 替身：按请求参数从合成数据中返回结果
+    可直接替换 full_analysis.DATA_BACKEND，覆盖取数、解析、缓存的完整路径
+    """
+
+    name = "synthetic"
+
+    def __init__(self, universe: Dict[str, List[Dict]], names: Optional[Dict[str, str]] = None):
+        self.names = names or {}
+        self._rows = {symbol: to_aktools_rows(klines) for symbol, klines in universe.items()}
+        self.calls = 0
+
+    def __call__(self, endpoint: str, params: dict = None):
+        return self.call(endpoint, params)
+
+    def call(self, endpoint: str, params: dict = None):
+        self.calls += 1
+        params = params or {}
+        symbol = str(params.get("symbol", ""))[-6:]
+        if symbol not in self._rows:
+            return None
+        if endpoint == "stock_individual_info_em":
+            rows = self._rows[symbol]
+            return [
+                {"item": "股票简称", "value": self.names.get(symbol, f"合成{symbol}")},
+                {"item": "最新", "value": rows[-1]["收盘"] if rows else 0},
+                {"item": "行业", "value": "合成"},
+            ]
+        if endpoint == "stock_zh_a_daily" and params.get("adjust") == "hfq-factor":
+            # 合成数据本身就是不复权价，因子恒为 1
+            rows = self._rows[symbol]
+            return [{"date": rows[0]["日期"], "hfq_factor": 1.0}] if rows else []
+        if endpoint == "stock_zh_a_hist":
+            start = _iso(params.get("start_date", "19700101"))
+            end = _iso(params.get("end_date", "20991231"))
+            return [row for row in self._rows[symbol] if start <= row["日期"][:10] <= end]
+        return None
+
+
+def _iso(yyyymmdd: str) -> str:
+    return f"{yyyymmdd[:4]}-{yyyymmdd[4:6]}-{yyyymmdd[6:8]}"
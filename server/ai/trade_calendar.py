@@ -0,0 +1,156 @@
+"""
+交易日历
+沪深交易所交易日（来自 AKTools tool_trade_date_hist_sina），缓存到本地 JSON，
+用于按交易日数精确计算取数区间（春节、国庆长假不再少取）
+"""
+
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Callable
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trade_calendar.json")
+CACHE_MAX_AGE_DAYS = 30
+EPOCH = "1990-12-19"   # 上交所开市日，交易日序号（N日K分组）从这里起算
+
+
+class TradingCalendar:
+    """
+    交易日历（首次使用时加载）
+    优先读本地缓存；缓存过期或不覆盖今天时通过 fetch 重新拉取；
+    都拿不到时退化为工作日日历（不含节假日）
+    """
+
+    def __init__(self, fetch: Optional[Callable[[], Optional[list]]] = None, cache_path: str = CACHE_PATH):
+        self._fetch = fetch
+        self.cache_path = cache_path
+        self._days: Optional[List[str]] = None
+        self._loaded_on: Optional[str] = None
+        self.fallback = False
+
+    # ---------- 加载 ----------
+
+    def _ensure(self) -> List[str]:
+        today = date.today().isoformat()
+        if self._days is not None and self._loaded_on == today:
+            return self._days
+        days = self._read_cache()
+        if days is None or days[-1] < today or self._cache_age_days() > CACHE_MAX_AGE_DAYS:
+            fetched = self._download()
+            if fetched:
+                days = fetched
+                self._write_cache(days)
+        if days:
+            self.fallback = False
+        else:
+            if not self.fallback:
+                print("   ⚠️ 无法获取交易日历，按工作日估算（不含节假日）")
+            self.fallback = True
+            days = _weekdays(date.today() - timedelta(days=365 * 30), date.today() + timedelta(days=366))
+        self._days, self._loaded_on = days, today
+        return days
+
+    def _cache_age_days(self) -> float:
+        try:
+            return (datetime.now().timestamp() - os.path.getmtime(self.cache_path)) / 86400
+        except OSError:
+            return float("inf")
+
+    def _read_cache(self) -> Optional[List[str]]:
+        """读本地缓存（过期的缓存也先读出来，重新拉取失败时继续用）"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                days = json.load(f)
+            return days or None
+        except (OSError, ValueError):
+            return None
+
+    def _download(self) -> Optional[List[str]]:
+        if self._fetch is None:
+            return None
+        rows = self._fetch()
+        if not rows:
+            return None
+        return sorted({str(row.get("trade_date", "")).split("T")[0] for row in rows} - {""})
+
+    def _write_cache(self, days: List[str]):
+        try:
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(days, f)
+        except OSError as e:
+            print(f"   ⚠️ 交易日历缓存写入失败: {e}")
+
+    def load(self, days: List[str]):
+        """直接指定交易日（测试或离线使用）"""
+        self._days = sorted(days)
+        self._loaded_on = date.today().isoformat()
+        self.fallback = False
+
+    # ---------- 查询 ----------
+
+    def is_trading_day(self, date_str: str) -> bool:
+        days = self._ensure()
+        i = bisect_left(days, date_str)
+        return i < len(days) and days[i] == date_str
+
+    def previous(self, date_str: str, inclusive: bool = True) -> Optional[str]:
+        """不晚于（inclusive=False 时早于）该日期的最近交易日"""
+        days = self._ensure()
+        i = (bisect_right(days, date_str) if inclusive else bisect_left(days, date_str)) - 1
+        return days[i] if i >= 0 else None
+
+    def next(self, date_str: str, inclusive: bool = False) -> Optional[str]:
+        """晚于（inclusive=True 时不早于）该日期的最近交易日"""
+        days = self._ensure()
+        i = bisect_left(days, date_str) if inclusive else bisect_right(days, date_str)
+        return days[i] if i < len(days) else None
+
+    def count_between(self, start: str, end: str) -> int:
+        """[start, end] 内的交易日数"""
+        days = self._ensure()
+        return max(0, bisect_right(days, end) - bisect_left(days, start))
+
+    def days_between(self, start: str, end: str) -> List[str]:
+        days = self._ensure()
+        return days[bisect_left(days, start):bisect_right(days, end)]
+
+    def day_index(self, date_str: str) -> int:
+        """
+        自 EPOCH 起的交易日序号（非交易日取之前最近的交易日）
+        只由日期决定，与取了多少历史无关；拿不到日历时按工作日计
+        """
+        days = self._ensure()
+        if self.fallback or days[0] > EPOCH:
+            return weekday_index(date_str)
+        return bisect_right(days, date_str) - bisect_left(days, EPOCH) - 1
+
+    def start_for(self, count: int, end: Optional[str] = None) -> str:
+        """截至 end（默认今天）共 count 个交易日时的第一个交易日"""
+        days = self._ensure()
+        end = end or date.today().isoformat()
+        i = bisect_right(days, end) - count
+        return days[max(0, i)]
+
+    def holidays(self, start: str, end: str) -> List[str]:
+        """区间内休市的工作日（可传给 numpy.busday_count 的 holidays）"""
+        trading = set(self.days_between(start, end))
+        return [d for d in _weekdays(date.fromisoformat(start), date.fromisoformat(end)) if d not in trading]
+
+
+def weekday_index(date_str: str) -> int:
+    """自 EPOCH 起的工作日序号（周末取之前的周五；不含节假日的近似交易日序号）"""
+    epoch = date.fromisoformat(EPOCH)
+    monday = epoch - timedelta(days=epoch.weekday())
+    weeks, rem = divmod((date.fromisoformat(str(date_str)[:10]) - monday).days, 7)
+    return weeks * 5 + min(rem, 4) - epoch.weekday()
+
+
+def _weekdays(start: date, end: date) -> List[str]:
+    days = []
+    d = start
+    while d <= end:
+        if d.weekday() < 5:
+            days.append(d.isoformat())
+        d += timedelta(days=1)
+    return days